@@ -1,4 +1,7 @@
 from django.contrib import admin
-from .models import Book
+from .models import Author, Book, Genre, Job
 
+admin.site.register(Author)
 admin.site.register(Book)
+admin.site.register(Genre)
+admin.site.register(Job)
@@ -0,0 +1,246 @@
+"""
+Async versions of BookCView and BookRUDView, mounted in place of the sync ones when BOOKS_ASYNC_VIEWS is on
+(the default under SERVER_MODE=asgi, see urls.py).
+
+Under asgi.py a sync view holds a worker thread for the whole request, including the time spent waiting on
+slow clients. These views run on the event loop instead and only leave it for the blocking parts: reads go
+through the async ORM (aget, async iteration), creates through acreate, and authentication, the response
+cache, validating a new book (with its author and genre lookups) and the locked If-Match + save of updates
+and deletes each take one sync_to_async hop.
+Django 4.2's async ORM still runs the query itself in a thread, so the win is in concurrency, not in the
+cost of a single query.
+
+Responses are identical to the sync views: same BookSerializer output, pagination, filters, ordering,
+response cache and coalescing, conditional request headers, and authentication and throttle classes. Only JSON is rendered.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from . import cache, coalescing
+from .conditional import (
+    book_validators, check_if_match, detail_validators, list_validators, not_modified, validator_headers,
+)
+from .models import Book
+from .renderers import FastJSONRenderer
+from .serializers import BookFastSerializer, BookSerializer, resolve_names
+from .views import (
+    BookCView, BooksCursorPagination, BooksPagination, batch_ids, batch_queryset, batch_result, list_cost,
+)
+
+
+class AsyncAPIView(View):
+    """
+    The parts of DRF's APIView the book views need, on an async dispatch(): request parsing, authentication,
+    permissions, throttling, exception handling and JSON rendering.
+    """
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+    permission_classes = [IsAuthenticated]
+    renderer = FastJSONRenderer()
+
+    @property
+    def authentication_classes(self):
+        return api_settings.DEFAULT_AUTHENTICATION_CLASSES
+
+    @property
+    def throttle_classes(self):
+        return api_settings.DEFAULT_THROTTLE_CLASSES
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True  # Token authenticated, like APIView
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args, self.kwargs = args, kwargs
+        request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[authenticator() for authenticator in self.authentication_classes],
+        )
+        self.request = request
+        try:
+            await sync_to_async(self.initial)(request)
+            handler = getattr(self, request.method.lower(), None)
+            if request.method.lower() not in self.http_method_names or handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(request, exc)
+        return self.finalize_response(request, response)
+
+    def initial(self, request):
+        # Authentication may query the user table, so this runs off the event loop
+        request.user
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if request.authenticators and not request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+        throttles = [throttle() for throttle in self.throttle_classes]
+        waits = [throttle.wait() for throttle in throttles if not throttle.allow_request(request, self)]
+        if waits:
+            raise exceptions.Throttled(max(waits))
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            authenticators = request.authenticators
+            if authenticators and authenticators[0].authenticate_header(request):
+                exc.auth_header = authenticators[0].authenticate_header(request)
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+        response = exception_handler(exc, {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': request})
+        if response is None:
+            raise exc
+        response.exception = True
+        return response
+
+    def finalize_response(self, request, response):
+        if not isinstance(response, Response):
+            return response
+        # Rendered here rather than by the handler, which would spend a thread hop on it
+        response.accepted_renderer = self.renderer
+        response.accepted_media_type = self.renderer.media_type
+        response.renderer_context = {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': request}
+        response['Allow'] = ', '.join(self._allowed_methods())
+        patch_vary_headers(response, ('Accept',))
+        response.render()
+        rendered = HttpResponse(response.content, status=response.status_code, headers=dict(response.items()))
+        rendered.data = response.data  # Like a DRF Response, for callers that inspect the data
+        return rendered
+
+    async def conditional_get(self, request, build, get_validators, *args):
+        # ConditionalGetMixin + CachedResponseMixin: validators and the cache lookup share one thread hop
+        etag, last_modified, key, data = await sync_to_async(self.lookup)(request, get_validators, *args)
+        if not_modified(request, etag, last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, last_modified))
+
+        if data is not None:
+            response = Response(data)
+        elif key is None:
+            response = await build(request, *args)
+        else:
+            response, shared = await coalescing.arun(key, lambda: build(request, *args))
+            if shared:
+                response = Response(response.data, status=response.status_code)
+            elif cache.get_timeout() and response.status_code == status.HTTP_200_OK:
+                await cache.get_cache().aset(key, response.data, cache.get_timeout())
+        if response.status_code == status.HTTP_200_OK:
+            for name, value in validator_headers(etag, last_modified).items():
+                response[name] = value
+        return response
+
+    def lookup(self, request, get_validators, *args):
+        etag, last_modified = get_validators(*args)
+        if not_modified(request, etag, last_modified):
+            return etag, last_modified, None, None
+        if not cache.get_timeout():
+            # Uncached responses are still coalesced under their cache key
+            return etag, last_modified, cache.response_key(request) if cache.coalesces() else None, None
+        key = cache.response_key(request)
+        if cache.is_pinned():
+            return etag, last_modified, key, None
+        data = cache.get_cache().get(key)
+        cache.count(cache.MISSES_KEY if data is None else cache.HITS_KEY)
+        return etag, last_modified, key, data
+
+
+# Async Book list and create view, see BookCView
+class AsyncBookCView(AsyncAPIView):
+    filter_backends = BookCView.filter_backends
+    ordering_fields = BookCView.ordering_fields
+    throttle_cost = staticmethod(list_cost)
+
+    async def get(self, request, *args, **kwargs):
+        return await self.conditional_get(request, self.list, list_validators, request)
+
+    async def list(self, request, *args):
+        if 'ids' in request.query_params:
+            ids = batch_ids({'ids': request.query_params['ids'].split(',')})
+            return Response(batch_result(ids, [row async for row in batch_queryset(ids)]))
+        queryset = Book.objects.all()
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        queryset = queryset.values_list(*BookFastSerializer.columns, named=True)
+        if BooksCursorPagination.cursor_query_param in request.query_params:
+            paginator = BooksCursorPagination()
+        else:
+            paginator = BooksPagination()
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(BookFastSerializer(page, many=True).data)
+
+    async def post(self, request, *args, **kwargs):
+        book = await Book.objects.acreate(**await sync_to_async(self.validate)(request.data))
+        return Response(BookSerializer(book).data, status=status.HTTP_201_CREATED)
+
+
+    def validate(self, data):
+        # Validation and the Author/Genre lookups for the names, in one thread hop
+        serializer = BookSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return resolve_names([serializer.validated_data])[0]
+
+
+# Async Book read, update and delete view, see BookRUDView
+class AsyncBookRUDView(AsyncAPIView):
+    async def get(self, request, pk, *args, **kwargs):
+        if cache.get_timeout():
+            return await self.conditional_get(request, self.retrieve, detail_validators, pk)
+        # Nothing memoized: one query for the validators and the response, as in ConditionalDetailMixin
+        book = await self.fetch(pk)
+
+        async def build(request, pk):
+            return Response(BookSerializer(book).data)
+        return await self.conditional_get(request, build, lambda pk: book_validators(book), pk)
+
+    async def retrieve(self, request, pk):
+        return Response(BookSerializer(await self.fetch(pk)).data)
+
+    async def fetch(self, pk):
+        try:
+            return await Book.objects.select_related('author', 'genre').aget(pk=pk)
+        except Book.DoesNotExist:
+            raise exceptions.NotFound()
+
+    async def put(self, request, pk, *args, **kwargs):
+        book, data = await sync_to_async(self.perform_update)(request, pk, partial=False)
+        return Response(data, headers={'ETag': book.etag})
+
+    async def patch(self, request, pk, *args, **kwargs):
+        book, data = await sync_to_async(self.perform_update)(request, pk, partial=True)
+        return Response(data, headers={'ETag': book.etag})
+
+    async def delete(self, request, pk, *args, **kwargs):
+        await sync_to_async(self.perform_destroy)(request, pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # Writes lock the row for the If-Match check and the save. Django has no async transactions yet, so
+    # each write runs as one sync block.
+
+    def get_locked_book(self, request, pk):
+        book = Book.objects.select_related('author', 'genre').select_for_update(of=('self',)).filter(pk=pk).first()
+        if book is None:
+            raise exceptions.NotFound()
+        check_if_match(request, book)
+        return book
+
+    def perform_update(self, request, pk, partial):
+        with transaction.atomic():
+            serializer = BookSerializer(self.get_locked_book(request, pk), data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return serializer.instance, serializer.data
+
+    def perform_destroy(self, request, pk):
+        with transaction.atomic():
+            self.get_locked_book(request, pk).delete()
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from . import cache
+
+
+def active_status_key(user_id):
+    return 'auth:active:%s' % user_id
+
+
+def user_is_active(user_id):
+    """
+    Whether the user behind a token still exists and is active. The answer is cached for
+    BOOKS_AUTH_ACTIVE_TTL seconds (default 60; 0 checks the database every time, None skips the check).
+    """
+    ttl = getattr(settings, 'BOOKS_AUTH_ACTIVE_TTL', 60)
+    if ttl is None:
+        return True
+    active = cache.get_cache().get(active_status_key(user_id)) if ttl else None
+    if active is None:
+        active = bool(get_user_model().objects.filter(
+            **{api_settings.USER_ID_FIELD: user_id}
+        ).values_list('is_active', flat=True).first())
+        if ttl:
+            cache.get_cache().set(active_status_key(user_id), active, ttl)
+    return active
+
+
+def forget_active_status(user_id):
+    cache.get_cache().delete(active_status_key(user_id))
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication that skips the per-request auth_user SELECT on safe (read) methods.
+
+    Reads get a TokenUser built from the verified token claims, backed by the cached active-status check
+    above; that is all IsAuthenticated needs. Unsafe methods still load the full user through
+    JWTAuthentication, so writes see a real User and the checks that come with it. Enable it with
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].
+    """
+
+    def authenticate(self, request):
+        self.request = request
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if self.request.method not in SAFE_METHODS:
+            return JWTAuthentication.get_user(self, validated_token)
+
+        user = super().get_user(validated_token)
+        if not user_is_active(user.id):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
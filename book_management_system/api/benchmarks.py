@@ -0,0 +1,118 @@
+"""
+Helpers shared by the benchmark_* management commands.
+
+Benchmarks run against a throwaway, freshly migrated copy of the database (the same one the test runner
+would create), so they never touch real data and always start from a known state.
+"""
+import math
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .models import Author, Book, Genre
+
+
+@contextmanager
+def scratch_database(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def make_books(count, using=DEFAULT_DB_ALIAS, authors=50):
+    # Unsaved books spread over `authors` authors and one genre, ready for bulk_create()
+    author_rows = Author.objects.using(using).resolve('Author %d' % i for i in range(authors))
+    genre = Genre.objects.using(using).resolve(['Test'])['Test']
+    return [
+        Book(title='Book %d' % i, author=author_rows['Author %d' % (i % authors)], publicationYear=2000, genre=genre)
+        for i in range(count)
+    ]
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(timings, queries=None):
+    ordered = sorted(timings)
+    total = sum(ordered)
+    summary = {
+        'iterations': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'ops_per_sec': len(ordered) / total if total else 0.0,
+    }
+    if queries is not None:
+        summary['queries_per_op'] = queries / len(ordered)
+    return summary
+
+
+def measure(operation, iterations, warmup=10, using=DEFAULT_DB_ALIAS):
+    """
+    Times operation() iterations times after warmup untimed calls and returns a summary with latency
+    percentiles, throughput and the number of queries one call makes. Queries are counted on a separate
+    call so that recording them does not slow down the timed ones. They are counted with an execute wrapper
+    rather than connection.queries, which every request through the test client resets.
+    """
+    for _ in range(warmup):
+        operation()
+    queries = []
+    with connections[using].execute_wrapper(lambda execute, *args: queries.append(args[0]) or execute(*args)):
+        operation()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings, len(queries) * len(timings))
+
+
+def format_summary(name, summary):
+    line = '%-44s p50 %8.3f ms  p99 %8.3f ms  %10.0f ops/s' % (
+        name, summary['p50_ms'], summary['p99_ms'], summary['ops_per_sec'],
+    )
+    if 'queries_per_op' in summary:
+        line += '  %5.2f queries/op' % summary['queries_per_op']
+    return line
+
+
+# Metrics compare() checks, and whether a higher value is better
+COMPARED_METRICS = {'p50_ms': False, 'p99_ms': False, 'ops_per_sec': True, 'queries_per_op': False}
+
+
+def compare(baseline, results, threshold, metrics=COMPARED_METRICS):
+    """
+    Compares two {group: {case: summary}} result sets and returns the regressions, as a list of
+    (group, case, metric, baseline value, new value): every metric that got worse by more than threshold
+    (a fraction, 0.2 for 20%). Query counts are deterministic, so any increase in them is a regression.
+    Cases missing from either side are skipped.
+    """
+    regressions = []
+    for group, cases in results.items():
+        for case, summary in cases.items():
+            before = baseline.get(group, {}).get(case)
+            if before is None:
+                continue
+            for metric, higher_is_better in metrics.items():
+                if metric not in before or metric not in summary:
+                    continue
+                old, new = before[metric], summary[metric]
+                if metric == 'queries_per_op':
+                    worse = new > old
+                elif higher_is_better:
+                    worse = new < old * (1 - threshold)
+                else:
+                    worse = new > old * (1 + threshold)
+                if worse:
+                    regressions.append((group, case, metric, old, new))
+    return regressions
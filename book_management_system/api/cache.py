@@ -0,0 +1,189 @@
+"""
+Response cache for the book list and detail endpoints.
+
+Cached pages are keyed on a generation number plus the normalized request URL. Every Book write bumps the
+generation (see signals.py), which orphans all previously cached pages at once instead of hunting them down
+key by key; orphans simply age out of the cache. The generation is bumped both when the write happens and
+again when its transaction commits, so a page read between the two (showing pre-commit data) is orphaned too.
+
+Settings:
+
+- ``BOOKS_CACHE_ALIAS``: which entry of ``CACHES`` to use (default ``'default'``)
+- ``BOOKS_CACHE_TIMEOUT``: seconds a page stays cached (default 300, 0 disables the cache)
+- ``BOOKS_CACHE_SHARED``: whether every process serving the API or writing books uses the same cache (default
+  True; settings.py turns it off for the memory cache). When False, a write through one process could not
+  invalidate another's pages, so nothing is cached and no list validators are derived from the generation;
+  reads always hit the database.
+
+Requests that read from a replica (see routers.py) may see data older than the current generation, so their
+responses, memoized values and list validators are neither cached nor coalesced. Clients pinned to the
+primary after a write skip the lookups and always read their write back from the database.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+from . import coalescing, routers
+
+
+GENERATION_KEY = 'books:generation'
+LAST_MODIFIED_KEY = 'books:last_modified'
+HITS_KEY = 'books:cache:hits'
+MISSES_KEY = 'books:cache:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'BOOKS_CACHE_ALIAS', 'default')]
+
+
+def is_shared():
+    return getattr(settings, 'BOOKS_CACHE_SHARED', True)
+
+
+def is_process_local():
+    # An in-memory cache: invalidate() from this process never reaches the pages other processes cached
+    return isinstance(get_cache(), LocMemCache)
+
+
+def is_unreachable():
+    # For processes that write books outside the web server (management commands, run_worker): its cached
+    # responses are in use, but in a cache this process cannot invalidate
+    return is_shared() and is_process_local()
+
+
+UNREACHABLE_MESSAGE = (
+    'BOOKS_CACHE_SHARED is on with the in-memory cache, so the web server keeps serving the responses it cached '
+    'before these writes until they expire. Set REDIS_URL or DJANGO_CACHE_DIR to share the cache between processes.'
+)
+
+
+def reads_replica():
+    return routers.read_alias.get() is not None
+
+
+def is_pinned():
+    return routers.pinned.get()
+
+
+def coalesces():
+    return coalescing.enabled() and not reads_replica()
+
+
+def get_timeout():
+    return getattr(settings, 'BOOKS_CACHE_TIMEOUT', 300) if is_shared() and not reads_replica() else 0
+
+
+def new_generation():
+    # Time based, so a generation lost to eviction or a restart never comes back with a value
+    # that older cached pages were stored under
+    return time.time_ns() // 1000
+
+
+def get_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, new_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:  # Not set yet, or evicted
+        cache.add(GENERATION_KEY, new_generation(), timeout=None)
+    cache.set(LAST_MODIFIED_KEY, time.time(), timeout=None)
+
+
+def get_last_modified():
+    # Unix time of the last Book write, or None if no write was seen since the cache was emptied (or by this
+    # process, when the cache is not shared)
+    return get_cache().get(LAST_MODIFIED_KEY) if is_shared() else None
+
+
+def invalidate(using=None):
+    bump_generation()
+    transaction.on_commit(bump_generation, using=using)
+
+
+def response_key(request):
+    # Query parameters are sorted so ?a=1&b=2 and ?b=2&a=1 share an entry. The host is part of the
+    # key because pagination links in the cached data are absolute URLs.
+    query = urlencode(sorted((key, value) for key, values in request.query_params.lists() for value in values))
+    url = '%s%s?%s' % (request.get_host(), request.path, query)
+    return 'books:%s:%s' % (get_generation(), hashlib.sha1(url.encode()).hexdigest())
+
+
+def memoize(name, compute, timeout=None):
+    # Caches compute() under the current generation, so the next Book write drops it along with the pages.
+    # timeout defaults to BOOKS_CACHE_TIMEOUT.
+    timeout = get_timeout() if timeout is None else timeout
+    if not timeout or not is_shared() or reads_replica():
+        return compute()
+    key = 'books:%s:%s' % (get_generation(), name)
+    cached = None if is_pinned() else get_cache().get(key)
+    if cached is None:
+        result, shared = coalescing.run(key, compute)
+        cached = (result,)  # Wrapped so a None result is cached too
+        if not shared:
+            get_cache().set(key, cached, timeout)
+    return cached[0]
+
+
+def count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    cache = get_cache()
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+class CachedResponseMixin:
+    """
+    Serves GET requests from the response cache. Only the response data is cached, so authentication,
+    permissions and content negotiation still run on every request; a hit skips the database and the
+    serializer. Only 200 responses are stored. Concurrent misses for the same key are coalesced (see
+    coalescing.py), also when the cache is off, but not replica reads.
+    """
+
+    def get(self, request, *args, **kwargs):
+        timeout = get_timeout()
+        if not timeout and not coalesces():
+            return super().get(request, *args, **kwargs)
+
+        key = response_key(request)
+        if timeout and not is_pinned():
+            data = get_cache().get(key)
+            if data is not None:
+                count(HITS_KEY)
+                return Response(data)
+            count(MISSES_KEY)
+
+        compute = super().get
+        response, shared = coalescing.run(key, lambda: compute(request, *args, **kwargs))
+        if shared:
+            # Requests that waited for an identical one answer with its data, rendered for themselves
+            return Response(response.data, status=response.status_code)
+        if timeout and response.status_code == 200:
+            get_cache().set(key, response.data, timeout)
+        return response
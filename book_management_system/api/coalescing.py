@@ -0,0 +1,91 @@
+"""
+Single-flight coalescing of identical reads. While one request computes the response for a key, other
+requests for the same key wait for it and share its result instead of repeating the queries and the
+serialization. It catches the burst that arrives before the response cache is filled, or every request
+when the cache is off.
+
+Keys are response cache keys (see cache.py), which carry the cache generation, so a request made after a
+Book write never shares a result computed before it. Requests are coalesced within one worker process:
+threads through run(), coroutines on the same event loop through arun(). Separate workers still compute
+a key once each at most. An error in the shared computation is raised in every waiting request too.
+
+BOOKS_COALESCE_READS turns it off.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+
+
+_lock = threading.Lock()
+_flights = {}  # Key -> Flight, for threads
+_futures = {}  # (event loop, key) -> Future, for coroutines
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def enabled():
+    return getattr(settings, 'BOOKS_COALESCE_READS', True)
+
+
+def run(key, compute):
+    """
+    compute(), or the result of the same call already running in another thread. Returns
+    (result, shared), where shared is True for the waiting callers.
+    """
+    if not enabled():
+        return compute(), False
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, True
+    try:
+        flight.result = compute()
+    except Exception as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result, False
+
+
+async def arun(key, compute):
+    """
+    Like run() for coroutines: awaits compute(), a coroutine function, or the call already running on
+    this event loop.
+    """
+    if not enabled():
+        return await compute(), False
+    flight = (asyncio.get_running_loop(), key)
+    with _lock:
+        future = _futures.get(flight)
+        leader = future is None
+        if leader:
+            future = _futures[flight] = flight[0].create_future()
+    if not leader:
+        return await asyncio.shield(future), True
+    try:
+        result = await compute()
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()  # Retrieved, so a flight without waiters logs no "never retrieved" warning
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        with _lock:
+            del _futures[flight]
+    return result, False
@@ -0,0 +1,149 @@
+"""
+Conditional requests (ETag / Last-Modified) for the book list and detail endpoints.
+
+Validators are computed without serializing anything:
+
+- Detail: the strong ETag is the book's id and version, and Last-Modified is its updated_at. Both come
+  from one primary key lookup, memoized in the response cache until the next Book write. When nothing is
+  memoized (the cache is off, or the request reads from a replica), they are read from the book the response
+  is built from, so a detail GET stays one query and its validators always match its data.
+- List: the ETag is derived from the response cache generation and the normalized query string, and
+  Last-Modified is the time of the last Book write. Neither needs a database query (see cache.py). Lists
+  have no validators when the cache is not shared between processes (BOOKS_CACHE_SHARED), since another
+  process's writes would not change them, or when the request reads from a replica, whose data may be older
+  than the generation.
+
+GET/HEAD answer If-None-Match (or If-Modified-Since, when no If-None-Match is sent) with 304. On the
+detail endpoint, PUT, PATCH and DELETE honour If-Match and answer 412 when the book has moved on.
+"""
+import hashlib
+import math
+
+from django.db import transaction
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from . import cache
+from .models import Book
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The book has been modified since it was fetched.'
+    default_code = 'precondition_failed'
+
+
+def etag_matches(etag, header):
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def check_if_match(request, book):
+    if_match = request.META.get('HTTP_IF_MATCH')
+    if if_match is not None and not etag_matches(book.etag, if_match):
+        raise PreconditionFailed()
+
+
+def not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag is not None and etag_matches(etag, if_none_match)
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified is not None and int(last_modified) <= if_modified_since
+
+
+def validator_headers(etag, last_modified):
+    headers = {}
+    if etag is not None:
+        headers['ETag'] = etag
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(math.floor(last_modified))
+    return headers
+
+
+def list_validators(request):
+    if not cache.is_shared() or cache.reads_replica():
+        return None, None
+    etag = '"%s"' % hashlib.sha1(cache.response_key(request).encode()).hexdigest()
+    return etag, cache.get_last_modified()
+
+
+def detail_validators(pk):
+    row = cache.memoize('validators:%d' % pk, lambda: (
+        Book.objects.filter(pk=pk).values_list('id', 'version', 'updated_at').order_by().first()
+    ))
+    if row is None:
+        return None, None  # Let the view answer 404
+    pk, version, updated_at = row
+    return Book(id=pk, version=version).etag, updated_at.timestamp()
+
+
+def book_validators(book):
+    return book.etag, book.updated_at.timestamp()
+
+
+class ConditionalGetMixin:
+    def get_validators(self, request, *args, **kwargs):
+        # Returns (etag, last_modified as a Unix timestamp); either may be None
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        if not_modified(request, etag, last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, last_modified))
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            for name, value in validator_headers(etag, last_modified).items():
+                response[name] = value
+        return response
+
+
+class ConditionalListMixin(ConditionalGetMixin):
+    def get_validators(self, request, *args, **kwargs):
+        return list_validators(request)
+
+
+class ConditionalDetailMixin(ConditionalGetMixin):
+    fetched_object = None
+
+    def get_validators(self, request, *args, **kwargs):
+        if cache.get_timeout():
+            return detail_validators(kwargs['pk'])
+        # Nothing memoized: fetch the book once, for the validators and, unless it is a 304, the response
+        self.fetched_object = self.get_object()
+        return book_validators(self.fetched_object)
+
+    def check_preconditions(self, instance):
+        check_if_match(self.request, instance)
+
+    def get_queryset(self):
+        # Writes lock the row so the If-Match check and the save cannot interleave with another writer
+        queryset = super().get_queryset()
+        if self.request.method in ('PUT', 'PATCH', 'DELETE'):
+            queryset = queryset.select_for_update(of=('self',))  # Not the author and genre rows joined in
+        return queryset
+
+    def get_object(self):
+        if self.fetched_object is not None:
+            return self.fetched_object
+        instance = super().get_object()
+        if self.request.method in ('PUT', 'PATCH', 'DELETE'):
+            self.check_preconditions(instance)
+        return instance
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            response = super().update(request, *args, **kwargs)
+        response['ETag'] = self.updated_instance.etag
+        return response
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.updated_instance = serializer.instance
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().destroy(request, *args, **kwargs)
@@ -0,0 +1,78 @@
+"""
+Row counts for the book list's `count` field, which otherwise costs a SELECT COUNT(*) over every matching
+row on each page.
+
+- exact(): the real count, cached under the response cache generation (see cache.py), so any Book write
+  drops it. BOOKS_COUNT_CACHE_TIMEOUT sets how long it is kept (default 300 seconds, 0 counts every time).
+- estimate(): the planner's estimate, read from backend statistics instead of scanning the table.
+  PostgreSQL: pg_class.reltuples for the whole table, EXPLAIN's row estimate for a filtered list. SQLite:
+  the row count ANALYZE stores in sqlite_stat1, for the whole table only. Where there are no statistics,
+  or the estimate is below BOOKS_COUNT_ESTIMATE_THRESHOLD rows (default 1000, where an exact count is
+  cheap anyway), it falls back to exact().
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import DatabaseError, connections
+from django.db.models import QuerySet
+
+from . import cache
+
+
+def exact(queryset):
+    if not isinstance(queryset, QuerySet):
+        return queryset.count()  # search.SearchResults, which keeps its own count
+    queryset = queryset.order_by()
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = hashlib.sha1(repr((queryset.db, sql, params)).encode()).hexdigest()
+    return cache.memoize('count:%s' % key, queryset.count, getattr(settings, 'BOOKS_COUNT_CACHE_TIMEOUT', 300))
+
+
+def table_estimate(queryset):
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone() is None:
+                return None  # ANALYZE has never run
+            # stat is "<rows> <rows per distinct key prefix>..." for an index, or just "<rows>"
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    rows = int(str(row[0]).split()[0])
+    return rows if rows >= 0 else None  # PostgreSQL reports -1 for a table that was never analyzed
+
+
+def filtered_estimate(queryset):
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate(queryset):
+    """
+    Returns (count, is_estimate).
+    """
+    if not isinstance(queryset, QuerySet):
+        return exact(queryset), False
+    try:
+        rows = filtered_estimate(queryset) if queryset.query.where else table_estimate(queryset)
+    except (DatabaseError, EmptyResultSet, KeyError, ValueError):
+        rows = None
+    if rows is None or rows < getattr(settings, 'BOOKS_COUNT_ESTIMATE_THRESHOLD', 1000):
+        return exact(queryset), False
+    return rows, True
@@ -0,0 +1,32 @@
+"""
+Django's SQLite backend plus the two OPTIONS that Django 5.1 adds to it, so the tuning in settings.py works
+on Django 4.2 today and carries over unchanged when ENGINE goes back to django.db.backends.sqlite3:
+
+- ``init_command``: semicolon separated statements run on every new connection (the PRAGMAs)
+- ``transaction_mode``: ``'IMMEDIATE'`` makes transaction.atomic() take the write lock up front. With the
+  default deferred mode, a transaction that reads and then writes while another connection is writing
+  fails at once with "database is locked" instead of waiting out the busy timeout.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('init_command', None)  # Not sqlite3.connect() arguments
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        init_command = self.settings_dict['OPTIONS'].get('init_command', '')
+        for statement in filter(None, (statement.strip() for statement in init_command.split(';'))):
+            connection.execute(statement)
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if transaction_mode:
+            self.cursor().execute('BEGIN %s' % transaction_mode)
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,52 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import fold
+
+
+# Highest code point, used as the exclusive upper bound of a prefix range
+PREFIX_RANGE_END = '\U0010ffff'
+
+
+class BookFilterBackend(BaseFilterBackend):
+    """
+    Server-side filtering for the book list. Every filter maps onto one of the Book.Meta.indexes:
+
+    - ``author`` / ``genre``: exact name match, looked up through the unique Author/Genre name and then the
+      id (book_author_title_idx, book_genre_year_idx)
+    - ``year_min`` / ``year_max``: inclusive publicationYear range (book_genre_year_idx, book_year_idx)
+    - ``search``: case-insensitive title prefix, on the casefolded copy of the title (book_title_folded_idx)
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        return self.filter_params(queryset, request.query_params)
+
+    def filter_params(self, queryset, params):
+        # For callers without a request, such as export jobs (see jobs.py)
+        if 'author' in params:
+            queryset = queryset.filter(author__name=params['author'])
+        if 'genre' in params:
+            queryset = queryset.filter(genre__name=params['genre'])
+
+        year_min = self.get_year(params, 'year_min')
+        year_max = self.get_year(params, 'year_max')
+        if year_min is not None:
+            queryset = queryset.filter(publicationYear__gte=year_min)
+        if year_max is not None:
+            queryset = queryset.filter(publicationYear__lte=year_max)
+
+        prefix = fold(params.get(self.search_param, ''))
+        if prefix:
+            # A range instead of LIKE, so the index can be used on every backend
+            queryset = queryset.filter(title_folded__gte=prefix, title_folded__lt=prefix + PREFIX_RANGE_END)
+        return queryset
+
+    def get_year(self, params, name):
+        value = params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: 'A valid integer is required.'})
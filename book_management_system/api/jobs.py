@@ -0,0 +1,219 @@
+"""
+Background jobs for the operations too slow for a request: book imports and exports, and rebuilding the
+search index, the book stats or the change log.
+
+Jobs are rows of the Job table, so there is no broker to run: POST /api/jobs/ queues one and returns its
+id, GET /api/jobs/<id>/ reports its status and progress, and `manage.py run_worker` runs them. The worker
+claims the oldest queued job with a conditional UPDATE (status queued -> running), so several workers can
+share the table without running a job twice, and hands it to a pool of --processes processes.
+
+Import uploads and export results are files in BOOKS_JOB_DIR. An import's upload is deleted once it is
+imported; export files stay until they are removed by hand.
+
+A job whose worker stopped while running it is marked failed when a worker starts on the same host. Jobs are
+not retried: an import that failed halfway has committed the chunks before the failure.
+"""
+import logging
+import os
+import socket
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import cache, changes, search, stats
+from .filters import BookFilterBackend
+from .management.commands import import_books as import_books_command
+from .models import Book, Job
+from .renderers import CSVRenderer, NDJSONRenderer
+from .serializers import BookFastSerializer
+
+
+logger = logging.getLogger('api.jobs')
+
+EXPORT_RENDERERS = {'ndjson': NDJSONRenderer, 'csv': CSVRenderer}
+EXPORT_CHUNK_SIZE = 2000  # Rows per database round-trip, and how often an export reports its progress
+MAX_REPORTED_ERRORS = 100
+
+
+def job_dir():
+    directory = str(getattr(settings, 'BOOKS_JOB_DIR'))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def job_path(name):
+    return os.path.join(job_dir(), name)
+
+
+def report(job, processed, total=None):
+    # Progress, as seen by GET /api/jobs/<id>/
+    fields = {'processed': processed} if total is None else {'processed': processed, 'total': total}
+    Job.objects.filter(pk=job.pk).update(**fields)
+
+
+def enqueue(kind, params=None, user_id=None, upload=None):
+    """
+    Queues a job. An upload (an import's input file) is stored in BOOKS_JOB_DIR under a name only this job
+    uses; the job row and the file become visible to workers together.
+    """
+    with transaction.atomic():
+        job = Job.objects.create(kind=kind, params=params or {}, created_by_id=user_id)
+        if upload is not None:
+            extension = os.path.splitext(upload.name)[1].lower()
+            job.params = {**job.params, 'file': 'import-%d%s' % (job.pk, extension)}
+            with open(job_path(job.params['file']), 'wb') as f:
+                for chunk in upload.chunks():
+                    f.write(chunk)
+            job.save(update_fields=['params'])
+    return job
+
+
+def worker_name():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def claim(worker):
+    """
+    Marks the oldest queued job as running on `worker` and returns its id, or None if the queue is empty.
+    """
+    queued = Job.objects.filter(status=Job.QUEUED)
+    while True:
+        job_id = queued.order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        # Only one worker's UPDATE finds the job still queued; the others move on to the next one
+        if queued.filter(pk=job_id).update(status=Job.RUNNING, worker=worker, started_at=timezone.now()):
+            return job_id
+
+
+def finish(job_id, status, result=None, error=''):
+    Job.objects.filter(pk=job_id).update(status=status, result=result, error=error, finished_at=timezone.now())
+
+
+def fail_orphans():
+    """
+    Fails the running jobs of workers on this host whose process is gone. Returns how many.
+    """
+    host = socket.gethostname()
+    orphans = []
+    for job_id, worker in Job.objects.filter(status=Job.RUNNING, worker__startswith=host + ':').values_list('id', 'worker'):
+        try:
+            os.kill(int(worker.rsplit(':', 1)[1]), 0)
+        except ProcessLookupError:
+            orphans.append(job_id)
+        except (PermissionError, ValueError):
+            pass  # Alive under another user, or not a pid
+    Job.objects.filter(pk__in=orphans, status=Job.RUNNING).update(
+        status=Job.FAILED, error='The worker stopped before the job finished.', finished_at=timezone.now(),
+    )
+    return len(orphans)
+
+
+def execute(job_id):
+    """
+    Runs a claimed job to completion and records the outcome. Returns the final status.
+    """
+    close_old_connections()  # As at the start of a request: drops connections past CONN_MAX_AGE
+    try:
+        job = Job.objects.get(pk=job_id)
+        try:
+            result = HANDLERS[job.kind](job)
+        except Exception as exc:
+            logger.exception('Job %d (%s) failed', job.pk, job.kind)
+            finish(job.pk, Job.FAILED, error='%s: %s' % (type(exc).__name__, exc))
+            return Job.FAILED
+        finish(job.pk, Job.SUCCEEDED, result=result)
+        return Job.SUCCEEDED
+    finally:
+        close_old_connections()
+
+
+# Handlers: each takes its Job, reports progress as it goes and returns the job's result
+
+class ImportCommand(import_books_command.Command):
+    # import_books, reporting its progress to the job after every chunk
+    def __init__(self, job, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.job = job
+        self.counts = (0, 0)
+
+    def progress(self, imported, skipped, offset, started):
+        super().progress(imported, skipped, offset, started)
+        self.counts = (imported, skipped)
+        report(self.job, offset)
+
+
+def import_books(job):
+    path = job_path(job.params['file'])
+    errors = StringIO()
+    command = ImportCommand(job, stdout=StringIO(), stderr=errors)
+    args = [path, '--chunk-size', str(job.params.get('chunk_size', 5000))]
+    if job.params.get('format'):
+        args += ['--format', job.params['format']]
+    call_command(command, *args)
+    os.remove(path)
+    imported, skipped = command.counts
+    return {'imported': imported, 'skipped': skipped, 'errors': errors.getvalue().splitlines()[:MAX_REPORTED_ERRORS]}
+
+
+def export_books(job):
+    params = dict(job.params)
+    renderer = EXPORT_RENDERERS[params.pop('format', 'ndjson')]()
+    books = BookFilterBackend().filter_params(Book.objects.all(), params)
+    report(job, 0, books.count())
+    exported = [0]
+
+    def rows():
+        # One query per chunk, seeking past the last id, rather than one long-running cursor: a read left open
+        # across the progress UPDATEs would make SQLite refuse them while another process writes
+        last_id = 0
+        while True:
+            chunk = list(books.filter(id__gt=last_id).order_by('id').values_list(*BookFastSerializer.columns)[
+                :EXPORT_CHUNK_SIZE
+            ])
+            if not chunk:
+                return
+            yield from chunk
+            last_id = chunk[-1][0]
+            exported[0] += len(chunk)
+            report(job, exported[0])
+
+    name = 'export-%d.%s' % (job.pk, renderer.format)
+    try:
+        with open(job_path(name + '.part'), 'wb') as f:
+            for chunk in renderer.stream(BookFastSerializer.field_names, rows()):
+                f.write(chunk)
+        os.replace(job_path(name + '.part'), job_path(name))  # Only complete files carry the final name
+    except BaseException:
+        if os.path.exists(job_path(name + '.part')):
+            os.remove(job_path(name + '.part'))
+        raise
+    return {'file': name, 'rows': exported[0]}
+
+
+def rebuild_search_index(job):
+    with transaction.atomic():
+        return {'indexed': search.rebuild_index()}
+
+
+def rebuild_book_stats(job):
+    with transaction.atomic():
+        groups = stats.rebuild()
+    cache.invalidate()  # Drops the memoized /api/books/stats/ response
+    return {'groups': groups}
+
+
+def compact_book_changes(job):
+    return {'deleted': changes.compact()}
+
+
+HANDLERS = {
+    Job.IMPORT_BOOKS: import_books,
+    Job.EXPORT_BOOKS: export_books,
+    Job.REBUILD_SEARCH_INDEX: rebuild_search_index,
+    Job.REBUILD_BOOK_STATS: rebuild_book_stats,
+    Job.COMPACT_BOOK_CHANGES: compact_book_changes,
+}
@@ -0,0 +1,173 @@
+import json
+import platform
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import benchmarks
+from api.models import Author, Book, Genre
+from api.serializers import BookFastSerializer
+from api.views import BooksCursorPagination, BooksPagination
+
+
+GENRES = ['Fiction', 'Fantasy', 'Science', 'History', 'Poetry', 'Mystery', 'Biography', 'Drama']
+SEED_BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the book API through its real URL routes and middleware on a scratch database seeded '
+        'with --sizes books: list (page number at several depths, and cursor), detail, batch get, create, '
+        'update, delete and token. Reports p50/p99 latency, single-client throughput and queries per request, '
+        'optionally writes them to --output as JSON, and with --baseline fails when a metric regressed by '
+        'more than --threshold.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated table sizes.')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per endpoint.')
+        parser.add_argument('--token-iterations', type=int, default=10,
+                            help='Timed token requests; these are dominated by password hashing.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='Compare with the results in this JSON file.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed slowdown as a fraction (0.2 = 20%%) before a metric counts as a regression.')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers.')
+        if not sizes or sizes[0] < 1:
+            raise CommandError('--sizes must be positive.')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['results']
+
+        results = {}
+        # The response cache would answer every repeated read without reaching the database, and the rate
+        # limits would turn the repeated requests into 429s. The memoized counts stay on, as in a deployment with
+        # a shared cache: this one process is the only reader and writer.
+        with benchmarks.scratch_database(), override_settings(
+            BOOKS_CACHE_TIMEOUT=0, BOOKS_CACHE_SHARED=True, BOOKS_THROTTLE_RATES={},
+        ):
+            user = User.objects.create_user(username='benchmark', password='benchmark')
+            client = Client(HTTP_AUTHORIZATION='Bearer %s' % AccessToken.for_user(user))
+            for size in sizes:
+                self.seed(size)  # Sizes are seeded cumulatively, smallest first
+                self.stdout.write('%d books' % size)
+                results[str(size)] = cases = {}
+                for name, operation, iterations in self.cases(client, size, options):
+                    cases[name] = benchmarks.measure(operation, iterations)
+                    self.stdout.write(benchmarks.format_summary(name, cases[name]))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'meta': self.meta(sizes, options), 'results': results}, f, indent=2)
+            self.stdout.write('Results written to %s' % options['output'])
+        if baseline is not None:
+            regressions = benchmarks.compare(baseline, results, options['threshold'])
+            for size, name, metric, old, new in regressions:
+                self.stderr.write('%s books, %s: %s %.3f -> %.3f' % (size, name, metric, old, new))
+            if regressions:
+                raise CommandError('%d metric(s) regressed against %s.' % (len(regressions), options['baseline']))
+            self.stdout.write('No regressions against %s.' % options['baseline'])
+
+    def seed(self, size):
+        # Through bulk_create, so the search index and book stats are filled in like for any other write
+        count = Book.objects.count()
+        authors = Author.objects.resolve('Author %d' % i for i in range(1000))
+        genres = Genre.objects.resolve(GENRES)
+        while count < size:
+            batch = min(SEED_BATCH, size - count)
+            Book.objects.bulk_create([
+                Book(title='Book %07d' % i, author=authors['Author %d' % (i % 1000)], publicationYear=1900 + i % 125,
+                     genre=genres[GENRES[i % len(GENRES)]])
+                for i in range(count, count + batch)
+            ])
+            count += batch
+
+    def cases(self, client, size, options):
+        """
+        (name, operation, iterations) for every benchmarked request. Each operation checks the status code,
+        so a broken endpoint fails the run instead of being timed.
+        """
+        iterations = options['iterations']
+        books_url = reverse('book-c')
+
+        def get(url, data=None, status=200):
+            return lambda: self.expect(client.get(url, data), status)
+
+        last_page = -(-size // BooksPagination.page_size)
+        depths = sorted({page for page in (1, 10, 100, 1000, 10000, 100000) if page <= last_page} | {last_page})
+        for page in depths:
+            yield 'GET list page %d' % page, get(books_url, {'page': page}), iterations
+
+        middle = Book.objects.order_by(*BooksCursorPagination.ordering).values_list(
+            *BookFastSerializer.columns, named=True
+        )[size // 2]
+        pagination = BooksCursorPagination()
+        pagination.base_url = books_url
+        cursor = parse_qs(urlsplit(pagination.encode_cursor(middle, reverse=False)).query)['cursor'][0]
+        yield 'GET list cursor first page', get(books_url, {'cursor': ''}), iterations
+        yield 'GET list cursor middle page', get(books_url, {'cursor': cursor}), iterations
+
+        detail_url = reverse('book-rud', args=[middle.id])
+        yield 'GET detail', get(detail_url), iterations
+        ids = ','.join(str(pk) for pk in Book.objects.order_by('?').values_list('id', flat=True)[:100])
+        yield 'GET batch of 100 ids', get(books_url, {'ids': ids}), iterations
+
+        # Create and delete make the same number of calls, so delete removes exactly the books create added
+        created = []
+
+        def create():
+            response = self.expect(client.post(books_url, {
+                'title': 'New book', 'author': 'New author', 'publicationYear': 2024, 'genre': 'Fiction',
+            }, content_type='application/json'), 201)
+            created.append(response.json()['id'])
+
+        def update():
+            self.expect(client.put(detail_url, {
+                'title': middle.title, 'author': middle.author__name, 'publicationYear': middle.publicationYear,
+                'genre': middle.genre__name,
+            }, content_type='application/json'), 200)
+
+        def delete():
+            self.expect(client.delete(reverse('book-rud', args=[created.pop()])), 204)
+
+        def token():
+            self.expect(client.post(reverse('token_obtain_pair'), {
+                'username': 'benchmark', 'password': 'benchmark',
+            }, content_type='application/json'), 200)
+
+        yield 'POST create', create, iterations
+        yield 'PUT update', update, iterations
+        yield 'DELETE', delete, iterations
+        yield 'POST token', token, options['token_iterations']
+
+    def expect(self, response, status):
+        if response.status_code != status:
+            raise CommandError('%s %s returned %d, expected %d: %s' % (
+                response.request['REQUEST_METHOD'], response.request['PATH_INFO'], response.status_code, status,
+                response.content[:200],
+            ))
+        return response
+
+    def meta(self, sizes, options):
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'sizes': sizes,
+            'iterations': options['iterations'],
+            'token_iterations': options['token_iterations'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
@@ -0,0 +1,162 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import path
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import benchmarks
+from api.async_views import AsyncBookCView, AsyncBookRUDView
+from api.models import Book
+from api.views import BookCView, BookRUDView
+
+
+# Both variants side by side, mounted with ROOT_URLCONF while the benchmark runs
+urlpatterns = [
+    path('sync/books/', BookCView.as_view()),
+    path('sync/books/<int:pk>/', BookRUDView.as_view()),
+    path('async/books/', AsyncBookCView.as_view()),
+    path('async/books/<int:pk>/', AsyncBookRUDView.as_view()),
+]
+
+
+async def asgi_request(app, path, query, headers):
+    """
+    One GET through the ASGI application, as an ASGI server would make it. Returns the response status.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': headers, 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    received = False
+    response = {}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Future()  # The client never disconnects
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await app(scope, receive, send)
+    return response['status']
+
+
+def wsgi_request(app, path, query, authorization):
+    """
+    One GET through the WSGI application, as a threaded WSGI server would make it. Returns the response status.
+    """
+    environ = {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': 'testserver', 'HTTP_AUTHORIZATION': authorization,
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+
+    body = app(environ, start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return response['status']
+
+
+async def load(request, requests, connections):
+    """
+    Replays requests (a list of (path, query) pairs) over `connections` concurrent clients, each sending
+    its next request as soon as the previous one is answered. `request` is a coroutine function taking a
+    path and a query and returning the response status. Returns per-request latencies, errors and the
+    wall-clock duration.
+    """
+    pending = iter(requests)
+    latencies, errors = [], 0
+
+    async def client():
+        nonlocal errors
+        for path, query in pending:
+            started = time.perf_counter()
+            if await request(path, query) != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the sync and async book views under concurrent load on a scratch database, with --connections '
+        'clients in flight at once. The sync views are served in-process through the WSGI application by a pool '
+        'of --threads threads, as by a threaded WSGI server; the async views through the ASGI application. Use '
+        'loadtest.py against a running server for real sockets.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000, help='Concurrent clients.')
+        parser.add_argument('--requests', type=int, default=10000, help='Requests per variant.')
+        parser.add_argument('--books', type=int, default=1000, help='Books in the scratch database.')
+        parser.add_argument('--threads', type=int, default=100, help='Threads serving the sync views.')
+
+    def handle(self, *args, **options):
+        # The response cache and coalescing would answer nearly every request without reaching the views' ORM
+        # path, and the rate limits would turn the load into 429s. WhiteNoise is left out, as under SERVER_MODE=asgi
+        middleware = [name for name in settings.MIDDLEWARE if name != 'whitenoise.middleware.WhiteNoiseMiddleware']
+        with benchmarks.scratch_database(), override_settings(
+            ROOT_URLCONF=__name__, MIDDLEWARE=middleware, BOOKS_CACHE_TIMEOUT=0, BOOKS_COALESCE_READS=False,
+            BOOKS_THROTTLE_RATES={},
+        ):
+            user = User.objects.create_user(username='benchmark', password='benchmark')
+            Book.objects.bulk_create(benchmarks.make_books(options['books']))
+            ids = list(Book.objects.values_list('id', flat=True))
+            authorization = 'Bearer %s' % AccessToken.for_user(user)
+            headers = [(b'host', b'testserver'), (b'authorization', authorization.encode())]
+            asgi_app = get_asgi_application()
+            wsgi_app = get_wsgi_application()
+            pool = ThreadPoolExecutor(max_workers=options['threads'])
+
+            async def sync_request(path, query):
+                # Requests beyond --threads queue for a free thread, and the wait counts in their latency
+                return await asyncio.get_running_loop().run_in_executor(
+                    pool, wsgi_request, wsgi_app, path, query, authorization
+                )
+
+            async def async_request(path, query):
+                return await asgi_request(asgi_app, path, query, headers)
+
+            for variant, request in (('sync', sync_request), ('async', async_request)):
+                # Same mix as loadtest.py: mostly first pages, some deeper pages and detail reads
+                requests = []
+                for i in range(options['requests']):
+                    if i % 10 < 6:
+                        requests.append(('/%s/books/' % variant, ''))
+                    elif i % 10 < 8:
+                        requests.append(('/%s/books/' % variant, 'page=2&page_size=50'))
+                    else:
+                        requests.append(('/%s/books/%d/' % (variant, ids[i % len(ids)]), ''))
+
+                asyncio.run(load(request, requests[:100], 10))  # Warm-up
+                latencies, errors, duration = asyncio.run(load(request, requests, options['connections']))
+                summary = benchmarks.summarize(latencies)
+                summary['ops_per_sec'] = len(latencies) / duration  # Throughput across all clients
+                name = '%s views, %d connections' % (variant, options['connections'])
+                self.stdout.write(benchmarks.format_summary(name, summary) + '  %d errors' % errors)
+            pool.shutdown()
@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils.module_loading import import_string
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import benchmarks
+from api.models import Book
+from api.views import BookCView
+
+
+CLASSES = [
+    'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'api.authentication.StatelessJWTAuthentication',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares JWTAuthentication with StatelessJWTAuthentication on a scratch database: authenticate() '
+        'on its own, and a full GET /api/books/ request through BookCView with each class.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        # The response cache would answer every repeated list request without reaching the database, and the
+        # rate limits would turn the repeated requests into 429s
+        with benchmarks.scratch_database(), override_settings(BOOKS_CACHE_TIMEOUT=0, BOOKS_THROTTLE_RATES={}):
+            user = User.objects.create_user(username='benchmark', password='benchmark')
+            Book.objects.bulk_create(benchmarks.make_books(100))
+            factory = APIRequestFactory()
+            header = 'Bearer %s' % AccessToken.for_user(user)
+
+            for path in CLASSES:
+                authentication_class = import_string(path)
+                name = authentication_class.__name__
+
+                def authenticate():
+                    request = BookCView().initialize_request(factory.get('/api/books/', HTTP_AUTHORIZATION=header))
+                    authentication_class().authenticate(request)
+
+                view = BookCView.as_view(authentication_classes=[authentication_class])
+
+                def list_books():
+                    view(factory.get('/api/books/', HTTP_AUTHORIZATION=header))
+
+                self.stdout.write(benchmarks.format_summary(name + ' authenticate()', benchmarks.measure(authenticate, iterations)))
+                self.stdout.write(benchmarks.format_summary(name + ' GET /api/books/', benchmarks.measure(list_books, iterations // 4)))
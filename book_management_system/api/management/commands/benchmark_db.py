@@ -0,0 +1,102 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+from api import benchmarks
+from api.models import Book
+
+
+PROFILES = {
+    # What settings.py used to configure: a new connection per request, rollback journal, deferred transactions
+    'baseline': {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+    # The profile settings.py configures now
+    'tuned': {
+        'ENGINE': 'api.db_backends.sqlite3', 'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': settings.SQLITE_OPTIONS,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the baseline and tuned SQLite profiles under concurrent readers and writers. Each profile '
+        'gets a freshly migrated database file; reader threads list and fetch books while writer threads '
+        'update them in transactions, each operation ending like a request does (closing or keeping the '
+        'connection according to CONN_MAX_AGE). Reports latency, throughput and "database is locked" errors.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per profile.')
+        parser.add_argument('--books', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['readers'] and not options['writers']:
+            raise CommandError('Need at least one reader or writer.')
+        with tempfile.TemporaryDirectory() as directory:
+            for name, profile in PROFILES.items():
+                alias = 'benchmark_%s' % name
+                connections.settings[alias] = connections.configure_settings({
+                    **connections.settings, alias: {**profile, 'NAME': os.path.join(directory, '%s.sqlite3' % name)},
+                })[alias]
+                try:
+                    self.run_profile(name, alias, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+
+    def run_profile(self, name, alias, options):
+        call_command('migrate', database=alias, verbosity=0)
+        Book.objects.using(alias).bulk_create(benchmarks.make_books(options['books'], using=alias))
+        ids = list(Book.objects.using(alias).values_list('id', flat=True))
+        connections[alias].close()
+
+        results = {'read': ([], [0]), 'write': ([], [0])}
+        deadline = time.monotonic() + options['duration']
+
+        def read(i):
+            list(Book.objects.using(alias).all()[:10])
+            Book.objects.using(alias).get(id=ids[i % len(ids)])
+
+        def write(i):
+            with transaction.atomic(using=alias):
+                book = Book.objects.using(alias).select_for_update().get(id=ids[i % len(ids)])
+                book.title = 'Book %d (%d)' % (book.id, i)
+                book.save()
+
+        def worker(kind, operation, offset):
+            timings, errors = results[kind]
+            i = offset
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    operation(i)
+                    timings.append(time.perf_counter() - started)
+                except OperationalError:  # database is locked
+                    errors[0] += 1
+                connections[alias].close_if_unusable_or_obsolete()  # As at the end of a request
+                i += 1
+            connections[alias].close()
+
+        threads = [threading.Thread(target=worker, args=('read', read, n)) for n in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('write', write, n * 7919)) for n in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for kind, (timings, errors) in results.items():
+            if not timings:
+                self.stdout.write('%-44s no successful operations, %d locked errors' % ('%s %ss' % (name, kind), errors[0]))
+                continue
+            summary = benchmarks.summarize(timings)
+            summary['ops_per_sec'] = len(timings) / options['duration']  # Throughput across all threads
+            label = '%s %ss' % (name, kind)
+            self.stdout.write(benchmarks.format_summary(label, summary) + '  %d locked errors' % errors[0])
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api import benchmarks, renderers
+from api.models import Book
+from api.renderers import FastJSONRenderer
+from api.serializers import BookFastSerializer, BookSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares BookSerializer + JSONRenderer with the BookFastSerializer + FastJSONRenderer fast path on '
+        'a scratch database, for one page of --rows books: serialization and rendering on their own, and '
+        'together with fetching the page.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Books per page (page_size).')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rows, iterations = options['rows'], options['iterations']
+        with benchmarks.scratch_database():
+            Book.objects.bulk_create(benchmarks.make_books(rows))
+            books = list(Book.objects.select_related('author', 'genre')[:rows])
+            named_rows = list(Book.objects.values_list(*BookFastSerializer.columns, named=True)[:rows])
+
+            def model_serializer(page):
+                return JSONRenderer().render({'results': BookSerializer(page, many=True).data})
+
+            def fast_serializer(page):
+                return FastJSONRenderer().render({'results': BookFastSerializer(page, many=True).data})
+
+            if model_serializer(books) != fast_serializer(named_rows):
+                raise CommandError('The fast path output differs from BookSerializer.')
+            encoder = 'orjson' if renderers.orjson else 'stdlib json'
+
+            results = [
+                ('BookSerializer + JSONRenderer', lambda: model_serializer(books)),
+                ('BookFastSerializer + FastJSONRenderer', lambda: fast_serializer(named_rows)),
+                ('fetch + BookSerializer + JSONRenderer', lambda: model_serializer(list(
+                    Book.objects.select_related('author', 'genre')[:rows]
+                ))),
+                ('fetch + fast path', lambda: fast_serializer(list(
+                    Book.objects.values_list(*BookFastSerializer.columns, named=True)[:rows]
+                ))),
+            ]
+            self.stdout.write('%d rows per page, fast path encoding with %s' % (rows, encoder))
+            for name, operation in results:
+                self.stdout.write(benchmarks.format_summary(name, benchmarks.measure(operation, iterations)))
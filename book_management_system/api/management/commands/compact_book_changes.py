@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from api import changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacts the book change log behind /api/books/changes/ down to the latest entry per book. Older '
+        'entries are redundant because the feed always serves the current state of a book, so mirrors at '
+        'any cursor still converge. Deletes in id ranges of --batch-size entries, each in its own statement.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to compact the log on. Defaults to the "default" database.',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000, help='Log entries scanned per DELETE.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        deleted = changes.compact(using=options['database'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Deleted %d superseded change log entries.' % deleted))
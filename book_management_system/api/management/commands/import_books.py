@@ -0,0 +1,201 @@
+import csv
+import io
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from api import cache, changes, search, stats
+from api.models import Author, Book, Genre, fold
+
+
+FIELDS = ('title', 'author', 'publicationYear', 'genre')
+COLUMNS = ('title', 'author_id', 'publicationYear', 'genre_id')  # What a cleaned row is written as
+LOOKUPS = {1: Author, 3: Genre}  # Row positions holding a name to replace with its Author/Genre id
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams books from a CSV or NDJSON file into the database in fixed-size chunks. Rows are checked '
+        'against the Book field validators and invalid rows are reported and skipped. Each chunk is committed '
+        'on its own, so an interrupted import can be resumed with --skip.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - to read from standard input.')
+        parser.add_argument(
+            '--format', choices=['csv', 'ndjson'],
+            help='Input format. Defaults to the file extension (.csv, .ndjson or .jsonl).',
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows written per transaction.')
+        parser.add_argument('--skip', type=int, default=0, help='Number of data rows to skip, to resume an import.')
+        parser.add_argument(
+            '--no-fast-path', action='store_true',
+            help='Always load through bulk_create() instead of executemany() (SQLite) or COPY (PostgreSQL).',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to import into. Defaults to the "default" database.',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        if options['skip'] < 0:
+            raise CommandError('--skip cannot be negative.')
+
+        path = options['path']
+        file_format = options['format'] or next(
+            (name for ext, name in FORMATS.items() if path.lower().endswith(ext)), None
+        )
+        if file_format is None:
+            raise CommandError('Cannot tell the format of %s, pass --format.' % path)
+
+        self.using = options['database']
+        if cache.is_unreachable():
+            self.stderr.write(cache.UNREACHABLE_MESSAGE)
+        # Names are checked against the Author/Genre name fields (max_length) rather than the foreign keys
+        self.fields = [
+            LOOKUPS[index]._meta.get_field('name') if index in LOOKUPS else Book._meta.get_field(name)
+            for index, name in enumerate(FIELDS)
+        ]
+        vendor = connections[self.using].vendor
+        self.loader = self.load_orm
+        if not options['no_fast_path']:
+            self.loader = {'sqlite': self.load_sqlite, 'postgresql': self.load_postgresql}.get(vendor, self.load_orm)
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            records = self.read_csv(stream) if file_format == 'csv' else self.read_ndjson(stream)
+            self.run(islice(records, options['skip'], None), options['chunk_size'], options['skip'])
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def run(self, records, chunk_size, offset):
+        imported = skipped = 0
+        started = time.monotonic()
+        chunk = []
+        for line, record in records:
+            offset += 1
+            row = self.clean(line, record)
+            if row is None:
+                skipped += 1
+            else:
+                chunk.append(row)
+            if len(chunk) == chunk_size:
+                imported += self.write(chunk)
+                chunk = []
+                self.progress(imported, skipped, offset, started)
+        if chunk:
+            imported += self.write(chunk)
+        self.progress(imported, skipped, offset, started)
+        self.stdout.write(self.style.SUCCESS('Imported %d books, skipped %d invalid rows.' % (imported, skipped)))
+
+    def progress(self, imported, skipped, offset, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write('Imported %d, skipped %d, %.0f rows/s. Resume with --skip %d.' % (
+            imported, skipped, (imported + skipped) / elapsed if elapsed else 0, offset,
+        ))
+
+    def read_csv(self, stream):
+        reader = csv.DictReader(stream)
+        missing = set(FIELDS) - set(reader.fieldnames or [])
+        if missing - {'publicationYear'}:
+            raise CommandError('The CSV header is missing the columns: %s.' % ', '.join(sorted(missing)))
+        for record in reader:
+            yield reader.line_num, record
+
+    def read_ndjson(self, stream):
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError:
+                record = None
+            yield line, record
+
+    def clean(self, line, record):
+        # Field.clean() runs the same to_python() conversion and validators (max_length, Min/Max year) as a
+        # model full_clean(), without building a model instance or a serializer per row
+        if not isinstance(record, dict):
+            self.stderr.write('Line %d: not a JSON object.' % line)
+            return None
+        row, errors = [], []
+        for name, field in zip(FIELDS, self.fields):
+            value = record.get(name)
+            if field.null and value in ('', None):
+                value = None
+            try:
+                row.append(field.clean(value, None))
+            except ValidationError as exc:
+                errors.append('%s: %s' % (name, ' '.join(exc.messages)))
+        if errors:
+            self.stderr.write('Line %d: %s' % (line, '; '.join(errors)))
+            return None
+        return row
+
+    def write(self, rows):
+        with transaction.atomic(using=self.using):
+            if self.loader == self.load_orm:
+                self.loader(self.resolve_names(rows))
+            else:
+                # The fast paths skip the Book signals, so the chunk's books (every id above the highest one
+                # before the insert) are logged, indexed and counted here, in the chunk's transaction
+                books = Book.objects.using(self.using)
+                last_id = books.order_by('-pk').values_list('pk', flat=True).first() or 0
+                self.loader(self.resolve_names(rows))
+                inserted = list(books.filter(pk__gt=last_id).order_by('pk').select_related('author', 'genre'))
+                changes.books_saved(inserted, True, self.using)
+                search.index_books(inserted, using=self.using)
+                stats.books_saved(inserted, True, self.using)
+                cache.invalidate(using=self.using)
+        return len(rows)
+
+    def resolve_names(self, rows):
+        # One resolve() per lookup model for the chunk, creating the authors and genres seen for the first time
+        rows = [list(row) for row in rows]
+        for index, model in LOOKUPS.items():
+            ids = model.objects.using(self.using).resolve(row[index] for row in rows)
+            for row in rows:
+                row[index] = ids[row[index]].pk
+        return rows
+
+    def load_orm(self, rows):
+        Book.objects.using(self.using).bulk_create([Book(**dict(zip(COLUMNS, row))) for row in rows])
+
+    def raw_rows(self, rows):
+        # Raw loads bypass the model, so fill in title_folded, updated_at and version the way a first save() would
+        connection = connections[self.using]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        return [(*row, fold(row[0]), now, 1) for row in rows]
+
+    def load_sqlite(self, rows):
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO api_book (title, author_id, "publicationYear", genre_id, title_folded, updated_at, version) '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s)', self.raw_rows(rows)
+            )
+
+    def load_postgresql(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(self.raw_rows(rows))  # None is written as an empty, unquoted field, which COPY reads as NULL
+        buffer.seek(0)
+        sql = (
+            'COPY api_book (title, author_id, "publicationYear", genre_id, title_folded, updated_at, version) '
+            'FROM STDIN WITH (FORMAT csv)'
+        )
+        with connections[self.using].cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.read())
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from api import cache, stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the materialized book counts per genre, author and decade from the api_book table. '
+        'With --check, only compares the stored counts against the recomputation and fails if they differ.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to rebuild the stats on. Defaults to the "default" database.',
+        )
+        parser.add_argument('--check', action='store_true', help='Report differences without fixing them.')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['check']:
+            differences = stats.check(using=using)
+            for dimension, key, stored, actual in differences:
+                self.stdout.write('%s %r: stored %d, actual %d' % (dimension, key, stored, actual))
+            if differences:
+                raise CommandError('%d groups differ; run rebuild_book_stats to fix them.' % len(differences))
+            self.stdout.write(self.style.SUCCESS('Book stats are consistent.'))
+            return
+
+        if cache.is_unreachable():
+            self.stderr.write(cache.UNREACHABLE_MESSAGE)
+        with transaction.atomic(using=using):
+            count = stats.rebuild(using=using)
+        cache.invalidate(using=using)  # Drops the memoized /api/books/stats/ response
+        self.stdout.write(self.style.SUCCESS('Rebuilt %d groups.' % count))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text book search index from the api_book table in a single bulk pass.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to rebuild the index on. Defaults to the "default" database.',
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        with transaction.atomic(using=using):
+            count = search.rebuild_index(using=using)
+        self.stdout.write(self.style.SUCCESS('Indexed %d books.' % count))
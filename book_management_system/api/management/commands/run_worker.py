@@ -0,0 +1,129 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Pool processes are spawned rather than forked, so each one sets Django up and opens its own database
+# connections. They import this module before Django is set up, which is why api.jobs (and through it the
+# models) is only imported inside functions here.
+def init_process():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is left to the worker, which lets running jobs finish
+    django.setup()
+
+
+def run_job(job_id):
+    from api import jobs
+    return jobs.execute(job_id)
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the background jobs queued through /api/jobs/ (see api/jobs.py). Claims the oldest queued job '
+        'whenever one of --processes pool processes is free, and polls the job table every --poll-interval '
+        'seconds while the queue is empty. SIGTERM or Ctrl-C stops claiming jobs and exits once the running '
+        'ones have finished. When the web processes cache responses (BOOKS_CACHE_SHARED), needs the cache they '
+        'share (REDIS_URL or DJANGO_CACHE_DIR).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=getattr(settings, 'BOOKS_WORKER_PROCESSES', 2),
+            help='Jobs run at the same time, each in its own process. 0 runs them one at a time in this process.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=getattr(settings, 'BOOKS_WORKER_POLL_INTERVAL', 1),
+            help='Seconds between looks at an empty queue.',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        from api import cache, jobs
+
+        if cache.is_unreachable():
+            # Jobs write books and stats; the web processes would go on serving what they cached before. With
+            # BOOKS_CACHE_SHARED off (the default for the in-memory cache) they cache nothing, so any cache will do.
+            raise CommandError(
+                'BOOKS_CACHE_SHARED is on, but the in-memory cache is not shared with the web processes, so the '
+                'writes of the jobs would not invalidate their cached responses. Set REDIS_URL or DJANGO_CACHE_DIR.'
+            )
+        if options['processes'] < 0:
+            raise CommandError('--processes cannot be negative.')
+        if options['poll_interval'] <= 0:
+            raise CommandError('--poll-interval must be positive.')
+
+        self.name = jobs.worker_name()
+        orphans = jobs.fail_orphans()
+        if orphans:
+            self.stderr.write('Marked %d job(s) of stopped workers as failed.' % orphans)
+
+        self.stopping = False
+        handlers = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        self.stdout.write('Worker %s started with %d process(es).' % (self.name, options['processes']))
+        try:
+            if options['processes']:
+                self.run_pool(options['processes'], options['poll_interval'], options['burst'])
+            else:
+                self.run_inline(options['poll_interval'], options['burst'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write('Worker %s stopped.' % self.name)
+
+    def stop(self, signum, frame):
+        self.stdout.write('Stopping: waiting for the running jobs to finish.')
+        self.stopping = True
+
+    def run_inline(self, poll_interval, burst):
+        from api import jobs
+
+        while not self.stopping:
+            job_id = jobs.claim(self.name)
+            if job_id is not None:
+                self.log(job_id, jobs.execute(job_id))
+            elif burst:
+                break
+            else:
+                time.sleep(poll_interval)
+
+    def run_pool(self, processes, poll_interval, burst):
+        from api import jobs
+        from api.models import Job
+
+        running = {}  # Future -> job id
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=init_process) as pool:
+            while running or not self.stopping:
+                for future in [future for future in running if future.done()]:
+                    job_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as exc:  # The pool process died, e.g. killed for running out of memory
+                        jobs.finish(job_id, Job.FAILED, error='%s: %s' % (type(exc).__name__, exc))
+                        status = Job.FAILED
+                    self.log(job_id, status)
+
+                job_id = None
+                if not self.stopping and len(running) < processes:
+                    job_id = jobs.claim(self.name)
+                if job_id is not None:
+                    try:
+                        running[pool.submit(run_job, job_id)] = job_id
+                    except BrokenProcessPool as exc:
+                        jobs.finish(job_id, Job.FAILED, error='%s: %s' % (type(exc).__name__, exc))
+                        raise CommandError('The process pool broke; restart the worker.')
+                    continue
+                if not running and (burst or self.stopping):
+                    break
+                if running:
+                    wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(poll_interval)
+
+    def log(self, job_id, status):
+        self.stdout.write('Job %d %s.' % (job_id, status))
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the primary SQLite database into the SQLite files standing in for read replicas locally '
+        '(DJANGO_DB_REPLICAS). Run it again whenever the replicas should catch up; in between they lag '
+        'behind the primary like real replicas would.'
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        replicas = settings.BOOKS_READ_REPLICAS
+        if primary.vendor != 'sqlite' or any(connections[alias].vendor != 'sqlite' for alias in replicas):
+            raise CommandError('Only SQLite stand-in replicas can be synced; real replicas use database replication.')
+        if not replicas:
+            raise CommandError('No replicas configured. Set DJANGO_DB_REPLICAS to a comma separated list of files.')
+
+        primary.ensure_connection()
+        for alias in replicas:
+            connections[alias].close()  # The backup replaces the file under any open connection
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write('Synced %s (%s).' % (alias, connections[alias].settings_dict['NAME']))
+        self.stdout.write(self.style.SUCCESS('Synced %d replicas.' % len(replicas)))
@@ -0,0 +1,316 @@
+"""
+Request instrumentation for the book API, exposed in the Prometheus text format at /metrics.
+
+MetricsMiddleware times every request to the routes in BOOKS_METRICS_ROUTES (URL names) and records, per
+route and method:
+
+- books_http_requests_total: requests, also by status code
+- books_http_request_duration_seconds: latency histogram
+- books_db_queries_per_request: histogram of queries per request, over every database alias. An N+1
+  regression moves a route's requests into the higher buckets at once.
+- books_db_query_duration_seconds_total / books_serializer_duration_seconds_total: time spent in the
+  database and in serializer .data. Queries are timed by an execute_wrapper that every database connection
+  gets when it is opened, so they are counted in whichever thread runs them (under ASGI, the sync_to_async
+  threads rather than the event loop's).
+- books_http_response_size_bytes: response body size histogram
+
+Metrics live in the memory of each worker process. With several workers behind one port, set
+BOOKS_METRICS_DIR (gunicorn.conf.py does): every worker then writes its metrics to a file of its own in that
+directory, at most FLUSH_SECONDS after recording them, and /metrics adds up the files of all the workers,
+so a scrape gets the same totals whichever worker answers it. Files of workers that have exited are kept, so
+the counters never go backwards while the server runs.
+
+Set BOOKS_SLOW_REQUEST_MS to log requests slower than that to the "api.slow_requests" logger, together with
+the SQL they ran; statements repeated within the request are collapsed and counted, which is how an N+1
+shows up.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+
+logger = logging.getLogger('api.slow_requests')
+
+DEFAULT_ROUTES = ['book-c', 'book-rud', 'token_obtain_pair', 'token_refresh']
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+HISTOGRAM_BUCKETS = {
+    'books_http_request_duration_seconds': DURATION_BUCKETS,
+    'books_db_queries_per_request': QUERY_BUCKETS,
+    'books_http_response_size_bytes': SIZE_BUCKETS,
+}
+FLUSH_SECONDS = 1  # Longest a worker's new metrics wait before other workers' scrapes see them
+SLOW_LOG_MAX_STATEMENTS = 50
+
+# The RequestMetrics of the request being handled, if it is instrumented
+current = ContextVar('current_request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Per bucket, not cumulative; the last one is +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_timer = None
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()  # (route, method, status) -> requests
+        self.histograms = defaultdict(dict)  # name -> (route, method) -> Histogram
+        self.totals = defaultdict(Counter)  # name -> (route, method) -> total
+
+    def histogram(self, name, labels):
+        histograms = self.histograms[name]
+        if labels not in histograms:
+            histograms[labels] = Histogram(HISTOGRAM_BUCKETS[name])
+        return histograms[labels]
+
+    def record(self, route, method, status, duration, request_metrics, size):
+        labels = (route, method)
+        with self.lock:
+            self.requests[route, method, status] += 1
+            self.histogram('books_http_request_duration_seconds', labels).observe(duration)
+            self.histogram('books_db_queries_per_request', labels).observe(request_metrics.queries)
+            self.histogram('books_http_response_size_bytes', labels).observe(size)
+            self.totals['books_db_queries_total'][labels] += request_metrics.queries
+            self.totals['books_db_query_duration_seconds_total'][labels] += request_metrics.db_time
+            self.totals['books_serializer_duration_seconds_total'][labels] += request_metrics.serializer_time
+            if get_directory() and self.flush_timer is None:
+                self.flush_timer = threading.Timer(FLUSH_SECONDS, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': [[*key, value] for key, value in self.requests.items()],
+                'histograms': {
+                    name: [[*labels, histogram.counts, histogram.sum] for labels, histogram in histograms.items()]
+                    for name, histograms in self.histograms.items()
+                },
+                'totals': {
+                    name: [[*labels, value] for labels, value in totals.items()] for name, totals in self.totals.items()
+                },
+            }
+
+    def merge(self, snapshot):
+        # Adds a snapshot() of another registry to this one
+        with self.lock:
+            for route, method, status, value in snapshot['requests']:
+                self.requests[route, method, status] += value
+            for name, rows in snapshot['histograms'].items():
+                for route, method, counts, total in rows:
+                    histogram = self.histogram(name, (route, method))
+                    histogram.counts = [mine + theirs for mine, theirs in zip(histogram.counts, counts)]
+                    histogram.sum += total
+            for name, rows in snapshot['totals'].items():
+                for route, method, value in rows:
+                    self.totals[name][route, method] += value
+
+    def flush(self):
+        # Writes this process's metrics to BOOKS_METRICS_DIR, replacing its previous file in one step so a
+        # scrape never reads half of it
+        with self.lock:
+            self.flush_timer = None
+        directory = get_directory()
+        if not directory:
+            return
+        path = os.path.join(directory, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(path + '.tmp', path)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines += ['# TYPE books_http_requests_total counter']
+            for (route, method, status), value in sorted(self.requests.items()):
+                lines.append('books_http_requests_total{%s} %d' % (
+                    format_labels(route=route, method=method, status=status), value,
+                ))
+            for name, histograms in sorted(self.histograms.items()):
+                lines.append('# TYPE %s histogram' % name)
+                for (route, method), histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append('%s_bucket{%s} %d' % (
+                            name, format_labels(route=route, method=method, le=bound), cumulative,
+                        ))
+                    labels = format_labels(route=route, method=method)
+                    lines.append('%s_sum{%s} %s' % (name, labels, histogram.sum))
+                    lines.append('%s_count{%s} %d' % (name, labels, cumulative))
+            for name, totals in sorted(self.totals.items()):
+                lines.append('# TYPE %s counter' % name)
+                for (route, method), value in sorted(totals.items()):
+                    lines.append('%s{%s} %s' % (name, format_labels(route=route, method=method), value))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(**labels):
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in labels.items())
+
+
+registry = Registry()
+
+
+def get_directory():
+    return getattr(settings, 'BOOKS_METRICS_DIR', None)
+
+
+def collect():
+    """
+    The registry to render at /metrics: this process's, or with BOOKS_METRICS_DIR, the sum of every worker's.
+    """
+    directory = get_directory()
+    if not directory:
+        return registry
+    registry.flush()  # The answering worker's own numbers are always current
+    combined = Registry()
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as file:
+                combined.merge(json.load(file))
+    return combined
+
+
+class RequestMetrics:
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.statements = Counter() if keep_sql else None       # SQL -> executions, for the slow log
+        self.statement_times = Counter() if keep_sql else None  # SQL -> seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.statements is not None:
+                self.statements[sql] += 1
+                self.statement_times[sql] += elapsed
+
+
+def time_query(execute, sql, params, many, context):
+    # execute_wrapper of every connection: times the query for the request being handled, if any
+    request_metrics = current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    return request_metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Also sent when a connection reconnects, and the wrapper must only be installed once
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@contextmanager
+def serializer_timer():
+    request_metrics = current.get()
+    if request_metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.serializer_time += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    # Adds the time spent building serializer .data to the request's metrics
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+
+class MetricsMiddleware:
+    # Async capable, so under ASGI the async views are reached without a thread held for the whole request.
+    # The current RequestMetrics is context-local, and sync_to_async carries the context into the threads
+    # that run queries and serializers.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        slow_ms = getattr(settings, 'BOOKS_SLOW_REQUEST_MS', None)
+        request_metrics = RequestMetrics(keep_sql=slow_ms is not None)
+        token = current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.record(request, response, time.perf_counter() - started, request_metrics, slow_ms)
+        return response
+
+    async def __acall__(self, request):
+        slow_ms = getattr(settings, 'BOOKS_SLOW_REQUEST_MS', None)
+        request_metrics = RequestMetrics(keep_sql=slow_ms is not None)
+        token = current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.record(request, response, time.perf_counter() - started, request_metrics, slow_ms)
+        return response
+
+    def record(self, request, response, duration, request_metrics, slow_ms):
+        match = request.resolver_match
+        route = match.url_name if match else None
+        if route in getattr(settings, 'BOOKS_METRICS_ROUTES', DEFAULT_ROUTES):
+            size = 0 if response.streaming else len(response.content)
+            registry.record(route, request.method, response.status_code, duration, request_metrics, size)
+        if slow_ms is not None and duration * 1000 >= slow_ms:
+            log_slow_request(request, response, duration, request_metrics)
+
+
+def log_slow_request(request, response, duration, request_metrics):
+    statements = request_metrics.statement_times.most_common(SLOW_LOG_MAX_STATEMENTS)
+    lines = ['%.1f ms  x%d  %s' % (seconds * 1000, request_metrics.statements[sql], sql) for sql, seconds in statements]
+    logger.warning(
+        'Slow request: %s %s -> %d in %.1f ms, %d queries in %.1f ms, serializer %.1f ms\n%s',
+        request.method, request.get_full_path(), response.status_code, duration * 1000, request_metrics.queries,
+        request_metrics.db_time * 1000, request_metrics.serializer_time * 1000, '\n'.join(lines),
+    )
+
+
+def metrics_view(request):
+    return HttpResponse(collect().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
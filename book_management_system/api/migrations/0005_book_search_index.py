@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:20
+
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE api_book_fts USING fts5(title, author, genre, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO api_book_fts (rowid, title, author, genre) SELECT id, title, author, genre FROM api_book",
+]
+SQLITE_REVERSE = [
+    "DROP TABLE IF EXISTS api_book_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE TABLE api_book_search ("
+    " book_id integer PRIMARY KEY REFERENCES api_book (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,"
+    " document tsvector NOT NULL)",
+    "CREATE INDEX api_book_search_document_idx ON api_book_search USING GIN (document)",
+    "INSERT INTO api_book_search (book_id, document) SELECT id,"
+    " setweight(to_tsvector('simple', title), 'A') ||"
+    " setweight(to_tsvector('simple', author), 'B') ||"
+    " setweight(to_tsvector('simple', genre), 'C') FROM api_book",
+]
+POSTGRESQL_REVERSE = [
+    "DROP TABLE IF EXISTS api_book_search",
+]
+
+
+def run(statements):
+    # The search index is backend specific; other backends use the unindexed fallback in api/search.py
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_book_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+    ]
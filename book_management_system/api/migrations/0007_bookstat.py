@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:05
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def build_stats(apps, schema_editor):
+    # Counts the books already in the table; from here on the Book signals keep them up to date
+    Book = apps.get_model('api', 'Book')
+    BookStat = apps.get_model('api', 'BookStat')
+    books = Book.objects.using(schema_editor.connection.alias).order_by()
+    groups = [
+        ('genre', books.values_list('genre')),
+        ('author', books.values_list('author')),
+        ('decade', books.annotate(decade=F('publicationYear') / 10 * 10).values_list('decade')),
+    ]
+    BookStat.objects.using(schema_editor.connection.alias).bulk_create([
+        BookStat(dimension=dimension, key='' if key is None else str(key), count=count)
+        for dimension, rows in groups for key, count in rows.annotate(count=Count('id'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_book_updated_at_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('genre', 'Genre'), ('author', 'Author'), ('decade', 'Decade')], max_length=10)),
+                ('key', models.CharField(blank=True, max_length=255)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bookstat',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='book_stat_dimension_key_uniq'),
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
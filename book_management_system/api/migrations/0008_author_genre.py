@@ -0,0 +1,153 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+LOOKUPS = [('Author', 'author'), ('Genre', 'genre')]
+
+
+def normalize(apps, schema_editor):
+    # One Author/Genre row per distinct name, then every book pointed at its row with a single UPDATE
+    db = schema_editor.connection.alias
+    Book = apps.get_model('api', 'Book')
+    for model_name, field in LOOKUPS:
+        model = apps.get_model('api', model_name)
+        names = Book.objects.using(db).order_by().values_list(field, flat=True).distinct()
+        model.objects.using(db).bulk_create([model(name=name) for name in names.iterator()], batch_size=1000)
+        Book.objects.using(db).update(**{
+            field + '_ref': Subquery(model.objects.filter(name=OuterRef(field)).values('pk')[:1]),
+        })
+
+
+def denormalize(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Book = apps.get_model('api', 'Book')
+    for model_name, field in LOOKUPS:
+        model = apps.get_model('api', model_name)
+        Book.objects.using(db).update(**{
+            field: Subquery(model.objects.filter(pk=OuterRef(field + '_ref')).values('name')[:1]),
+        })
+
+
+def rekey_stats(key_field):
+    # The author and genre book counts are keyed by id after this migration and by name before it
+    def operation(apps, schema_editor):
+        db = schema_editor.connection.alias
+        Book = apps.get_model('api', 'Book')
+        BookStat = apps.get_model('api', 'BookStat')
+        books = Book.objects.using(db).order_by()
+        for _, field in LOOKUPS:
+            BookStat.objects.using(db).filter(dimension=field).delete()
+            BookStat.objects.using(db).bulk_create([
+                BookStat(dimension=field, key=str(key), count=count)
+                for key, count in books.values_list(key_field % field).annotate(count=Count('id'))
+            ], batch_size=1000)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_bookstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.author'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='genre_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.genre'),
+        ),
+        migrations.RunPython(normalize, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_title_author_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_author_title_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_genre_year_idx',
+        ),
+        # Nullable before they are dropped, so that migrating backwards can add them back empty and refill them
+        migrations.AlterField(
+            model_name='book',
+            name='author',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='genre',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, denormalize),
+        migrations.RemoveField(
+            model_name='book',
+            name='author',
+        ),
+        migrations.RemoveField(
+            model_name='book',
+            name='genre',
+        ),
+        migrations.RenameField(
+            model_name='book',
+            old_name='author_ref',
+            new_name='author',
+        ),
+        migrations.RenameField(
+            model_name='book',
+            old_name='genre_ref',
+            new_name='genre',
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='api.author'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='genre',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='api.genre'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'author', 'id'], name='book_title_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'title'], name='book_author_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['genre', 'publicationYear'], name='book_genre_year_idx'),
+        ),
+        migrations.RunPython(rekey_stats('%s'), rekey_stats('%s__name')),
+    ]
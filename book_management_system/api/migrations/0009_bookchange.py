@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_changes(apps, schema_editor):
+    # One create entry per book already in the table, so a mirror reading the feed from the start gets them all
+    Book = apps.get_model('api', 'Book')
+    BookChange = apps.get_model('api', 'BookChange')
+    db = schema_editor.connection.alias
+    now = django.utils.timezone.now()
+    ids = Book.objects.using(db).order_by('id').values_list('id', flat=True)
+    batch = []
+    for book_id in ids.iterator(chunk_size=10000):
+        batch.append(BookChange(book_id=book_id, action='create', changed_at=now))
+        if len(batch) == 10000:
+            BookChange.objects.using(db).bulk_create(batch)
+            batch = []
+    BookChange.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_author_genre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('book_id', models.IntegerField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=6)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book_id', 'id'], name='book_change_book_id_idx')],
+            },
+        ),
+        migrations.RunPython(seed_changes, migrations.RunPython.noop),
+    ]
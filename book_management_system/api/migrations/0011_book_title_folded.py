@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+def fold_titles(apps, schema_editor):
+    # The casefolded titles of the books already in the table, 10000 at a time
+    Book = apps.get_model('api', 'Book')
+    db = schema_editor.connection.alias
+    batch = []
+    for book in Book.objects.using(db).only('id', 'title').order_by('id').iterator(chunk_size=10000):
+        book.title_folded = book.title.casefold()
+        batch.append(book)
+        if len(batch) == 10000:
+            Book.objects.using(db).bulk_update(batch, ['title_folded'])
+            batch = []
+    Book.objects.using(db).bulk_update(batch, ['title_folded'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='title_folded',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(fold_titles, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_title_lower_idx',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title_folded'], name='book_title_folded_idx'),
+        ),
+    ]
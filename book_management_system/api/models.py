@@ -1,11 +1,118 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, router, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.dispatch import Signal
+from django.utils import timezone
 from datetime import datetime as dt
-    
+
+
+# bulk_create() and bulk_update() skip post_save, so BookQuerySet sends this instead.
+# Receivers get sender=Book, instances (with primary keys set), created (bool) and using.
+post_bulk_save = Signal()
+
+
+def fold(text):
+    # Case-insensitive form of a title for prefix search. Computed in Python, because SQLite's LOWER() and LIKE
+    # only fold ASCII letters
+    return text.casefold()
+
+
+# Book writes and their signal receivers share one transaction, so the derived rows (stats, change log)
+# commit or roll back together with the books
+class BookQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.title_folded = fold(obj.title)
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            saved = [obj for obj in objs if obj.pk is not None]  # ignore_conflicts leaves pks unset
+            if saved:
+                post_bulk_save.send(sender=self.model, instances=saved, created=True, using=self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        # bulk_update() neither calls save() nor applies auto_now, so bump version and updated_at here
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.version += 1
+            obj.updated_at = now
+            obj.title_folded = fold(obj.title)
+        fields = list(dict.fromkeys([*fields, 'version', 'updated_at']))
+        if 'title' in fields:
+            fields.append('title_folded')
+        with transaction.atomic(using=self.db, savepoint=False):
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            if objs:
+                post_bulk_save.send(sender=self.model, instances=objs, created=False, using=self.db)
+        return rows
+
+    def update(self, **kwargs):
+        if isinstance(kwargs.get('title'), str):
+            kwargs['title_folded'] = fold(kwargs['title'])
+        return super().update(**kwargs)
+
+
+class LookupQuerySet(models.QuerySet):
+    def resolve(self, names):
+        """
+        Maps each of names to its row as a dict, creating the missing ones: two lookups and one insert,
+        however many names there are.
+        """
+        names = set(names)
+        found = self.in_bulk(names, field_name='name')
+        missing = names - found.keys()
+        if missing:
+            # ignore_conflicts: another writer may create the same name first
+            self.bulk_create([self.model(name=name) for name in missing], ignore_conflicts=True)
+            found.update(self.in_bulk(missing, field_name='name'))
+        return found
+
+
+# Authors and genres are stored once and referenced from Book by id, so the book table and its indexes hold
+# integers instead of the same names repeated on every row. The API still reads and writes them as names.
+class Lookup(models.Model):
+    def save(self, *args, **kwargs):
+        # A rename and the post_save receivers updating its books commit together (see signals.rename_lookup)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class Author(Lookup):
+    name = models.CharField(max_length=255, unique=True)
+
+    objects = LookupQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']  # Also what ordering books by author sorts on
+
+
+class Genre(Lookup):
+    name = models.CharField(max_length=100, unique=True)
+
+    objects = LookupQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+
 class Book(models.Model):
     id = models.AutoField(primary_key=True)     # Auto-incrementing integer ID
     title = models.CharField(max_length=255)    # String field for the title
-    author = models.CharField(max_length=255)   # String field for the author's name
+    title_folded = models.TextField(editable=False, default='')  # fold(title), for ?search= (set on every write)
+    # Author and genre ids. No single-column indexes: book_author_title_idx and book_genre_year_idx lead with them
+    author = models.ForeignKey(Author, on_delete=models.PROTECT, related_name='books', db_index=False)
     publicationYear = models.IntegerField(      # Integer field for publication year
         validators=[
             MinValueValidator(1, message="Publication year cannot be less than 1"), # Assuming books were not published in BC time periods. This can be edited to accomodate BC years
@@ -13,12 +120,119 @@ class Book(models.Model):
         ],
         null=True, blank=True # In the case where publication year is unknown, allow to leave this field blank
         ) 
-    genre = models.CharField(max_length=100)  # String field for the genre
+    genre = models.ForeignKey(Genre, on_delete=models.PROTECT, related_name='books', db_index=False)
+    updated_at = models.DateTimeField(auto_now=True)    # Last modification, sent as Last-Modified
+    version = models.PositiveIntegerField(default=1)    # Bumped on every save, sent as the ETag
+
+    objects = BookQuerySet.as_manager()
     
     def __str__(self):
         return self.title  # Display the title of the book in admin or shell
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The values as read, so signal receivers can tell what a later save changed (see stats.py)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.title_folded = fold(self.title)
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at', 'title_folded'}
+        # One transaction for the row and the post_save receivers; Django already gives deletes one
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    @property
+    def etag(self):
+        return '"%d-%d"' % (self.id, self.version)
+
     class Meta:
         verbose_name = "Book"
         verbose_name_plural = "Books"
-        ordering = ['title', 'author'] # Order by title. if 2 books have the same title, order by author
\ No newline at end of file
+        ordering = ['title', 'author'] # Order by title. if 2 books have the same title, order by author (name)
+        indexes = [
+            models.Index(fields=['title', 'author', 'id'], name='book_title_author_id_idx'),    # Backs the default ordering and keyset (cursor) pagination
+            models.Index(fields=['title_folded'], name='book_title_folded_idx'),                # Title prefix search (?search=)
+            models.Index(fields=['author', 'title'], name='book_author_title_idx'),             # ?author= filter, already in title order
+            models.Index(fields=['genre', 'publicationYear'], name='book_genre_year_idx'),      # ?genre= filter, optionally with a year range
+            models.Index(fields=['publicationYear'], name='book_year_idx'),                     # ?year_min= / ?year_max= and ?ordering=publicationYear
+        ]
+
+
+# Materialized book counts per genre, author and decade, maintained by the Book signals (see stats.py)
+class BookStat(models.Model):
+    GENRE, AUTHOR, DECADE = 'genre', 'author', 'decade'
+    DIMENSION_CHOICES = [(GENRE, 'Genre'), (AUTHOR, 'Author'), (DECADE, 'Decade')]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=255, blank=True)  # Genre or author id, or first year of the decade ('' if unknown)
+    count = models.IntegerField(default=0)               # Not unsigned, so a drifted count never fails a Book write
+
+    def __str__(self):
+        return '%s %s: %d' % (self.dimension, self.key, self.count)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='book_stat_dimension_key_uniq'),
+        ]
+
+
+# Append-only log of Book writes behind /api/books/changes/, written by the Book signals (see changes.py)
+class BookChange(models.Model):
+    CREATE, UPDATE, DELETE = 'create', 'update', 'delete'
+    ACTION_CHOICES = [(CREATE, 'Create'), (UPDATE, 'Update'), (DELETE, 'Delete')]
+
+    id = models.BigAutoField(primary_key=True)          # The feed cursor: entries are read in id order
+    book_id = models.IntegerField()                     # Not a foreign key, the entry outlives a deleted book
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '%d: %s book %d' % (self.id, self.action, self.book_id)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['book_id', 'id'], name='book_change_book_id_idx'),  # Compaction finds newer entries per book
+        ]
+
+
+# Background job, run by `manage.py run_worker` (see jobs.py)
+class Job(models.Model):
+    QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+    IMPORT_BOOKS, EXPORT_BOOKS = 'import_books', 'export_books'
+    REBUILD_SEARCH_INDEX, REBUILD_BOOK_STATS, COMPACT_BOOK_CHANGES = (
+        'rebuild_search_index', 'rebuild_book_stats', 'compact_book_changes',
+    )
+    KIND_CHOICES = [
+        (IMPORT_BOOKS, 'Import books'), (EXPORT_BOOKS, 'Export books'),
+        (REBUILD_SEARCH_INDEX, 'Rebuild search index'), (REBUILD_BOOK_STATS, 'Rebuild book stats'),
+        (COMPACT_BOOK_CHANGES, 'Compact book changes'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)  # Picks the function in jobs.HANDLERS
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name='+')
+    worker = models.CharField(max_length=255, blank=True)  # host:pid of the run_worker process that claimed the job
+    processed = models.PositiveIntegerField(default=0)  # Progress, in rows (or items) of the job
+    total = models.PositiveIntegerField(null=True, blank=True)  # Unknown for streamed input
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s job %d (%s)' % (self.kind, self.id, self.status)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_id_idx'),  # Workers claim the oldest queued job
+        ]
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # Optional: FastJSONRenderer falls back to the stdlib encoder
+    orjson = None
+
+
+# Renderers for the streaming catalogue export. stream() turns an iterator of value tuples into
+# encoded chunks of rows_per_chunk rows each, so nothing beyond one chunk is ever held in memory.
+# render() covers the regular, non-streamed responses of the same view, such as auth errors.
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+    rows_per_chunk = 500
+
+    def encode(self, item):
+        # Same compact, non-ASCII-escaping encoding as DRF's JSONRenderer
+        return json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        items = data if isinstance(data, list) else [data]
+        return ''.join(self.encode(item) for item in items).encode(self.charset)
+
+    def stream(self, fields, rows):
+        lines = []
+        for row in rows:
+            lines.append(self.encode(dict(zip(fields, row))))
+            if len(lines) == self.rows_per_chunk:
+                yield ''.join(lines).encode(self.charset)
+                lines = []
+        if lines:
+            yield ''.join(lines).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    rows_per_chunk = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        items = data if isinstance(data, list) else [data]
+        fields = list(items[0]) if items and isinstance(items[0], dict) else []
+        return b''.join(self.stream(fields, ([item.get(field) for field in fields] for item in items)))
+
+    def stream(self, fields, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count == self.rows_per_chunk:
+                yield self.flush(buffer)
+                count = 0
+        yield self.flush(buffer)
+
+    def flush(self, buffer):
+        chunk = buffer.getvalue().encode(self.charset)
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, falling back to JSONRenderer (the stdlib
+    encoder) otherwise. The bytes are the same as JSONRenderer's for the data the book views return
+    (objects, lists, strings, integers and null): compact, UTF-8, with U+2028/U+2029 escaped. Anything
+    orjson would encode differently, such as dates, or cannot encode, such as lazy strings, goes through
+    JSONRenderer, as do indented responses.
+    """
+    orjson_options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, option=self.orjson_options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
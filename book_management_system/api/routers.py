@@ -0,0 +1,160 @@
+"""
+Read-replica routing. Safe-method (GET, HEAD, OPTIONS) requests read from a replica, everything else reads
+and writes the primary ("default") database.
+
+- ReplicaRoutingMiddleware picks one replica per request, so all queries of a request see the same replica,
+  and leaves unsafe requests and code outside requests (commands, workers, migrations) on the primary.
+- Read-your-writes: after a client sends an unsafe request, its reads stay on the primary for
+  BOOKS_REPLICA_PIN_SECONDS, so it sees its own write even if the replicas lag behind. Clients are told
+  apart by their Authorization header (or address when there is none), and pins are kept in the cache, so
+  workers share them when the cache does (REDIS_URL or DJANGO_CACHE_DIR). Replica reads are never stored
+  in the response cache, and pinned clients skip its lookups (see cache.py).
+- BOOKS_REPLICA_SELECTION is 'round_robin' (rotate through BOOKS_READ_REPLICAS) or 'health' (rotate through
+  the replicas that answered a SELECT 1 in the last BOOKS_REPLICA_HEALTH_INTERVAL seconds). With no
+  healthy replica, reads fall back to the primary.
+
+See the DJANGO_DB_REPLICAS setting for using SQLite files as stand-in replicas locally.
+"""
+import hashlib
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import cache
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The replica the current request reads from, None for the primary
+read_alias = ContextVar('read_alias', default=None)
+# Whether the current request's client is pinned to the primary after a write
+pinned = ContextVar('pinned', default=False)
+
+_lock = threading.Lock()
+_rotations = {}  # Replica list -> index of the replica handed out last
+_health = {}     # Alias -> (healthy, checked at)
+
+
+def get_replicas():
+    return list(getattr(settings, 'BOOKS_READ_REPLICAS', []))
+
+
+def is_healthy(alias):
+    interval = getattr(settings, 'BOOKS_REPLICA_HEALTH_INTERVAL', 5)
+    healthy, checked_at = _health.get(alias, (True, None))
+    if checked_at is None or time.monotonic() - checked_at >= interval:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            healthy = True
+        except DatabaseError:
+            healthy = False
+        _health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+def choose_replica():
+    """
+    The replica for the next request, or None to read from the primary.
+    """
+    replicas = tuple(get_replicas())
+    if not replicas:
+        return None
+    with _lock:
+        start = _rotations[replicas] = (_rotations.get(replicas, -1) + 1) % len(replicas)
+    candidates = replicas[start:] + replicas[:start]  # The next replica in turn first, the others as fallbacks
+    if getattr(settings, 'BOOKS_REPLICA_SELECTION', 'round_robin') == 'health':
+        candidates = [alias for alias in candidates if is_healthy(alias)]
+    return candidates[0] if candidates else None
+
+
+def client_key(request):
+    client = request.META.get('HTTP_AUTHORIZATION') or request.META.get('REMOTE_ADDR', '')
+    return 'replica:pin:%s' % hashlib.sha1(client.encode()).hexdigest()
+
+
+def pin_to_primary(request):
+    seconds = getattr(settings, 'BOOKS_REPLICA_PIN_SECONDS', 5)
+    if seconds:
+        cache.get_cache().set(client_key(request), True, seconds)
+
+
+def is_pinned(request):
+    if not getattr(settings, 'BOOKS_REPLICA_PIN_SECONDS', 5):
+        return False
+    return cache.get_cache().get(client_key(request)) is not None
+
+
+def route_request(request):
+    # The alias the request reads from (None for the primary) and whether its client is pinned to the
+    # primary; unsafe requests pin their client
+    if not get_replicas():
+        return None, False
+    if request.method not in SAFE_METHODS:
+        pin_to_primary(request)
+        return None, True
+    if is_pinned(request):
+        return None, True
+    return choose_replica(), False
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        alias, pin = route_request(request)
+        tokens = read_alias.set(alias), pinned.set(pin)
+        try:
+            return self.get_response(request)
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        # The pin lookup and health checks block, so they run off the event loop
+        alias, pin = await sync_to_async(route_request)(request)
+        tokens = read_alias.set(alias), pinned.set(pin)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.reset(tokens)
+
+    def reset(self, tokens):
+        read_alias.reset(tokens[0])
+        pinned.reset(tokens[1])
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica chosen for the current request and writes to the primary. Replicas are
+    never migrated; they get their schema from the primary through replication (or sync_replicas locally).
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Instances read from a replica are saved to the primary; anything else keeps Django's default
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in get_replicas():
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
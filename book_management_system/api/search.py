@@ -0,0 +1,248 @@
+"""
+Full-text search over book title, author and genre.
+
+The index lives in a side table next to api_book, created by migration 0005:
+
+- SQLite: an FTS5 virtual table (api_book_fts) ranked with bm25()
+- PostgreSQL: a tsvector column (api_book_search.document) with a GIN index, ranked with ts_rank_cd()
+
+Other backends fall back to unranked icontains matching. The index is kept in sync by the
+post_save/post_delete receivers in signals.py and can be rebuilt with ``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Book
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Every book with its author and genre names, for rebuilding an index
+BOOKS_WITH_NAMES_SQL = (
+    'FROM api_book book '
+    'JOIN api_author author ON author.id = book.author_id JOIN api_genre genre ON genre.id = book.genre_id'
+)
+
+
+def tokenize(query):
+    # Only word characters reach the backend query syntax, so user input can never inject operators
+    return TOKEN_RE.findall(query.lower())
+
+
+class SearchBackend:
+    def __init__(self, using):
+        self.using = using
+        self.connection = connections[using]
+
+    def documents(self, books):
+        # (pk, title, author name, genre name) per book: from the instances when their author and genre are
+        # loaded, otherwise from one joined query
+        books = list(books)
+        if all(Book.author.is_cached(book) and Book.genre.is_cached(book) for book in books):
+            return [(book.pk, book.title, book.author.name, book.genre.name) for book in books]
+        return list(Book.objects.using(self.using).filter(pk__in=[book.pk for book in books]).values_list(
+            'id', 'title', 'author__name', 'genre__name'
+        ))
+
+    def index(self, books):
+        raise NotImplementedError
+
+    def remove(self, pks):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def count(self, tokens):
+        raise NotImplementedError
+
+    def ranked_ids(self, tokens, offset, limit):
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+    table = 'api_book_fts'
+    weights = '10.0, 5.0, 1.0'  # bm25() column weights for title, author, genre
+
+    def match(self, tokens):
+        # Every token must match, each as a prefix: "dun"* "her"*
+        return ' '.join('"%s"*' % token for token in tokens)
+
+    def index(self, books):
+        books = list(books)
+        self.remove([book.pk for book in books])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO %s (rowid, title, author, genre) VALUES (%%s, %%s, %%s, %%s)' % self.table,
+                self.documents(books),
+            )
+
+    def remove(self, pks):
+        with self.connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % self.table, [(pk,) for pk in pks])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % self.table)
+            cursor.execute(
+                'INSERT INTO %s (rowid, title, author, genre) SELECT book.id, book.title, author.name, genre.name %s'
+                % (self.table, BOOKS_WITH_NAMES_SQL)
+            )
+            cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (self.table, self.table))
+            cursor.execute('SELECT COUNT(*) FROM %s' % self.table)
+            return cursor.fetchone()[0]
+
+    def count(self, tokens):
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s WHERE %s MATCH %%s' % (self.table, self.table), [self.match(tokens)])
+            return cursor.fetchone()[0]
+
+    def ranked_ids(self, tokens, offset, limit):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM %s WHERE %s MATCH %%s ORDER BY bm25(%s, %s), rowid LIMIT %%s OFFSET %%s'
+                % (self.table, self.table, self.table, self.weights),
+                [self.match(tokens), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    table = 'api_book_search'
+    # Title outranks author, which outranks genre. 'simple' keeps names unstemmed, like FTS5's unicode61
+    document = (
+        "setweight(to_tsvector('simple', {title}), 'A') || "
+        "setweight(to_tsvector('simple', {author}), 'B') || "
+        "setweight(to_tsvector('simple', {genre}), 'C')"
+    )
+
+    def match(self, tokens):
+        return ' & '.join('%s:*' % token for token in tokens)
+
+    def index(self, books):
+        books = list(books)
+        self.remove([book.pk for book in books])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO %s (book_id, document) VALUES (%%s, %s)'
+                % (self.table, self.document.format(title='%s', author='%s', genre='%s')),
+                self.documents(books),
+            )
+
+    def remove(self, pks):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE book_id = ANY(%%s)' % self.table, [list(pks)])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('TRUNCATE %s' % self.table)
+            cursor.execute(
+                'INSERT INTO %s (book_id, document) SELECT book.id, %s %s' % (
+                    self.table, self.document.format(title='book.title', author='author.name', genre='genre.name'),
+                    BOOKS_WITH_NAMES_SQL,
+                )
+            )
+            return cursor.rowcount
+
+    def count(self, tokens):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM %s WHERE document @@ to_tsquery('simple', %%s)" % self.table,
+                [self.match(tokens)],
+            )
+            return cursor.fetchone()[0]
+
+    def ranked_ids(self, tokens, offset, limit):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT book_id FROM %s, to_tsquery('simple', %%s) query WHERE document @@ query "
+                "ORDER BY ts_rank_cd(document, query) DESC, book_id LIMIT %%s OFFSET %%s" % self.table,
+                [self.match(tokens), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class FallbackSearchBackend(SearchBackend):
+    # No index to maintain; matches with icontains scans in the default book ordering
+
+    def index(self, books):
+        pass
+
+    def remove(self, pks):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def queryset(self, tokens):
+        queryset = Book.objects.using(self.using)
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(title__icontains=token) | Q(author__name__icontains=token) | Q(genre__name__icontains=token)
+            )
+        return queryset
+
+    def count(self, tokens):
+        return self.queryset(tokens).count()
+
+    def ranked_ids(self, tokens, offset, limit):
+        return list(self.queryset(tokens).values_list('id', flat=True)[offset:offset + limit])
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_backend(using):
+    return BACKENDS.get(connections[using].vendor, FallbackSearchBackend)(using)
+
+
+class SearchResults:
+    """
+    Lazily evaluated, ranked search results. Supports count() and slicing so it can be handed
+    straight to a Django Paginator; each page is one ranked id lookup plus one in_bulk() fetch.
+    """
+
+    def __init__(self, query, using=None):
+        self.tokens = tokenize(query)
+        self.backend = get_backend(using or router.db_for_read(Book))
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.tokens) if self.tokens else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('SearchResults only supports slicing without a step.')
+        start = key.start or 0
+        stop = key.stop if key.stop is not None else self.count()
+        if not self.tokens or stop <= start:
+            return []
+        ids = self.backend.ranked_ids(self.tokens, start, stop - start)
+        books = Book.objects.using(self.backend.using).select_related('author', 'genre').in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
+
+
+def search_books(query, using=None):
+    return SearchResults(query, using)
+
+
+def index_books(books, using=None):
+    get_backend(using or router.db_for_write(Book)).index(books)
+
+
+def remove_books(pks, using=None):
+    get_backend(using or router.db_for_write(Book)).remove(pks)
+
+
+def rebuild_index(using=None):
+    return get_backend(using or router.db_for_write(Book)).rebuild()
@@ -1,8 +1,203 @@
+import json
+import os
+
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Book
 
-class BookSerializer(serializers.ModelSerializer):
-    
+from .management.commands.import_books import FORMATS
+from .metrics import TimedSerializerMixin
+from .models import Author, Book, Genre, Job
+
+
+# Times .data of list serializers too (see metrics.py)
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+# Validates a batch of books for the bulk endpoint. Each item is validated on its own so a bad row
+# is reported next to its siblings instead of rejecting the whole batch: validated_data lines up with
+# the input (None for invalid items) and item_errors holds the matching errors ({} for valid items).
+class BookListSerializer(TimedListSerializer):
+    max_items = 1000
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({'non_field_errors': ['Expected a list of books.']})
+        if not data:
+            raise serializers.ValidationError({'non_field_errors': ['The list of books cannot be empty.']})
+        if len(data) > self.max_items:
+            raise serializers.ValidationError(
+                {'non_field_errors': ['A batch cannot contain more than %d books.' % self.max_items]}
+            )
+
+        validated, self.item_errors = [], []
+        for item in data:
+            try:
+                book = self.child.run_validation(item)
+                if isinstance(item, dict) and item.get('id') is not None:
+                    book['id'] = self.validate_id(item['id'])  # Items with an id update that book
+            except serializers.ValidationError as exc:
+                validated.append(None)
+                self.item_errors.append(exc.detail)
+            else:
+                validated.append(book)
+                self.item_errors.append({})
+        return validated
+
+    def validate_id(self, value):
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise serializers.ValidationError({'id': ['A valid book id is required.']})
+        return value
+
+
+# Author and genre are foreign keys, read and written as their names so the API keeps its string fields.
+# Validated data holds the names; resolve_names() swaps them for the Author and Genre rows before a save.
+class NameField(serializers.CharField):
+    def to_representation(self, value):
+        return value.name
+
+
+def resolve_names(items, using=None):
+    # items: validated book data (None for invalid items). One resolve() per model for the whole batch.
+    for field, model in (('author', Author), ('genre', Genre)):
+        names = {item[field] for item in items if item is not None and field in item}
+        if names:
+            rows = model.objects.using(using).resolve(names)
+            for item in items:
+                if item is not None and field in item:
+                    item[field] = rows[item[field]]
+    return items
+
+
+class BookSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    author = NameField(max_length=255)
+    genre = NameField(max_length=100)
+
     class Meta:
         model = Book
         fields = ('id', 'title', 'author', 'publicationYear', 'genre')
+        list_serializer_class = BookListSerializer
+
+    def create(self, validated_data):
+        return super().create(resolve_names([validated_data])[0])
+
+    def update(self, instance, validated_data):
+        return super().update(instance, resolve_names([validated_data])[0])
+
+
+# Read-only fast path for the book list. Takes the named rows of
+# Book.objects.values_list(*BookFastSerializer.columns, named=True), which joins in the author and genre
+# names, and turns each into the same dict BookSerializer would build, without instantiating a model or
+# running a field object per value.
+class BookFastSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    field_names = BookSerializer.Meta.fields
+    columns = ('id', 'title', 'author__name', 'publicationYear', 'genre__name')  # Lined up with field_names
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def to_representation(self, row):
+        return dict(zip(self.field_names, row))
+
+
+# The /api/authors/ and /api/genres/ lists
+class AuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Author
+        fields = ('id', 'name')
+
+
+class GenreSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Genre
+        fields = ('id', 'name')
+
+
+# The ids of a batch get (GET /api/books/?ids=1,2,3 or POST /api/books/batch/). Duplicates are dropped,
+# keeping the first occurrence, so validated ids are unique and in request order.
+class BookIdsSerializer(serializers.Serializer):
+    max_ids = 500
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=max_ids,
+        error_messages={'max_length': 'A batch cannot contain more than %d ids.' % max_ids},
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+# Query parameters of the change feed (GET /api/books/changes/)
+class BookChangesQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+
+
+# Background jobs (see jobs.py). Each kind takes its own params; an import also takes the uploaded file.
+class ExportJobParamsSerializer(serializers.Serializer):
+    format = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    author = serializers.CharField(required=False)
+    genre = serializers.CharField(required=False)
+    year_min = serializers.IntegerField(required=False)
+    year_max = serializers.IntegerField(required=False)
+    search = serializers.CharField(required=False)
+
+
+class ImportJobParamsSerializer(serializers.Serializer):
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], required=False)
+    chunk_size = serializers.IntegerField(min_value=1, default=5000)
+
+
+class JobCreateSerializer(serializers.Serializer):
+    params_serializers = {Job.EXPORT_BOOKS: ExportJobParamsSerializer, Job.IMPORT_BOOKS: ImportJobParamsSerializer}
+
+    kind = serializers.ChoiceField(choices=Job.KIND_CHOICES)
+    params = serializers.JSONField(default=dict)
+    file = serializers.FileField(required=False)
+
+    def validate_params(self, value):
+        if isinstance(value, str):  # A multipart form field (imports) carries the params as JSON text
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise serializers.ValidationError('Not valid JSON.')
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object.')
+        return value
+
+    def validate(self, data):
+        params_serializer = self.params_serializers.get(data['kind'])
+        if params_serializer is None:
+            data['params'] = {}
+        else:
+            params = params_serializer(data=data['params'])
+            if not params.is_valid():
+                raise serializers.ValidationError({'params': params.errors})
+            data['params'] = dict(params.validated_data)
+        if data['kind'] == Job.IMPORT_BOOKS:
+            upload = data.get('file')
+            if upload is None:
+                raise serializers.ValidationError({'file': 'An import needs a CSV or NDJSON file.'})
+            if 'format' not in data['params'] and os.path.splitext(upload.name)[1].lower() not in FORMATS:
+                raise serializers.ValidationError({'file': 'Cannot tell the format of %s, pass params.format.' % upload.name})
+        elif 'file' in data:
+            raise serializers.ValidationError({'file': 'Only imports take a file.'})
+        return data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='job-detail')
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'url', 'kind', 'params', 'status', 'processed', 'total', 'result', 'error', 'download',
+            'created_at', 'started_at', 'finished_at',
+        )
+
+    def get_download(self, job):
+        # Link to the file of a finished export
+        if job.kind != Job.EXPORT_BOOKS or job.status != Job.SUCCEEDED:
+            return None
+        return self.context['request'].build_absolute_uri(reverse('job-download', args=[job.pk]))
@@ -0,0 +1,107 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import authentication, cache, changes, search, stats
+from .models import Author, Book, Genre, post_bulk_save
+
+
+# Keep the full-text search index in step with every Book write
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        search.index_books([instance], using=using)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, using, **kwargs):
+    search.remove_books([instance.pk], using=using)
+
+
+@receiver(post_bulk_save, sender=Book)
+def index_books(sender, instances, using, **kwargs):
+    search.index_books(instances, using=using)
+
+
+# Keep the materialized genre/author/decade counts in step with every Book write
+@receiver(pre_save, sender=Book)
+def load_book_stats_values(sender, instance, using, **kwargs):
+    # Saving over an existing row with an instance that was not loaded from it (Book(id=..., ...).save())
+    if instance.pk is not None and stats.saved_values(instance) is None:
+        stats.load_saved_values(instance, using)
+
+
+@receiver(post_save, sender=Book)
+def count_book(sender, instance, created, using, **kwargs):
+    stats.books_saved([instance], created, using)
+
+
+@receiver(post_delete, sender=Book)
+def uncount_book(sender, instance, using, **kwargs):
+    stats.books_deleted([instance], using)
+
+
+@receiver(post_bulk_save, sender=Book)
+def count_books(sender, instances, created, using, **kwargs):
+    # bulk_update() instances not loaded from the database cannot be diffed; rebuild_book_stats catches those up
+    stats.books_saved(instances, created, using)
+
+
+# Log every Book write for the change feed, in the write's transaction
+@receiver(post_save, sender=Book)
+def log_book_saved(sender, instance, created, using, **kwargs):
+    changes.books_saved([instance], created, using)
+
+
+@receiver(post_delete, sender=Book)
+def log_book_deleted(sender, instance, using, **kwargs):
+    changes.books_deleted([instance], using)
+
+
+@receiver(post_bulk_save, sender=Book)
+def log_books_saved(sender, instances, created, using, **kwargs):
+    changes.books_saved(instances, created, using)
+
+
+# Any Book write makes every cached list and detail response stale
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_bulk_save, sender=Book)
+def invalidate_cache(sender, using, **kwargs):
+    cache.invalidate(using=using)
+
+
+RENAME_BATCH_SIZE = 2000  # Books loaded at a time to reindex and log after a rename
+
+
+# Renaming an author or genre changes every book under it: bump their versions so ETag and Last-Modified
+# change (one UPDATE), reindex them and log them for the change feed (RENAME_BATCH_SIZE books at a time, so
+# a large author or genre is never held in memory at once) and drop the cached responses
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def rename_lookup(sender, instance, created, using, raw=False, **kwargs):
+    if created or raw:
+        return
+    books = instance.books.using(using)
+    books.update(version=F('version') + 1, updated_at=timezone.now())
+    pks = books.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=RENAME_BATCH_SIZE)
+    while True:
+        batch = list(islice(pks, RENAME_BATCH_SIZE))
+        if not batch:
+            break
+        batch = list(Book.objects.using(using).filter(pk__in=batch).order_by('pk').select_related('author', 'genre'))
+        search.index_books(batch, using=using)
+        changes.books_saved(batch, False, using)
+    cache.invalidate(using=using)
+
+
+# Deactivating or deleting a user takes effect on the next request, not when the cached status expires
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_user_active_status(sender, instance, **kwargs):
+    authentication.forget_active_status(getattr(instance, jwt_settings.USER_ID_FIELD))
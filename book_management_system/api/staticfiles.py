@@ -0,0 +1,55 @@
+"""
+Static files under ASGI (asgi.py).
+
+WhiteNoiseMiddleware is sync only, and under ASGI it would make Django run every request in a thread (see
+MIDDLEWARE in settings.py). StaticFilesApplication serves the same files in front of Django instead, with the
+same WhiteNoise configuration as the middleware: STATIC_ROOT as filled by collectstatic, manifest-hashed names
+cached forever, the pre-compressed copies, 304s and ranges, and the WHITENOISE_* settings. WhiteNoise 6 only
+speaks WSGI, so its responses are sent as ASGI messages here, reading the file in a worker thread.
+"""
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StaticFilesApplication:
+    def __init__(self, application):
+        self.application = application
+        # Only the file table and the response building are used, not the middleware call
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    async def __call__(self, scope, receive, send):
+        static_file = self.find(scope['path']) if scope['type'] == 'http' else None
+        if static_file is None:
+            return await self.application(scope, receive, send)
+
+        request_headers = {
+            'HTTP_%s' % name.decode('latin1').upper().replace('-', '_'): value.decode('latin1')
+            for name, value in scope['headers']
+        }
+        response = static_file.get_response(scope['method'], request_headers)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers],
+        })
+        if response.file is None:  # HEAD, 304 or 405
+            await send({'type': 'http.response.body'})
+            return
+        read = sync_to_async(response.file.read, thread_sensitive=False)
+        try:
+            while True:
+                chunk = await read(CHUNK_SIZE)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': bool(chunk)})
+                if not chunk:
+                    break
+        finally:
+            response.file.close()
+
+    def find(self, path):
+        # As WhiteNoiseMiddleware: the file table built at startup, or a lookup per request with autorefresh (DEBUG)
+        if self.whitenoise.autorefresh:
+            return self.whitenoise.find_file(path)
+        return self.whitenoise.files.get(path)
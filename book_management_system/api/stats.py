@@ -0,0 +1,159 @@
+"""
+Materialized book counts per genre, author and decade of publicationYear, served by /api/books/stats/.
+
+The BookStat table holds one row per group, keyed by genre or author id (so renaming an Author or Genre
+leaves the counts alone) or by decade. The Book signal receivers (signals.py) adjust the affected rows
+on every save, delete and bulk write, so reading the stats costs O(groups) rather than a pass over every
+book. Updates diff the values the book was loaded with (Book.from_db) against the saved ones and only touch
+the groups that changed.
+
+Writes that skip model signals, such as QuerySet.update(), raw SQL or the import_books fast path, leave the
+counts behind. `manage.py rebuild_book_stats` recomputes the table with GROUP BY queries, and
+`rebuild_book_stats --check` compares the two without writing anything.
+"""
+from collections import Counter
+
+from django.db import router
+from django.db.models import Count, F
+
+from .models import Author, Book, BookStat, Genre
+
+
+TRACKED_FIELDS = ('genre_id', 'author_id', 'publicationYear')
+
+
+def decade_key(year):
+    return '' if year is None else str(year // 10 * 10)
+
+
+def group_keys(values):
+    genre, author, year = values
+    return [(BookStat.GENRE, str(genre)), (BookStat.AUTHOR, str(author)), (BookStat.DECADE, decade_key(year))]
+
+
+def current_values(book):
+    return tuple(getattr(book, name) for name in TRACKED_FIELDS)
+
+
+def saved_values(book):
+    # The tracked values as last read from or written to the database, or None if they are not known
+    loaded = getattr(book, '_loaded_values', {})
+    if all(name in loaded for name in TRACKED_FIELDS):
+        return tuple(loaded[name] for name in TRACKED_FIELDS)
+    return None
+
+
+def remember(book, values=None):
+    loaded = getattr(book, '_loaded_values', {})
+    book._loaded_values = {**loaded, **dict(zip(TRACKED_FIELDS, values or current_values(book)))}
+
+
+def load_saved_values(book, using):
+    # For instances that were not loaded from the database (or had these fields deferred)
+    values = Book.objects.using(using).filter(pk=book.pk).values_list(*TRACKED_FIELDS).first()
+    if values is not None:
+        remember(book, values)
+
+
+def apply(deltas, using):
+    # One UPDATE per changed group, plus an INSERT for groups seen for the first time
+    for (dimension, key), delta in deltas.items():
+        if not delta:
+            continue
+        rows = BookStat.objects.using(using).filter(dimension=dimension, key=key)
+        if not rows.update(count=F('count') + delta):
+            BookStat.objects.using(using).bulk_create(
+                [BookStat(dimension=dimension, key=key)], ignore_conflicts=True  # Another writer may get there first
+            )
+            rows.update(count=F('count') + delta)
+
+
+def books_saved(books, created, using):
+    deltas = Counter()
+    for book in books:
+        old = None if created else saved_values(book)
+        new = current_values(book)
+        if old != new:
+            deltas.update(group_keys(new))
+            if old is not None:
+                deltas.subtract(group_keys(old))
+        remember(book, new)
+    apply(deltas, using)
+
+
+def books_deleted(books, using):
+    deltas = Counter()
+    for book in books:
+        deltas.subtract(group_keys(saved_values(book) or current_values(book)))
+    apply(deltas, using)
+
+
+def recompute(using=None):
+    """
+    The counts straight from the book table, as a Counter of (dimension, key) -> count.
+    """
+    books = Book.objects.using(using or router.db_for_read(Book)).order_by()
+    groups = [
+        (BookStat.GENRE, books.values_list('genre')),
+        (BookStat.AUTHOR, books.values_list('author')),
+        (BookStat.DECADE, books.annotate(decade=F('publicationYear') / 10 * 10).values_list('decade')),
+    ]
+    return Counter({
+        (dimension, '' if key is None else str(key)): count
+        for dimension, rows in groups for key, count in rows.annotate(count=Count('id'))
+    })
+
+
+def stored(using=None):
+    rows = BookStat.objects.using(using or router.db_for_read(BookStat)).exclude(count=0)
+    return Counter({(dimension, key): count for dimension, key, count in rows.values_list('dimension', 'key', 'count')})
+
+
+def check(using=None):
+    """
+    Compares the summary table with a full recomputation and returns the groups that differ, as a sorted
+    list of (dimension, key, stored count, actual count). An empty list means the table is consistent.
+    """
+    expected, actual = recompute(using), stored(using)
+    return sorted(
+        (dimension, key, actual[dimension, key], expected[dimension, key])
+        for dimension, key in expected.keys() | actual.keys()
+        if expected[dimension, key] != actual[dimension, key]
+    )
+
+
+def rebuild(using=None):
+    # Replaces the whole summary table; returns the number of groups. Run inside a transaction.
+    using = using or router.db_for_write(BookStat)
+    counts = recompute(using)
+    BookStat.objects.using(using).all().delete()
+    BookStat.objects.using(using).bulk_create(
+        [BookStat(dimension=dimension, key=key, count=count) for (dimension, key), count in counts.items()],
+        batch_size=1000,
+    )
+    return len(counts)
+
+
+def summary(using=None):
+    """
+    The /api/books/stats/ payload: total books plus per-group counts, largest first (decades in order).
+    """
+    using = using or router.db_for_read(BookStat)
+    result = {'total': 0, 'genres': [], 'authors': [], 'decades': []}
+    rows = list(BookStat.objects.using(using).filter(count__gt=0).values_list('dimension', 'key', 'count'))
+    names = {  # Genre and author rows are keyed by id
+        dimension: model.objects.using(using).in_bulk([int(key) for kind, key, _ in rows if kind == dimension])
+        for dimension, model in ((BookStat.GENRE, Genre), (BookStat.AUTHOR, Author))
+    }
+    for dimension, key, count in rows:
+        if dimension == BookStat.GENRE:
+            result['total'] += count  # Every book has exactly one genre
+            result['genres'].append({'genre': names[dimension][int(key)].name, 'count': count})
+        elif dimension == BookStat.AUTHOR:
+            result['authors'].append({'author': names[dimension][int(key)].name, 'count': count})
+        else:
+            result['decades'].append({'decade': int(key) if key else None, 'count': count})
+    result['genres'].sort(key=lambda group: (-group['count'], group['genre']))
+    result['authors'].sort(key=lambda group: (-group['count'], group['author']))
+    result['decades'].sort(key=lambda group: (group['decade'] is None, group['decade'] or 0))
+    return result
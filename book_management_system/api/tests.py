@@ -1,14 +1,55 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection, router, transaction
+from django.db.models import ProtectedError
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework_simplejwt.tokens import AccessToken
 
-from datetime import datetime as dt
+from datetime import datetime as dt, timezone
+from io import StringIO
+from unittest import mock
+import asyncio
+import csv
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
 
-from .models import Book
+from . import async_views, benchmarks, coalescing, jobs, metrics, routers, search, stats, throttling
+from .models import Author, Book, BookChange, Genre, Job
+from .renderers import FastJSONRenderer
+from .serializers import BookFastSerializer, BookSerializer
+from .staticfiles import StaticFilesApplication
+
+
+# The tests run in one process, so the memory cache is shared by every reader and writer
+shared_cache = override_settings(BOOKS_CACHE_SHARED=True)
+
+
+def author(name):
+    return Author.objects.get_or_create(name=name)[0]
+
+
+def genre(name):
+    return Genre.objects.get_or_create(name=name)[0]
 
 
 class AuthenticationTestCase(TestCase):
@@ -54,9 +95,9 @@ class BookAPITests(TestCase):
         # Create a book instance for testing
         self.book = Book.objects.create(
             title="ABC",
-            author="Author123",
+            author=author("Author123"),
             publicationYear=2023,
-            genre="Test"
+            genre=genre("Test")
         )
         return super().setUp()
     
@@ -75,9 +116,9 @@ class BookAPITests(TestCase):
         # Create a book to update
         book = Book.objects.create(
             title="Original Title",
-            author="Original Author",
+            author=author("Original Author"),
             publicationYear=2023,
-            genre="Test"
+            genre=genre("Test")
         )
 
         # Data for updating the book
@@ -97,9 +138,9 @@ class BookAPITests(TestCase):
 
         # Verify that the book details are updated as expected
         self.assertEqual(updated_book.title, "Updated Title")
-        self.assertEqual(updated_book.author, "Updated Author")
+        self.assertEqual(updated_book.author.name, "Updated Author")
         self.assertEqual(updated_book.publicationYear, 2019)
-        self.assertEqual(updated_book.genre, "Updated Genre")
+        self.assertEqual(updated_book.genre.name, "Updated Genre")
         
     def test_update_invalid_book(self):
         # Test updating a book with invalid information
@@ -200,9 +241,9 @@ class Pagination_Test(TestCase):
         for i in range(15):
             Book.objects.create(
                 title=f"Book {i}",
-                author=f"Author {i}",
+                author=author(f"Author {i}"),
                 publicationYear=2000 + i,
-                genre="Test Genre"
+                genre=genre("Test Genre")
             )
 
     def test_pagination_structure(self):
@@ -242,3 +283,1578 @@ class Pagination_Test(TestCase):
         # Ensure the second page is retrieved
         self.assertTrue(response.data['results'])
         self.assertEqual(len(response.data['results']), 5)  # Check for 5 items on the second page
+
+    def test_count_false_omits_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-c'), {'count': 'false'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertNotIn('count_is_estimate', response.data)
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries))
+
+        # The extra row fetched with the page still finds the next page, and where the pages end
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        response = self.client.get(reverse('book-c'), {'count': 'false', 'page': 3})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @shared_cache
+    def test_exact_count_is_cached_until_a_write(self):
+        self.assertEqual(self.client.get(reverse('book-c'), {'ordering': 'id'}).data['count'], 15)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-c'), {'ordering': '-id'})  # Same rows, another page cache entry
+        self.assertEqual(response.data['count'], 15)
+        self.assertFalse(response.data['count_is_estimate'])
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries))
+
+        Book.objects.create(title="Book 15", author=author("Author 15"), publicationYear=2015, genre=genre("Test Genre"))
+        self.assertEqual(self.client.get(reverse('book-c'), {'ordering': '-id'}).data['count'], 16)
+        self.assertEqual(self.client.get(reverse('book-c'), {'genre': 'Test Genre'}).data['count'], 16)
+
+    @override_settings(BOOKS_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_estimated_count(self):
+        # No statistics yet, so the count is exact
+        response = self.client.get(reverse('book-c'), {'count': 'estimate'})
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (15, False))
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Book.objects.create(title="Book 15", author=author("Author 15"), publicationYear=2015, genre=genre("Test Genre"))
+        response = self.client.get(reverse('book-c'), {'count': 'estimate'})
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (15, True))  # As of ANALYZE
+        self.assertEqual(len(response.data['results']), 10)
+
+        # Estimates below the threshold, and filtered lists on SQLite, are counted exactly
+        with override_settings(BOOKS_COUNT_ESTIMATE_THRESHOLD=1000):
+            response = self.client.get(reverse('book-c'), {'count': 'estimate', 'page_size': 10})  # Not the cached page
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (16, False))
+        response = self.client.get(reverse('book-c'), {'count': 'estimate', 'genre': 'Test Genre'})
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (16, False))
+
+    def test_last_page_and_invalid_parameters(self):
+        response = self.client.get(reverse('book-c'), {'page': 'last', 'count': 'false'})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(self.client.get(reverse('book-c'), {'page': 0}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('book-c'), {'page': 'x'}).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('book-c'), {'count': 'maybe'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('count', response.data)
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')            # Set the token in the HTTP header
+
+        # Create 15 books, several sharing a title and author so the id tie-breaker is exercised
+        for i in range(15):
+            Book.objects.create(
+                title=f"Book {i % 5}",
+                author=author(f"Author {i % 2}"),
+                publicationYear=2000 + i,
+                genre=genre("Test Genre")
+            )
+
+    def walk_forward(self, page_size):
+        ids = []
+        url = reverse('book-c') + f'?cursor=&page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(book['id'] for book in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_cursor_structure(self):
+        response = self.client.get(reverse('book-c'), {'cursor': ''})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Cursor pages carry no count and no previous link on the first page
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_cursor_walks_whole_table_in_order(self):
+        expected = list(Book.objects.order_by('title', 'author', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk_forward(4), expected)
+
+    def test_cursor_previous_page(self):
+        first = self.client.get(reverse('book-c'), {'cursor': '', 'page_size': 4})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.status_code, status.HTTP_200_OK)
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_cursor_skips_count_query(self):
+        first = self.client.get(reverse('book-c'), {'cursor': '', 'page_size': 4})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data['next'])
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('book-c'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BookFilterTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')            # Set the token in the HTTP header
+
+        Book.objects.create(title="Dune", author=author("Frank Herbert"), publicationYear=1965, genre=genre("Sci-Fi"))
+        Book.objects.create(title="Dune Messiah", author=author("Frank Herbert"), publicationYear=1969, genre=genre("Sci-Fi"))
+        Book.objects.create(title="Neuromancer", author=author("William Gibson"), publicationYear=1984, genre=genre("Sci-Fi"))
+        Book.objects.create(title="Emma", author=author("Jane Austen"), publicationYear=1815, genre=genre("Romance"))
+
+    def titles(self, params):
+        response = self.client.get(reverse('book-c'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['title'] for book in response.data['results']]
+
+    def test_filter_by_author(self):
+        self.assertEqual(self.titles({'author': 'Frank Herbert'}), ['Dune', 'Dune Messiah'])
+
+    def test_filter_by_genre_and_year_range(self):
+        self.assertEqual(self.titles({'genre': 'Sci-Fi', 'year_min': 1966, 'year_max': 1990}), ['Dune Messiah', 'Neuromancer'])
+
+    def test_title_prefix_search_is_case_insensitive(self):
+        self.assertEqual(self.titles({'search': 'dune'}), ['Dune', 'Dune Messiah'])
+        self.assertEqual(self.titles({'search': 'dune m'}), ['Dune Messiah'])
+
+    def test_title_prefix_search_folds_non_ascii(self):
+        Book.objects.create(title="Élan Vital", author=author("Henri Bergson"), publicationYear=1907, genre=genre("Philosophy"))
+        Book.objects.create(title="Straße", author=author("Unknown"), publicationYear=1950, genre=genre("Drama"))
+        self.assertEqual(self.titles({'search': 'él'}), ['Élan Vital'])
+        self.assertEqual(self.titles({'search': 'ÉLAN'}), ['Élan Vital'])
+        self.assertEqual(self.titles({'search': 'STRASS'}), ['Straße'])
+
+    def test_ordering(self):
+        self.assertEqual(self.titles({'ordering': '-publicationYear'}), ['Neuromancer', 'Dune Messiah', 'Dune', 'Emma'])
+
+    def test_ordering_outside_whitelist_is_ignored(self):
+        self.assertEqual(self.titles({'ordering': 'password'}), ['Dune', 'Dune Messiah', 'Emma', 'Neuromancer'])
+
+    def test_invalid_year(self):
+        response = self.client.get(reverse('book-c'), {'year_min': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cursor_rejects_ordering(self):
+        response = self.client.get(reverse('book-c'), {'cursor': '', 'ordering': 'genre'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cursor_with_filter(self):
+        self.assertEqual(self.titles({'cursor': '', 'author': 'Frank Herbert', 'page_size': 1}), ['Dune'])
+
+
+class BookSearchTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')            # Set the token in the HTTP header
+
+        self.dune = Book.objects.create(title="Dune", author=author("Frank Herbert"), publicationYear=1965, genre=genre("Sci-Fi"))
+        Book.objects.create(title="The Dune Encyclopedia", author=author("Willis McNelly"), publicationYear=1984, genre=genre("Reference"))
+        Book.objects.create(title="Emma", author=author("Jane Austen"), publicationYear=1815, genre=genre("Romance"))
+
+    def titles(self, query):
+        response = self.client.get(reverse('book-search'), {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['title'] for book in response.data['results']]
+
+    def test_search_ranks_title_matches(self):
+        self.assertEqual(self.titles('dune'), ['Dune', 'The Dune Encyclopedia'])
+
+    def test_search_matches_author_and_genre_prefixes(self):
+        self.assertEqual(self.titles('herb'), ['Dune'])
+        self.assertEqual(self.titles('romance austen'), ['Emma'])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.dune.title = "Children of Dune"
+        self.dune.save()
+        self.assertIn('Children of Dune', self.titles('children'))
+
+        self.dune.delete()
+        self.assertEqual(self.titles('herbert'), [])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.titles('"dune" OR NEAR(*'), [])
+        self.assertEqual(self.titles('dune)'), ['Dune', 'The Dune Encyclopedia'])
+
+    def test_search_folds_non_ascii(self):
+        Book.objects.create(title="Élan Vital", author=author("Henri Bergson"), publicationYear=1907, genre=genre("Philosophy"))
+        self.assertEqual(self.titles('ÉLAN'), ['Élan Vital'])
+        self.assertEqual(self.titles('él'), ['Élan Vital'])
+
+    def test_search_requires_query(self):
+        response = self.client.get(reverse('book-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_search_index_command(self):
+        # Rows written without signals are only searchable after a rebuild
+        Book.objects.filter(title="Emma").update(title="Neuromancer")
+        self.assertEqual(self.titles('neuromancer'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.titles('neuromancer'), ['Neuromancer'])
+
+
+class BookBulkTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')            # Set the token in the HTTP header
+
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2023, genre=genre("Test"))
+
+    def test_bulk_create_and_update(self):
+        data = [
+            {"title": "DEF", "author": "Author456", "publicationYear": 2020, "genre": "Test"},
+            {"id": self.book.id, "title": "ABC (2nd edition)", "author": "Author123", "publicationYear": 2024, "genre": "Test"},
+        ]
+        response = self.client.post(reverse('book-bulk'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 0))
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 200])
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(Book.objects.get(id=self.book.id).title, "ABC (2nd edition)")
+        self.assertTrue(Book.objects.filter(id=response.data['results'][0]['data']['id'], title="DEF").exists())
+
+    def test_bulk_reports_item_errors(self):
+        data = [
+            {"title": "DEF", "author": "Author456", "publicationYear": 2020, "genre": "Test"},
+            {"title": "GHI", "author": "Author789", "publicationYear": -1, "genre": "Test"},
+            {"id": 999999, "title": "JKL", "author": "Author0", "publicationYear": 2020, "genre": "Test"},
+        ]
+        response = self.client.post(reverse('book-bulk'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 400, 404])
+        self.assertIn('publicationYear', response.data['results'][1]['errors'])
+        self.assertEqual(Book.objects.count(), 2)  # Only the valid item was written
+
+    def test_bulk_rejects_malformed_batches(self):
+        response = self.client.post(reverse('book-bulk'), {"title": "Not a list"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        too_many = [{"title": "T", "author": "A", "publicationYear": 2020, "genre": "G"}] * 1001
+        response = self.client.post(reverse('book-bulk'), too_many, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_bulk_create_uses_single_insert(self):
+        data = [{"title": f"Book {i}", "author": "Author", "publicationYear": 2000, "genre": "Test"} for i in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('book-bulk'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "api_book"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_bulk_writes_are_searchable(self):
+        data = [{"title": "Neuromancer", "author": "William Gibson", "publicationYear": 1984, "genre": "Sci-Fi"}]
+        self.client.post(reverse('book-bulk'), data, format='json')
+        response = self.client.get(reverse('book-search'), {'q': 'gibson'})
+        self.assertEqual([book['title'] for book in response.data['results']], ['Neuromancer'])
+
+    def test_bulk_delete(self):
+        other = Book.objects.create(title="DEF", author=author("Author456"), publicationYear=2020, genre=genre("Test"))
+        response = self.client.delete(reverse('book-bulk'), [self.book.id, 999999], format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['deleted'], 1)
+        self.assertEqual([result['status'] for result in response.data['results']], [204, 404])
+        self.assertEqual(list(Book.objects.values_list('id', flat=True)), [other.id])
+
+
+class BookExportTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')            # Set the token in the HTTP header
+
+        Book.objects.bulk_create([  # More than one chunk
+            Book(title=f"Book {i}", author=author(f"Author {i % 3}"), publicationYear=2000, genre=genre("Test")) for i in range(1200)
+        ])
+        Book.objects.create(title='Quoted, "title"', author=author("Ünicode"), publicationYear=None, genre=genre("Test"))
+
+    def export(self, params):
+        response = self.client.get(reverse('book-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        response, body = self.export({'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 1201)
+
+        # Each line has the same shape as the BookSerializer output
+        book = Book.objects.get(author=author("Ünicode"))
+        self.assertEqual(rows[-1], BookSerializer(book).data)
+
+    def test_export_csv(self):
+        response, body = self.export({'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(rows[0], ['id', 'title', 'author', 'publicationYear', 'genre'])
+        self.assertEqual(len(rows), 1202)
+        self.assertEqual(rows[-1][1:], ['Quoted, "title"', 'Ünicode', '', 'Test'])
+
+    def test_export_applies_filters(self):
+        _, body = self.export({'format': 'ndjson', 'author': 'Author 1'})
+        self.assertEqual(len(body.splitlines()), 400)
+
+    def test_export_does_not_build_models(self):
+        with mock.patch.object(Book, '__init__') as book_init:
+            self.export({'format': 'csv'})
+        book_init.assert_not_called()
+
+    def test_export_streams_under_asgi(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(User.objects.get())}'}
+
+        async def export():
+            response = await AsyncClient().get(reverse('book-export'), {'format': 'ndjson'}, headers=headers)
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+        with warnings.catch_warnings():
+            # Django warns when it has to read a sync iterator into a list before sending it
+            warnings.filterwarnings('error', 'StreamingHttpResponse must consume synchronous iterators')
+            response, body = async_to_sync(export)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(body.splitlines()), 1201)
+
+    def test_export_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.get(reverse('book-export'), {'format': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ImportBooksCommandTest(TestCase):
+    def write_file(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def import_books(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_csv(self):
+        path = self.write_file('.csv', (
+            "title,author,publicationYear,genre\n"
+            "Dune,Frank Herbert,1965,Sci-Fi\n"
+            "Emma,Jane Austen,,Romance\n"
+            ",No Title,2000,Test\n"
+            f"Future,Someone,{dt.now().year + 1},Test\n"
+        ))
+        stdout, stderr = self.import_books(path, '--chunk-size', '1')
+
+        self.assertIn('Imported 2 books, skipped 2 invalid rows.', stdout)
+        self.assertIn('Line 4: title', stderr)
+        self.assertIn('Line 5: publicationYear: Publication year cannot be in the future', stderr)
+        self.assertEqual(list(Book.objects.values_list('title', 'publicationYear')), [('Dune', 1965), ('Emma', None)])
+        self.assertEqual(list(Book.objects.values_list('title_folded', flat=True)), ['dune', 'emma'])
+
+    def test_import_ndjson_through_orm(self):
+        path = self.write_file('.ndjson', (
+            '{"title": "Dune", "author": "Frank Herbert", "publicationYear": 1965, "genre": "Sci-Fi"}\n'
+            '\n'
+            'not json\n'
+            '{"title": "Emma", "author": "Jane Austen", "publicationYear": 0, "genre": "Romance"}\n'
+        ))
+        stdout, stderr = self.import_books(path, '--no-fast-path')
+
+        self.assertIn('Imported 1 books, skipped 2 invalid rows.', stdout)
+        self.assertIn('Line 3: not a JSON object.', stderr)
+        self.assertIn('Line 4: publicationYear: Publication year cannot be less than 1', stderr)
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Dune'])
+        self.assertEqual(list(Book.objects.values_list('title_folded', flat=True)), ['dune'])
+
+    def test_import_resume_offset(self):
+        path = self.write_file('.csv', "title,author,publicationYear,genre\n" + "".join(
+            f"Book {i},Author,2000,Test\n" for i in range(10)
+        ))
+        stdout, _ = self.import_books(path, '--skip', '7')
+        self.assertIn('Resume with --skip 10.', stdout)
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Book 7', 'Book 8', 'Book 9'])
+
+    def test_fast_path_import_is_searchable(self):
+        path = self.write_file('.csv', "title,author,publicationYear,genre\nNeuromancer,William Gibson,1984,Sci-Fi\n")
+        self.import_books(path)
+        self.assertEqual([book.title for book in search.search_books('gibson')[0:10]], ['Neuromancer'])
+
+    def test_fast_path_import_is_logged(self):
+        path = self.write_file('.csv', "title,author,publicationYear,genre\nDune,Frank Herbert,1965,Sci-Fi\nEmma,Jane Austen,,Romance\n")
+        self.import_books(path, '--chunk-size', '1')
+        self.assertEqual(list(BookChange.objects.order_by('id').values_list('book_id', 'action')),
+                         [(book.id, 'create') for book in Book.objects.order_by('id')])
+
+    def test_fast_path_import_updates_only_its_books(self):
+        Book.objects.create(title="Emma", author=author("Jane Austen"), publicationYear=1815, genre=genre("Romance"))
+        path = self.write_file('.csv', "title,author,publicationYear,genre\nDune,Frank Herbert,1965,Sci-Fi\nEmma 2,Jane Austen,1816,Romance\n")
+        with CaptureQueriesContext(connection) as queries:
+            self.import_books(path, '--chunk-size', '1')
+        self.assertEqual(stats.check(), [])
+        self.assertEqual([book.title for book in search.search_books('austen')[0:10]], ['Emma', 'Emma 2'])
+        # Added to, not rebuilt: neither the index nor the stats table was emptied
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertNotIn('DELETE FROM api_book_fts', sql)
+        self.assertFalse(any(statement.startswith('DELETE FROM "api_bookstat"') for statement in sql))
+
+    def test_import_warns_when_it_cannot_invalidate_the_web_cache(self):
+        path = self.write_file('.csv', "title,author,publicationYear,genre\nDune,Frank Herbert,1965,Sci-Fi\n")
+        # The memory cache is not shared by default, so there is nothing the import could leave stale
+        self.assertNotIn('REDIS_URL', self.import_books(path)[1])
+        with shared_cache:
+            self.assertIn('REDIS_URL or DJANGO_CACHE_DIR', self.import_books(path)[1])
+
+    def test_import_requires_known_format(self):
+        path = self.write_file('.txt', "title,author,publicationYear,genre\n")
+        with self.assertRaises(CommandError):
+            self.import_books(path)
+
+
+@shared_cache
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')            # Set the token in the HTTP header
+
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2023, genre=genre("Test"))
+        caches['default'].clear()
+
+    def assertServedFromCache(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries.captured_queries if 'api_book' in query['sql']])
+        return response
+
+    def test_list_and_detail_are_cached(self):
+        self.client.get(reverse('book-c'), {'page_size': 5, 'genre': 'Test'})
+        self.client.get(reverse('book-rud', kwargs={'pk': self.book.id}))
+
+        # Same parameters in a different order hit the same entry
+        response = self.assertServedFromCache(reverse('book-c'), {'genre': 'Test', 'page_size': 5})
+        self.assertEqual(response.data['results'][0]['title'], 'ABC')
+        response = self.assertServedFromCache(reverse('book-rud', kwargs={'pk': self.book.id}))
+        self.assertEqual(response.data['title'], 'ABC')
+
+        self.assertEqual(self.client.get(reverse('cache-stats')).data, {'hits': 2, 'misses': 2, 'hit_ratio': 0.5})
+
+    def test_writes_invalidate_cached_pages(self):
+        self.client.get(reverse('book-c'))
+        self.client.get(reverse('book-rud', kwargs={'pk': self.book.id}))
+
+        self.client.put(reverse('book-rud', kwargs={'pk': self.book.id}),
+                        {'title': 'Updated', 'author': 'Author123', 'publicationYear': 2023, 'genre': 'Test'})
+        self.assertEqual(self.client.get(reverse('book-c')).data['results'][0]['title'], 'Updated')
+        self.assertEqual(self.client.get(reverse('book-rud', kwargs={'pk': self.book.id})).data['title'], 'Updated')
+
+        self.client.post(reverse('book-bulk'), [{'title': 'New', 'author': 'A', 'publicationYear': 2000, 'genre': 'Test'}], format='json')
+        self.assertEqual(self.client.get(reverse('book-c')).data['count'], 2)
+
+        self.client.delete(reverse('book-rud', kwargs={'pk': self.book.id}))
+        self.assertEqual(self.client.get(reverse('book-rud', kwargs={'pk': self.book.id})).status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(BOOKS_CACHE_SHARED=False)
+    def test_nothing_is_cached_when_the_cache_is_not_shared(self):
+        list_url, detail_url = reverse('book-c'), reverse('book-rud', kwargs={'pk': self.book.id})
+        self.client.get(list_url)
+        self.client.get(detail_url)
+        # Like a write through another worker, whose invalidation this process's own cache would never see
+        Book.objects.filter(pk=self.book.id).update(title='Elsewhere')
+
+        response = self.client.get(list_url)
+        self.assertEqual(response.data['results'][0]['title'], 'Elsewhere')
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data['title'], 'Elsewhere')
+        self.assertEqual(response['ETag'], self.book.etag)  # Read from the row each time
+
+    def test_commit_invalidates_pages_read_during_the_write(self):
+        # A page cached while a write is still uncommitted must not outlive the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Updated'
+            self.book.save()
+            self.client.get(reverse('book-rud', kwargs={'pk': self.book.id}))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('book-rud', kwargs={'pk': self.book.id}))
+        self.assertTrue([query for query in queries.captured_queries if 'api_book' in query['sql']])
+
+    @override_settings(BOOKS_READ_REPLICAS=['default'])  # The primary stands in for a replica
+    def test_replica_reads_are_not_cached(self):
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(User.objects.create_user(username="other"))}')
+        list_url, detail_url = reverse('book-c'), reverse('book-rud', kwargs={'pk': self.book.id})
+        self.client.patch(detail_url, {'title': 'Updated'})  # Pins this client to the primary
+
+        # Another client reads through a replica that has not replayed the write yet
+        with transaction.atomic():
+            Book.objects.filter(pk=self.book.id).update(title='ABC', version=self.book.version)
+            stale_list, stale_detail = other.get(list_url), other.get(detail_url)
+            transaction.set_rollback(True)
+        self.assertEqual(stale_list.data['results'][0]['title'], 'ABC')
+        self.assertNotIn('ETag', stale_list)                     # Not the current generation's
+        self.assertEqual(stale_detail['ETag'], self.book.etag)  # The version it was built from
+
+        self.assertEqual(self.client.get(list_url).data['results'][0]['title'], 'Updated')
+        self.assertEqual(self.client.get(detail_url).data['title'], 'Updated')
+
+    def test_cache_still_requires_authentication(self):
+        self.client.get(reverse('book-c'))
+        self.client.credentials()
+        self.assertEqual(self.client.get(reverse('book-c')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(BOOKS_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.client.get(reverse('book-c'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('book-c'))
+        self.assertTrue([query for query in queries.captured_queries if 'api_book' in query['sql']])
+
+
+@shared_cache
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')            # Set the token in the HTTP header
+
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2023, genre=genre("Test"))
+        self.url = reverse('book-rud', kwargs={'pk': self.book.id})
+        self.update_data = {'title': 'Updated', 'author': 'Author123', 'publicationYear': 2023, 'genre': 'Test'}
+
+    def test_version_and_updated_at_follow_saves(self):
+        updated_at = self.book.updated_at
+        self.assertEqual(self.book.version, 1)
+        self.book.title = 'Changed'
+        self.book.save(update_fields=['title'])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.version, 2)
+        self.assertGreater(self.book.updated_at, updated_at)
+
+    def test_detail_etag_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], f'"{self.book.id}-1"')
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        self.client.put(self.url, self.update_data)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.book.id}-1"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{self.book.id}-2"')
+
+    @override_settings(BOOKS_CACHE_SHARED=False)
+    def test_uncached_detail_is_one_query(self):
+        for headers in ({}, {'HTTP_IF_NONE_MATCH': self.book.etag}):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, **headers)
+            self.assertEqual(response['ETag'], self.book.etag)
+            self.assertEqual(len([query for query in queries.captured_queries if 'api_book' in query['sql']]), 1)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(reverse('book-rud', kwargs={'pk': 999})).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 2015 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_etag_changes_on_write(self):
+        etag = self.client.get(reverse('book-c'))['ETag']
+        response = self.client.get(reverse('book-c'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(reverse('book-c'), {'page': 1})['ETag'], etag)
+
+        Book.objects.create(title="DEF", author=author("Author456"), publicationYear=2020, genre=genre("Test"))
+        response = self.client.get(reverse('book-c'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_if_match_optimistic_concurrency(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.put(self.url, self.update_data, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{self.book.id}-2"')
+
+        # A second writer still holding the old ETag is turned away
+        response = self.client.patch(self.url, {'title': 'Lost update'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(self.url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Book.objects.get(id=self.book.id).title, 'Updated')
+
+    def test_bulk_update_bumps_version(self):
+        data = [{'id': self.book.id, **self.update_data}]
+        self.client.post(reverse('book-bulk'), data, format='json')
+        self.assertEqual(Book.objects.get(id=self.book.id).version, 2)
+
+
+class StatelessAuthenticationTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(self.user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')                 # Set the token in the HTTP header
+        caches['default'].clear()
+
+    def user_queries(self, method, url, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, *args, **kwargs)
+        return response, [query for query in queries.captured_queries if 'auth_user' in query['sql']]
+
+    def test_reads_skip_user_lookup(self):
+        self.client.get(reverse('book-c'))  # Caches the user's active status
+        response, queries = self.user_queries('get', reverse('book-c'), {'page': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+
+    def test_writes_load_the_user(self):
+        data = {"title": "DEF", "author": "Author456", "publicationYear": 2023, "genre": "Test"}
+        response, queries = self.user_queries('post', reverse('book-c'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(queries), 1)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('book-c')).status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('book-c')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected(self):
+        User.objects.filter(id=self.user.id).delete()
+        self.assertEqual(self.client.get(reverse('book-c')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(BOOKS_AUTH_ACTIVE_TTL=None)
+    def test_active_check_can_be_disabled(self):
+        response, queries = self.user_queries('get', reverse('book-c'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(self.user)                                       # Generate an access token for the user
+        self.header = f'Bearer {access_token}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.header)                              # Set the token in the HTTP header
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2022, genre=genre("Test"))
+        Book.objects.create(title="DEF", author=author("Author456"), publicationYear=2021, genre=genre("Test"))
+        caches['default'].clear()
+
+    def call(self, view_class, method, path, data=None, view_kwargs=None, **extra):
+        request = getattr(self.factory, method)(path, data, format='json', HTTP_AUTHORIZATION=self.header, **extra)
+        return async_to_sync(view_class.as_view())(request, **(view_kwargs or {}))
+
+    @shared_cache
+    def test_list_matches_sync_view(self):
+        for query in ('', '?page_size=1&page=2', '?ordering=-publicationYear', '?author=Author456', '?cursor=',
+                      '?count=false&page_size=1', '?count=estimate', '?page=last&page_size=1'):
+            path = reverse('book-c') + query
+            expected = self.client.get(path)
+            response = self.call(async_views.AsyncBookCView, 'get', path)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['ETag'], expected['ETag'])
+
+    def test_detail_matches_sync_view(self):
+        path = reverse('book-rud', kwargs={'pk': self.book.id})
+        expected = self.client.get(path)
+        response = self.call(async_views.AsyncBookRUDView, 'get', path, view_kwargs={'pk': self.book.id})
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], self.book.etag)
+
+        response = self.call(async_views.AsyncBookRUDView, 'get', path, view_kwargs={'pk': self.book.id},
+                             HTTP_IF_NONE_MATCH=self.book.etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_missing_book(self):
+        response = self.call(async_views.AsyncBookRUDView, 'get', '/api/books/999/', view_kwargs={'pk': 999})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, {'detail': 'Not found.'})
+
+    def test_unauthenticated_request(self):
+        self.header = 'Bearer invalid'
+        response = self.call(async_views.AsyncBookCView, 'get', reverse('book-c'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('WWW-Authenticate', response)
+
+    def test_create(self):
+        data = {"title": "GHI", "author": "Author789", "publicationYear": 2020, "genre": "Test"}
+        response = self.call(async_views.AsyncBookCView, 'post', reverse('book-c'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, BookSerializer(Book.objects.get(title='GHI')).data)
+
+        response = self.call(async_views.AsyncBookCView, 'post', reverse('book-c'), {**data, 'publicationYear': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_and_delete_honour_if_match(self):
+        path = reverse('book-rud', kwargs={'pk': self.book.id})
+        data = {"title": "Updated", "author": "Author123", "publicationYear": 2022, "genre": "Test"}
+        response = self.call(async_views.AsyncBookRUDView, 'put', path, data, view_kwargs={'pk': self.book.id},
+                             HTTP_IF_MATCH=self.book.etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, 'Updated')
+        self.assertEqual(response['ETag'], self.book.etag)
+
+        response = self.call(async_views.AsyncBookRUDView, 'delete', path, view_kwargs={'pk': self.book.id},
+                             HTTP_IF_MATCH='"%d-1"' % self.book.id)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.call(async_views.AsyncBookRUDView, 'delete', path, view_kwargs={'pk': self.book.id})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Book.objects.filter(id=self.book.id).exists())
+
+
+class FastSerializerTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(self.user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')                 # Set the token in the HTTP header
+        Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2022, genre=genre("Test"))
+        Book.objects.create(title="Ünïcode \u2028 \"quoted\"", author=author("Åuthor"), publicationYear=None, genre=genre(""))
+        caches['default'].clear()
+
+    def test_matches_book_serializer(self):
+        rows = Book.objects.values_list(*BookFastSerializer.columns, named=True)
+        self.assertEqual(BookFastSerializer(rows, many=True).data, BookSerializer(Book.objects.all(), many=True).data)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {'results': BookSerializer(Book.objects.all(), many=True).data, 'next': None, 'count': 2}
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_list_response_is_unchanged(self):
+        response = self.client.get(reverse('book-c'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = {'count': 2, 'count_is_estimate': False, 'next': None, 'previous': None,
+                    'results': BookSerializer(Book.objects.all(), many=True).data}
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_writes_still_use_book_serializer(self):
+        data = {"title": "DEF", "author": "Author456", "publicationYear": dt.today().year + 1, "genre": "Test"}
+        response = self.client.post(reverse('book-c'), data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('publicationYear', response.data)
+
+
+class BookStatsTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(self.user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')                 # Set the token in the HTTP header
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=1994, genre=genre("Fiction"))
+        Book.objects.create(title="DEF", author=author("Author123"), publicationYear=2001, genre=genre("Fiction"))
+        Book.objects.create(title="GHI", author=author("Author456"), publicationYear=None, genre=genre("Poetry"))
+        caches['default'].clear()
+
+    def test_stats(self):
+        self.client.get(reverse('cache-stats'))  # Caches the user's active status
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'total': 3,
+            'genres': [{'genre': 'Fiction', 'count': 2}, {'genre': 'Poetry', 'count': 1}],
+            'authors': [{'author': 'Author123', 'count': 2}, {'author': 'Author456', 'count': 1}],
+            'decades': [{'decade': 1990, 'count': 1}, {'decade': 2000, 'count': 1}, {'decade': None, 'count': 1}],
+        })
+        self.assertEqual(len(queries), 3)  # The groups, then the genre and author names; none over the books
+
+    def test_writes_update_the_counts(self):
+        data = {"title": "ABC", "author": "Author789", "publicationYear": 2005, "genre": "Poetry"}
+        self.client.put(reverse('book-rud', kwargs={'pk': self.book.id}), data)
+        Book(id=self.book.id, title="ABC", author=author("Author789"), publicationYear=2006, genre=genre("Drama")).save()
+        self.client.delete(reverse('book-rud', kwargs={'pk': Book.objects.get(title="GHI").id}))
+        self.client.post(reverse('book-bulk'), [
+            {"title": "JKL", "author": "Author123", "publicationYear": 1999, "genre": "Fiction"},
+            {"id": self.book.id, "title": "ABC", "author": "Author123", "publicationYear": 1994, "genre": "Fiction"},
+        ], format='json')
+
+        self.assertEqual(stats.check(), [])
+        response = self.client.get(reverse('book-stats'))
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(response.data['genres'], [{'genre': 'Fiction', 'count': 3}])
+        self.assertEqual(response.data['decades'], [{'decade': 1990, 'count': 2}, {'decade': 2000, 'count': 1}])
+
+    def test_check_and_rebuild(self):
+        poetry, drama = genre('Poetry'), genre('Drama')
+        Book.objects.filter(genre=poetry).update(genre=drama)  # Skips the signals
+        self.assertEqual(stats.check(), sorted([('genre', str(drama.id), 0, 1), ('genre', str(poetry.id), 1, 0)]))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_book_stats', '--check', stdout=StringIO())
+
+        call_command('rebuild_book_stats', stdout=StringIO())
+        self.assertEqual(stats.check(), [])
+        self.assertIn({'genre': 'Drama', 'count': 1}, self.client.get(reverse('book-stats')).data['genres'])
+
+
+@override_settings(BOOKS_READ_REPLICAS=['replica_a', 'replica_b'], BOOKS_REPLICA_SELECTION='round_robin')
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+
+        self.factory = RequestFactory()
+        self.middleware = routers.ReplicaRoutingMiddleware(lambda request: router.db_for_read(Book))
+        routers._rotations.clear()
+        routers._health.clear()
+        caches['default'].clear()
+
+    def route(self, method, token='token-a'):
+        return self.middleware(getattr(self.factory, method)(reverse('book-c'), HTTP_AUTHORIZATION=token))
+
+    def test_reads_rotate_through_replicas(self):
+        self.assertEqual([self.route('get') for _ in range(3)], ['replica_a', 'replica_b', 'replica_a'])
+        self.assertEqual(router.db_for_read(Book), 'default')  # Outside a request
+        self.assertEqual(router.db_for_write(Book), 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.assertEqual(self.route('post'), 'default')
+        self.assertEqual(self.route('get'), 'default')             # Read-your-writes
+        self.assertEqual(self.route('get', 'token-b'), 'replica_a')  # Other clients are not pinned
+        caches['default'].delete(routers.client_key(self.factory.get('/', HTTP_AUTHORIZATION='token-a')))
+        self.assertEqual(self.route('get'), 'replica_b')           # Pin expired
+
+    @override_settings(BOOKS_REPLICA_SELECTION='health')
+    def test_health_selection_skips_failing_replicas(self):
+        with mock.patch('api.routers.is_healthy', side_effect=lambda alias: alias == 'replica_b'):
+            self.assertEqual([self.route('get') for _ in range(2)], ['replica_b', 'replica_b'])
+        with mock.patch('api.routers.is_healthy', return_value=False):
+            self.assertEqual(self.route('get'), 'default')
+
+    def test_instances_read_from_a_replica_are_saved_to_the_primary(self):
+        book = Book(title="ABC", author=author("Author123"), publicationYear=2022, genre=genre("Test"))
+        book._state.db = 'replica_a'
+        self.assertEqual(router.db_for_write(Book, instance=book), 'default')
+
+    @override_settings(BOOKS_READ_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.route('get'), 'default')
+
+
+class SQLiteProfileTest(TestCase):
+    def test_connection_options_are_applied(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')   # Create a test user
+        access_token = AccessToken.for_user(self.user)                                       # Generate an access token for the user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')                 # Set the token in the HTTP header
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2022, genre=genre("Test"))
+        caches['default'].clear()
+        metrics.registry.reset()
+
+    def test_book_routes_are_recorded(self):
+        self.client.get(reverse('book-c'))
+        self.client.get(reverse('book-c'))
+        self.client.get(reverse('book-rud', kwargs={'pk': 999}))
+        self.client.get(reverse('health'))  # Not in BOOKS_METRICS_ROUTES
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('books_http_requests_total{route="book-c",method="GET",status="200"} 2', text)
+        self.assertIn('books_http_requests_total{route="book-rud",method="GET",status="404"} 1', text)
+        self.assertIn('books_http_request_duration_seconds_count{route="book-c",method="GET"} 2', text)
+        self.assertIn('books_db_queries_per_request_bucket{route="book-c",method="GET",le="+Inf"} 2', text)
+        self.assertNotIn('route="health"', text)
+
+        totals = metrics.registry.totals
+        self.assertGreater(totals['books_db_queries_total']['book-c', 'GET'], 0)
+        self.assertGreater(totals['books_serializer_duration_seconds_total']['book-c', 'GET'], 0)
+        self.assertGreater(metrics.registry.histograms['books_http_response_size_bytes']['book-c', 'GET'].sum, 0)
+
+    def test_query_count_per_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('book-c'))
+        histogram = metrics.registry.histograms['books_db_queries_per_request']['book-c', 'GET']
+        self.assertEqual(histogram.sum, len(queries.captured_queries))
+
+    @override_settings(BOOKS_SLOW_REQUEST_MS=0)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs('api.slow_requests', level='WARNING') as logs:
+            self.client.get(reverse('book-rud', kwargs={'pk': self.book.id}))
+        self.assertIn('Slow request: GET /api/books/%d/ -> 200' % self.book.id, logs.output[0])
+        self.assertIn('FROM "api_book"', logs.output[0])
+
+    def test_metrics_of_every_worker_are_added_up(self):
+        # Another worker's metrics, as it writes them to BOOKS_METRICS_DIR
+        other = metrics.Registry()
+        other.record('book-c', 'GET', 200, 0.01, metrics.RequestMetrics(keep_sql=False), 100000)
+        with tempfile.TemporaryDirectory() as directory, override_settings(BOOKS_METRICS_DIR=directory):
+            with open(os.path.join(directory, '0.json'), 'w') as file:
+                json.dump(other.snapshot(), file)
+            self.client.get(reverse('book-c'))
+            text = self.client.get(reverse('metrics')).content.decode()
+            self.assertEqual(sorted(os.listdir(directory)), ['0.json', '%d.json' % os.getpid()])
+        self.assertIn('books_http_requests_total{route="book-c",method="GET",status="200"} 2', text)
+        self.assertIn('books_http_request_duration_seconds_count{route="book-c",method="GET"} 2', text)
+        self.assertIn('books_http_response_size_bytes_bucket{route="book-c",method="GET",le="65536"} 1', text)
+        self.assertIn('books_http_response_size_bytes_bucket{route="book-c",method="GET",le="262144"} 2', text)
+
+    def test_async_requests_are_recorded(self):
+        # As under SERVER_MODE=asgi: without WhiteNoise the chain runs on the event loop and the queries in threads
+        middleware = [name for name in settings.MIDDLEWARE if name != 'whitenoise.middleware.WhiteNoiseMiddleware']
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+        async def get():
+            return await AsyncClient().get(reverse('book-c'), headers=headers)
+
+        with override_settings(MIDDLEWARE=middleware):
+            response = async_to_sync(get)()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = metrics.registry.totals
+        self.assertGreater(totals['books_db_queries_total']['book-c', 'GET'], 0)
+        self.assertGreater(totals['books_db_query_duration_seconds_total']['book-c', 'GET'], 0)
+
+    @override_settings(DEBUG=True)
+    def test_asgi_middleware_chain_is_not_adapted(self):
+        # As under SERVER_MODE=asgi: without WhiteNoise, no middleware makes Django run the request in a thread
+        middleware = [name for name in settings.MIDDLEWARE if name != 'whitenoise.middleware.WhiteNoiseMiddleware']
+        with override_settings(MIDDLEWARE=middleware), self.assertLogs('django.request', 'DEBUG') as logs:
+            logging.getLogger('django.request').debug('Loading middleware')
+            ASGIHandler()
+        self.assertEqual([line for line in logs.output if 'adapted' in line], [])
+
+
+class StaticFilesTest(TestCase):
+    def get(self, application, path, headers=()):
+        # One GET through an ASGI application; returns the status, the headers and the body
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async def call():
+            await application({
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'testserver'), *headers], 'server': ('testserver', 80),
+            }, receive, send)
+
+        async_to_sync(call)()
+        return messages[0]['status'], dict(messages[0]['headers']), b''.join(message.get('body', b'') for message in messages[1:])
+
+    def test_asgi_serves_collected_files_under_their_hashed_names(self):
+        storages = dict(settings.STORAGES, staticfiles={'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'})
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, STORAGES=storages, DEBUG=False):
+            call_command('collectstatic', '--noinput', verbosity=0)
+            application = StaticFilesApplication(get_asgi_application())
+            name = staticfiles_storage.stored_name('admin/css/base.css')
+            url = staticfiles_storage.url('admin/css/base.css')
+            self.assertEqual(url, '/static/' + name)
+            self.assertNotEqual(name, 'admin/css/base.css')
+
+            status_code, headers, body = self.get(application, url)
+            self.assertEqual(status_code, status.HTTP_200_OK)
+            self.assertIn(b'immutable', headers[b'cache-control'])
+            with open(staticfiles_storage.path(name), 'rb') as collected:
+                self.assertEqual(body, collected.read())
+
+            status_code, headers, body = self.get(application, url, [(b'if-none-match', headers[b'etag'])])
+            self.assertEqual((status_code, body), (status.HTTP_304_NOT_MODIFIED, b''))
+            self.assertEqual(self.get(application, reverse('health'))[0], status.HTTP_200_OK)  # Passed on to Django
+
+
+class HealthCheckTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_health_needs_no_authentication_or_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('health'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'status': 'ok'})
+        self.assertEqual(queries.captured_queries, [])
+
+    def test_ready(self):
+        response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['checks'], {'database:default': 'ok', 'cache': 'ok'})
+
+    def test_not_ready_when_cache_fails(self):
+        with mock.patch('api.cache.get_cache', side_effect=ConnectionError('refused')):
+            response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data['checks']['cache'], 'error: refused')
+
+    def test_pages_linking_static_files_render_without_collectstatic(self):
+        self.assertEqual(self.client.get('/admin/login/').status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('book-stats'), HTTP_ACCEPT='text/html')
+        self.assertContains(response, '/static/rest_framework/', status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = AccessToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        caches['default'].clear()
+
+    @shared_cache
+    def test_measure_counts_queries_through_the_client(self):
+        Book.objects.create(title='Test Book', author=author('Test Author'), publicationYear=2020, genre=genre('Test Genre'))
+        with override_settings(BOOKS_CACHE_TIMEOUT=0):
+            summary = benchmarks.measure(lambda: self.client.get(reverse('book-c')), 3, warmup=1)
+        self.assertEqual(summary['iterations'], 3)
+        self.assertEqual(summary['queries_per_op'], 1)  # The page; the count is cached after the warmup
+
+    def test_compare(self):
+        baseline = {'10000': {'GET list page 1': {'p50_ms': 2.0, 'p99_ms': 4.0, 'ops_per_sec': 400, 'queries_per_op': 2}}}
+        within = {'10000': {'GET list page 1': {'p50_ms': 2.3, 'p99_ms': 3.0, 'ops_per_sec': 350, 'queries_per_op': 2}}}
+        self.assertEqual(benchmarks.compare(baseline, within, 0.2), [])
+
+        worse = {
+            '10000': {'GET list page 1': {'p50_ms': 2.5, 'p99_ms': 4.0, 'ops_per_sec': 300, 'queries_per_op': 3}},
+            '100000': {'GET list page 1': {'p50_ms': 50.0}},  # Not in the baseline
+        }
+        self.assertEqual(benchmarks.compare(baseline, worse, 0.2), [
+            ('10000', 'GET list page 1', 'p50_ms', 2.0, 2.5),
+            ('10000', 'GET list page 1', 'ops_per_sec', 400, 300),
+            ('10000', 'GET list page 1', 'queries_per_op', 2, 3),
+        ])
+
+
+class BatchGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.header = f'Bearer {AccessToken.for_user(self.user)}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.header)
+        self.books = [Book.objects.create(title=f"Book {i}", author=author("Author"), publicationYear=2000 + i, genre=genre("Test"))
+                      for i in range(3)]
+        caches['default'].clear()
+
+    def test_get_in_request_order_with_missing_ids(self):
+        first, second, third = self.books
+        ids = [third.id, 999, first.id, third.id]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-c'), {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'results': [BookSerializer(third).data, BookSerializer(first).data],
+            'missing': [999],
+        })
+        self.assertEqual(len([query for query in queries.captured_queries if 'FROM "api_book"' in query['sql']]), 1)
+
+    @shared_cache
+    def test_post(self):
+        first, second, _ = self.books
+        response = self.client.post(reverse('book-batch'), {'ids': [second.id, first.id, 999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in response.data['results']], [second.id, first.id])
+        self.assertEqual(response.data['missing'], [999])
+
+        # Memoized until the next write
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('book-batch'), {'ids': [second.id, first.id, 999]}, format='json')
+        self.assertFalse([query for query in queries.captured_queries if 'api_book' in query['sql']])
+        second_id = second.id
+        second.delete()
+        response = self.client.post(reverse('book-batch'), {'ids': [second_id, first.id, 999]}, format='json')
+        self.assertEqual(response.data['missing'], [second_id, 999])
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get(reverse('book-c'), {'ids': '1,x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('book-c'), {'ids': ''}).status_code, status.HTTP_400_BAD_REQUEST)
+        for data in ({}, {'ids': []}, {'ids': [0]}, {'ids': list(range(1, 502))}):
+            response = self.client.post(reverse('book-batch'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('ids', response.data)
+
+    def test_async_view_matches_sync_view(self):
+        path = reverse('book-c') + '?ids=%d,999,%d' % (self.books[1].id, self.books[0].id)
+        expected = self.client.get(path)
+        request = self.factory.get(path, HTTP_AUTHORIZATION=self.header)
+        response = async_to_sync(async_views.AsyncBookCView.as_view())(request)
+        self.assertEqual(response.content, expected.content)
+
+
+class LookupTableTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        self.dune = Book.objects.create(title="Dune", author=author("Frank Herbert"), publicationYear=1965, genre=genre("Sci-Fi"))
+        Book.objects.create(title="Emma", author=author("Jane Austen"), publicationYear=1815, genre=genre("Romance"))
+        caches['default'].clear()
+
+    def test_names_are_stored_once(self):
+        data = {"title": "Dune Messiah", "author": "Frank Herbert", "publicationYear": 1969, "genre": "Sci-Fi"}
+        response = self.client.post(reverse('book-c'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'id': response.data['id'], **data})
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 2)
+        self.assertEqual(Book.objects.get(pk=response.data['id']).author, self.dune.author)
+
+        response = self.client.put(reverse('book-rud', kwargs={'pk': self.dune.id}), {**data, "author": "Brian Herbert"})
+        self.assertEqual(response.data['author'], "Brian Herbert")
+        self.assertEqual(Author.objects.count(), 3)
+
+    def test_list_is_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-c'), {'count': 'false'})
+        self.assertEqual([book['author'] for book in response.data['results']], ["Frank Herbert", "Jane Austen"])
+        self.assertEqual(len([query for query in queries.captured_queries if 'api_book' in query['sql']]), 1)
+
+    def test_authors_and_genres(self):
+        Author.objects.create(name="No Books")
+        response = self.client.get(reverse('author-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['name'] for row in response.data['results']], ["Frank Herbert", "Jane Austen"])
+        response = self.client.get(reverse('genre-list'))
+        self.assertEqual([row['name'] for row in response.data['results']], ["Romance", "Sci-Fi"])
+        self.assertEqual(self.client.get(reverse('author-list'), {'page': 2}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rename_updates_books_and_search(self):
+        self.client.get(reverse('book-rud', kwargs={'pk': self.dune.id}))  # Cached
+        frank = self.dune.author
+        frank.name = "F. Herbert"
+        frank.save()
+        self.assertEqual(self.client.get(reverse('book-rud', kwargs={'pk': self.dune.id})).data['author'], "F. Herbert")
+        self.assertEqual([book['title'] for book in self.client.get(reverse('book-search'), {'q': 'F. Herbert'}).data['results']],
+                         ["Dune"])
+
+    def test_rename_changes_book_validators(self):
+        url = reverse('book-rud', kwargs={'pk': self.dune.id})
+        etag = self.client.get(url)['ETag']
+        updated_at = self.dune.updated_at
+        genre = self.dune.genre
+        genre.name = "Science Fiction"
+        genre.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['genre'], "Science Fiction")
+        self.assertNotEqual(response['ETag'], etag)
+        self.dune.refresh_from_db()
+        self.assertGreater(self.dune.updated_at, updated_at)
+
+    def test_authors_with_books_cannot_be_deleted(self):
+        with self.assertRaises(ProtectedError):
+            self.dune.author.delete()
+
+
+class ChangeFeedTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2023, genre=genre("Test"))
+        caches['default'].clear()
+
+    def feed(self, **params):
+        response = self.client.get(reverse('book-changes'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_writes_are_logged_in_order(self):
+        data = {"title": "DEF", "author": "Author456", "publicationYear": 2020, "genre": "Test"}
+        created = self.client.post(reverse('book-c'), data).data
+        self.client.put(reverse('book-rud', kwargs={'pk': self.book.id}), {**data, "title": "ABC 2"})
+        self.client.delete(reverse('book-rud', kwargs={'pk': created['id']}))
+
+        page = self.feed()
+        self.assertEqual([(entry['action'], entry['book_id']) for entry in page['results']], [
+            ('create', self.book.id), ('create', created['id']), ('update', self.book.id), ('delete', created['id']),
+        ])
+        # Entries carry the current state of the book, not the state at the time of the entry
+        self.assertEqual(page['results'][0]['book'], BookSerializer(Book.objects.get(pk=self.book.id)).data)
+        self.assertIsNone(page['results'][1]['book'])
+        self.assertEqual(page['cursor'], page['results'][-1]['change'])
+        self.assertFalse(page['has_more'])
+        self.assertIsNone(page['next'])
+        self.assertEqual(self.feed(since=page['cursor'])['results'], [])
+        self.assertEqual(self.feed(since=page['cursor'])['cursor'], page['cursor'])
+
+    def test_keyset_paging(self):
+        Book.objects.bulk_create([Book(title=f"Book {i}", author=author("Author"), genre=genre("Test")) for i in range(4)])
+        first = self.feed(limit=2)
+        self.assertTrue(first['has_more'])
+        self.assertIn('since=%d' % first['cursor'], first['next'])
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first['next']).data
+        self.assertEqual(len([query for query in queries.captured_queries if 'api_book' in query['sql']]), 2)
+        third = self.feed(since=second['cursor'], limit=2)
+        self.assertFalse(third['has_more'])
+        changes = [entry['change'] for page in (first, second, third) for entry in page['results']]
+        self.assertEqual(changes, sorted(changes))
+        self.assertEqual(len(changes), 5)
+
+    def test_bulk_writes_are_logged(self):
+        response = self.client.post(reverse('book-bulk'), [
+            {"title": "JKL", "author": "Author123", "publicationYear": 1999, "genre": "Test"},
+            {"id": self.book.id, "title": "ABC", "author": "Author123", "publicationYear": 1994, "genre": "Test"},
+        ], format='json')
+        new_id = response.data['results'][0]['data']['id']
+        self.client.delete(reverse('book-bulk'), [new_id], format='json')
+        self.assertEqual([(entry['action'], entry['book_id']) for entry in self.feed()['results']][1:], [
+            ('create', new_id), ('update', self.book.id), ('delete', new_id),
+        ])
+
+    def test_renames_are_logged(self):
+        other = Book.objects.create(title="DEF", author=author("Author456"), publicationYear=2020, genre=genre("Test"))
+        cursor = self.feed()['cursor']
+        lookup = self.book.genre
+        lookup.name = "Renamed"
+        with mock.patch('api.signals.RENAME_BATCH_SIZE', 1), CaptureQueriesContext(connection) as queries:
+            lookup.save()
+        # One version bump for every book, then each book loaded on its own batch
+        self.assertEqual(len([query for query in queries.captured_queries if query['sql'].startswith('UPDATE "api_book"')]), 1)
+        self.assertEqual(len([query for query in queries.captured_queries if 'INNER JOIN "api_genre"' in query['sql']]), 2)
+        page = self.feed(since=cursor)
+        self.assertEqual([(entry['action'], entry['book_id']) for entry in page['results']],
+                         [('update', self.book.id), ('update', other.id)])
+        self.assertEqual([entry['book']['genre'] for entry in page['results']], ["Renamed", "Renamed"])
+
+        with self.assertRaises(ValueError), transaction.atomic():
+            lookup.name = "Gone"
+            lookup.save()
+            raise ValueError
+        self.assertEqual(self.feed(since=page['cursor'])['results'], [])
+
+    def test_rolled_back_writes_are_not_logged(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            Book.objects.create(title="Gone", author=author("Author123"), genre=genre("Test"))
+            raise ValueError
+        self.assertEqual(BookChange.objects.count(), 1)
+
+    def test_compaction_keeps_the_latest_entry_per_book(self):
+        other = Book.objects.create(title="DEF", author=author("Author456"), genre=genre("Test"))
+        other_id = other.id
+        for year in (2001, 2002):
+            self.book.publicationYear = year
+            self.book.save()
+        other.delete()
+        before = {entry['book_id']: entry['book'] for entry in self.feed()['results']}
+
+        stdout = StringIO()
+        call_command('compact_book_changes', '--batch-size', '2', stdout=stdout)
+        self.assertIn('Deleted 3 superseded', stdout.getvalue())
+        results = self.feed()['results']
+        self.assertEqual([(entry['action'], entry['book_id']) for entry in results],
+                         [('update', self.book.id), ('delete', other_id)])
+        self.assertEqual({entry['book_id']: entry['book'] for entry in results}, before)
+
+    @override_settings(BOOKS_CHANGES_SETTLE_SECONDS=60)
+    def test_recent_entries_are_held_back(self):
+        self.assertEqual(self.feed()['results'], [])
+        BookChange.objects.update(changed_at=dt(2020, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(len(self.feed()['results']), 1)
+
+    def test_invalid_parameters(self):
+        for params in ({'since': 'x'}, {'since': -1}, {'limit': 0}, {'limit': 1001}):
+            self.assertEqual(self.client.get(reverse('book-changes'), params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(BOOKS_THROTTLE_RATES={'book-c': '3/min', 'default': None})
+class ThrottleTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.header = f'Bearer {AccessToken.for_user(self.user)}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.header)
+        self.book = Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2022, genre=genre("Test"))
+        caches['default'].clear()
+
+    def test_bucket_per_user_and_route(self):
+        for page in (1, 1, 1):
+            self.assertEqual(self.client.get(reverse('book-c'), {'page': page}).status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('book-c'))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '20')  # One token refills every 20 seconds
+
+        # Other routes and other users have buckets of their own
+        self.assertEqual(self.client.get(reverse('book-rud', kwargs={'pk': self.book.id})).status_code, status.HTTP_200_OK)
+        other = User.objects.create_user(username='other', password='testpassword')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+        self.assertEqual(self.client.get(reverse('book-c')).status_code, status.HTTP_200_OK)
+
+    def test_tokens_refill(self):
+        with mock.patch('api.throttling.time.time', return_value=1000.0):
+            self.assertEqual(throttling.take('bucket', 3, 0.05, 3), (True, 0))
+            self.assertEqual(throttling.take('bucket', 3, 0.05, 1), (False, 20))
+        with mock.patch('api.throttling.time.time', return_value=1030.0):
+            self.assertEqual(throttling.take('bucket', 3, 0.05, 1), (True, 0))
+            self.assertEqual(throttling.take('bucket', 3, 0.05, 1), (False, 10))
+
+    @override_settings(BOOKS_THROTTLE_RATES={'book-c': '10/min'}, BOOKS_THROTTLE_ROWS_PER_TOKEN=100)
+    def test_large_pages_cost_more(self):
+        self.assertEqual(self.client.get(reverse('book-c'), {'page_size': 500}).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('book-c'), {'page_size': 1000}).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(reverse('book-c'), {'page_size': 100}).status_code, status.HTTP_200_OK)
+
+    @override_settings(BOOKS_THROTTLE_RATES={'token_obtain_pair': '2/min'})
+    def test_anonymous_clients_by_address(self):
+        client = APIClient()
+        codes = [client.post(reverse('token_obtain_pair'), {'username': 'testuser', 'password': 'testpassword'}).status_code
+                 for _ in range(3)]
+        self.assertEqual(codes, [status.HTTP_200_OK, status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS])
+
+    @override_settings(BOOKS_THROTTLE_RATES={'default': '1/min'})
+    def test_async_views_are_throttled(self):
+        view = async_views.AsyncBookCView.as_view()
+        codes = [async_to_sync(view)(self.factory.get(reverse('book-c'), HTTP_AUTHORIZATION=self.header)).status_code
+                 for _ in range(2)]
+        self.assertEqual(codes, [status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS])
+
+
+@override_settings(BOOKS_CACHE_TIMEOUT=0)
+class CoalescingTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.header = f'Bearer {AccessToken.for_user(self.user)}'
+        Book.objects.create(title="ABC", author=author("Author123"), publicationYear=2022, genre=genre("Test"))
+        caches['default'].clear()
+
+    def test_threads_share_one_call(self):
+        calls, release = [], threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return object()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(coalescing.run('key', compute))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)  # Let every thread reach the flight
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(result) for result, _ in results}), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True])
+        self.assertEqual(coalescing.run('key', lambda: 'again'), ('again', False))  # Finished flights are not reused
+
+    def test_errors_reach_every_waiter(self):
+        async def burst():
+            async def compute():
+                await asyncio.sleep(0.01)
+                raise ValueError('boom')
+            return await asyncio.gather(*(coalescing.arun('key', compute) for _ in range(3)), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in async_to_sync(burst)()))
+
+    def test_concurrent_identical_list_requests_query_once(self):
+        view = async_views.AsyncBookCView.as_view()
+        path = reverse('book-c') + '?count=false'
+
+        async def burst():
+            return await asyncio.gather(*(view(self.factory.get(path, HTTP_AUTHORIZATION=self.header)) for _ in range(5)))
+
+        with CaptureQueriesContext(connection) as queries:
+            responses = async_to_sync(burst)()
+        self.assertEqual({response.status_code for response in responses}, {status.HTTP_200_OK})
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertEqual(len([query for query in queries.captured_queries if 'FROM "api_book"' in query['sql']]), 1)
+
+    @override_settings(BOOKS_COALESCE_READS=False)
+    def test_can_be_turned_off(self):
+        view = async_views.AsyncBookCView.as_view()
+        path = reverse('book-c') + '?count=false'
+
+        async def burst():
+            return await asyncio.gather(*(view(self.factory.get(path, HTTP_AUTHORIZATION=self.header)) for _ in range(3)))
+
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(burst)()
+        self.assertEqual(len([query for query in queries.captured_queries if 'FROM "api_book"' in query['sql']]), 3)
+
+
+# Transactional, because the worker closes obsolete connections between jobs like a request does
+class JobQueueTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        for i in range(3):
+            Book.objects.create(title="Book %d" % i, author=author("Author123"), publicationYear=2000 + i, genre=genre("Test"))
+        Book.objects.create(title="Other", author=author("Author456"), publicationYear=1990, genre=genre("Drama"))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # run_worker needs a cache other processes see; the tests' in-memory one is only seen by this process
+        cache_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_directory.cleanup)
+        settings = override_settings(BOOKS_JOB_DIR=directory.name, CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_directory.name},
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        caches['default'].clear()
+
+    def enqueue(self, data, format='json'):
+        response = self.client.post(reverse('job-list'), data, format=format)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.data)
+        self.assertEqual(response['Location'], response.data['url'])
+        self.assertEqual(response.data['status'], Job.QUEUED)
+        return response.data['id']
+
+    def run_worker(self):
+        stdout = StringIO()
+        call_command('run_worker', '--processes', '0', '--burst', stdout=stdout)
+        return stdout.getvalue()
+
+    def job(self, pk):
+        response = self.client.get(reverse('job-detail', kwargs={'pk': pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_export_job(self):
+        pk = self.enqueue({'kind': 'export_books', 'params': {'format': 'csv', 'genre': 'Test'}})
+        self.assertIn('Job %d succeeded.' % pk, self.run_worker())
+
+        job = self.job(pk)
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertEqual((job['processed'], job['total']), (3, 3))
+        self.assertEqual(job['result']['rows'], 3)
+        response = self.client.get(job['download'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], list(BookSerializer.Meta.fields))
+        self.assertEqual([row[1] for row in rows[1:]], ["Book 0", "Book 1", "Book 2"])
+
+    def test_import_job(self):
+        upload = tempfile.NamedTemporaryFile('w+b', suffix='.ndjson')
+        self.addCleanup(upload.close)
+        upload.write(b'{"title": "New", "author": "Author789", "publicationYear": 2020, "genre": "Test"}\n')
+        upload.write(b'{"title": "", "author": "Author789", "publicationYear": 2020, "genre": "Test"}\n')
+        upload.seek(0)
+        pk = self.enqueue({'kind': 'import_books', 'params': json.dumps({'chunk_size': 1}), 'file': upload}, format='multipart')
+        self.run_worker()
+
+        job = self.job(pk)
+        self.assertEqual(job['status'], Job.SUCCEEDED, job['error'])
+        self.assertEqual((job['result']['imported'], job['result']['skipped']), (1, 1))
+        self.assertEqual(len(job['result']['errors']), 1)
+        self.assertEqual(job['processed'], 2)
+        self.assertTrue(Book.objects.filter(title="New", author__name="Author789").exists())
+        self.assertEqual(os.listdir(jobs.job_dir()), [])  # The upload is removed once imported
+
+    def test_invalid_jobs_are_rejected(self):
+        response = self.client.post(reverse('job-list'), {'kind': 'import_books'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file', response.data)
+        response = self.client.post(reverse('job-list'), {'kind': 'export_books', 'params': {'format': 'xml'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('params', response.data)
+        self.assertFalse(Job.objects.exists())
+
+    def test_rebuild_job(self):
+        pk = self.enqueue({'kind': 'rebuild_book_stats'})
+        self.run_worker()
+        job = self.job(pk)
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertGreater(job['result']['groups'], 0)
+        self.assertIsNone(job['download'])
+        self.assertEqual(self.client.get(reverse('job-download', kwargs={'pk': pk})).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_failed_job_records_error(self):
+        job = jobs.enqueue(Job.IMPORT_BOOKS, {'file': 'missing.csv'}, self.user.pk)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertIn('Job %d failed.' % job.pk, self.run_worker())
+        job = self.job(job.pk)
+        self.assertEqual(job['status'], Job.FAILED)
+        self.assertTrue(job['error'].startswith('FileNotFoundError: '), job['error'])
+
+    def test_jobs_are_private(self):
+        other = User.objects.create_user(username='other', password='testpassword')
+        job = jobs.enqueue(Job.REBUILD_SEARCH_INDEX, user_id=other.pk)
+        self.assertEqual(self.client.get(reverse('job-list')).data['count'], 0)
+        mine = self.enqueue({'kind': 'compact_book_changes'})
+        response = self.client.get(reverse('job-list'))
+        self.assertEqual([item['id'] for item in response.data['results']], [mine])
+        self.assertEqual(response.data['count'], 1)  # Not a count cached before the job was queued
+        self.assertEqual(self.client.get(reverse('job-detail', kwargs={'pk': job.pk})).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_worker_refuses_a_cache_of_its_own(self):
+        job = jobs.enqueue(Job.REBUILD_BOOK_STATS)
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem, BOOKS_CACHE_SHARED=True):
+            with self.assertRaisesMessage(CommandError, 'Set REDIS_URL or DJANGO_CACHE_DIR'):
+                self.run_worker()
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.QUEUED)
+
+    def test_worker_runs_with_the_default_cache(self):
+        # settings.py without REDIS_URL or DJANGO_CACHE_DIR: the in-memory cache, and the API serves nothing cached
+        job = jobs.enqueue(Job.REBUILD_BOOK_STATS)
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem, BOOKS_CACHE_SHARED=False):
+            self.assertIn('Job %d succeeded.' % job.pk, self.run_worker())
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.SUCCEEDED)
+
+    def test_claim_takes_each_job_once(self):
+        first = jobs.enqueue(Job.REBUILD_SEARCH_INDEX)
+        second = jobs.enqueue(Job.REBUILD_BOOK_STATS)
+        self.assertEqual(jobs.claim('a'), first.pk)
+        self.assertEqual(jobs.claim('b'), second.pk)
+        self.assertIsNone(jobs.claim('a'))
+        self.assertEqual(Job.objects.get(pk=second.pk).worker, 'b')
+
+    def test_jobs_of_stopped_workers_fail(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()  # Its pid now belongs to no process
+        job = jobs.enqueue(Job.REBUILD_SEARCH_INDEX)
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, worker='%s:%d' % (socket.gethostname(), process.pid))
+        stderr = StringIO()
+        call_command('run_worker', '--processes', '0', '--burst', stdout=StringIO(), stderr=stderr)
+        self.assertIn('Marked 1 job(s)', stderr.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
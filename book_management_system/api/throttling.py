@@ -0,0 +1,110 @@
+"""
+Token-bucket rate limiting per user and route, for every DRF view and the async book views.
+
+Each (route, client) pair has a bucket that holds up to N tokens and refills at N per period, for a
+BOOKS_THROTTLE_RATES entry of 'N/period' (period: s, min, h or day). Routes are URL names, with 'default'
+for the routes that have no entry of their own; None turns throttling off for a route. Clients are the
+JWT user, or the address for anonymous requests such as the token endpoint. A request takes one token,
+or what its view's throttle_cost(request) returns: book list pages cost one token per
+BOOKS_THROTTLE_ROWS_PER_TOKEN rows, so a client asking for page_size=1000 runs dry ten times sooner. A
+request that finds too few tokens gets 429 with Retry-After.
+
+Buckets live in the BOOKS_THROTTLE_CACHE_ALIAS cache and expire once they would be full again:
+
+- Redis (REDIS_URL): a Lua script refills and takes in one atomic step on the server's clock, so every
+  worker shares the same buckets exactly.
+- Other backends: read and write under a process lock. Exact for the per-process memory cache (each
+  worker then limits on its own); with another shared cache, racing workers can let a few extra requests
+  through.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+TAKE_SCRIPT = """
+local capacity, rate, cost, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], ttl)
+return {allowed, tostring(tokens)}
+"""
+
+_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'BOOKS_THROTTLE_CACHE_ALIAS', 'default')]
+
+
+def parse_rate(rate):
+    # '120/min' -> (120, 60)
+    count, period = rate.split('/')
+    return int(count), PERIODS[period.strip()[0]]
+
+
+def get_rate(route):
+    rates = getattr(settings, 'BOOKS_THROTTLE_RATES', {})
+    rate = rates[route] if route in rates else rates.get('default')
+    return None if rate is None else parse_rate(rate)
+
+
+def rows_cost(rows):
+    return max(1, math.ceil(rows / getattr(settings, 'BOOKS_THROTTLE_ROWS_PER_TOKEN', 100)))
+
+
+def take(key, capacity, rate, cost):
+    """
+    Takes cost tokens from the bucket at key if it has them. Returns (allowed, seconds until it would have).
+    """
+    ttl = capacity / rate  # Untouched for this long, a bucket is full, which is what a missing key means
+    cache = get_cache()
+    if isinstance(cache, RedisCache):
+        client = cache._cache.get_client(key, write=True)
+        allowed, tokens = client.eval(TAKE_SCRIPT, 1, cache.make_and_validate_key(key), capacity, rate, cost,
+                                      math.ceil(ttl * 1000))
+        allowed, tokens = bool(allowed), float(tokens)
+    else:
+        with _lock:
+            now = time.time()  # Wall clock: other processes may share the bucket
+            tokens, at = cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0, now - at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            cache.set(key, (tokens, now), math.ceil(ttl))
+    return allowed, 0 if allowed else (cost - tokens) / rate
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        match = request.resolver_match
+        route = match.url_name if match else None
+        rate = get_rate(route)
+        if rate is None:
+            return True
+        capacity, period = rate
+        cost = view.throttle_cost(request) if hasattr(view, 'throttle_cost') else 1
+        user = getattr(request, 'user', None)
+        client = 'user:%s' % user.pk if user is not None and user.is_authenticated else 'addr:%s' % self.get_ident(request)
+        allowed, self.wait_seconds = take('throttle:%s:%s' % (route, client), capacity, capacity / period,
+                                          min(cost, capacity))  # A request costing more than a full bucket could never pass
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,11 +1,31 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from . import views
+from . import async_views, views
+
+if getattr(settings, 'BOOKS_ASYNC_VIEWS', False):
+    BookCView, BookRUDView = async_views.AsyncBookCView, async_views.AsyncBookRUDView
+else:
+    BookCView, BookRUDView = views.BookCView, views.BookRUDView
 
 urlpatterns = [
-    path('books/', views.BookCView.as_view(), name='book-c'),               # POST: Add a new book
-    path('books/<int:pk>/', views.BookRUDView.as_view(), name='book-rud'),  # GET, PUT, DELETE by ID
+    path('authors/', views.AuthorListView.as_view(), name='author-list'),  # GET: Authors with at least one book
+    path('books/', BookCView.as_view(), name='book-c'),                     # POST: Add a new book
+    path('books/batch/', views.BookBatchView.as_view(), name='book-batch'),  # POST: Fetch many books by ID
+    path('books/bulk/', views.BookBulkView.as_view(), name='book-bulk'),  # POST: Create/update many, DELETE: Delete many
+    path('books/changes/', views.BookChangesView.as_view(), name='book-changes'),  # GET: Book writes since a cursor, for mirrors
+    path('books/export/', views.BookExportView.as_view(), name='book-export'),  # GET: Stream all books as NDJSON/CSV
+    path('books/search/', views.BookSearchView.as_view(), name='book-search'),  # GET: Ranked full-text search
+    path('books/stats/', views.BookStatsView.as_view(), name='book-stats'),  # GET: Book counts per genre, author and decade
+    path('books/<int:pk>/', BookRUDView.as_view(), name='book-rud'),        # GET, PUT, DELETE by ID
+    path('cache/stats/', views.CacheStatsView.as_view(), name='cache-stats'),  # GET: Response cache hit/miss counters
+    path('genres/', views.GenreListView.as_view(), name='genre-list'),     # GET: Genres with at least one book
+    path('health/', views.HealthView.as_view(), name='health'),            # GET: Liveness probe, no auth
+    path('jobs/', views.JobListView.as_view(), name='job-list'),          # GET: Your jobs, POST: Queue a background job
+    path('jobs/<int:pk>/', views.JobDetailView.as_view(), name='job-detail'),  # GET: Job status and progress
+    path('jobs/<int:pk>/download/', views.JobDownloadView.as_view(), name='job-download'),  # GET: File of a finished export
+    path('ready/', views.ReadinessView.as_view(), name='ready'),           # GET: Readiness probe (database + cache), no auth
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
\ No newline at end of file
@@ -1,28 +1,601 @@
-from rest_framework import generics
-from rest_framework.pagination import PageNumberPagination
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.permissions import IsAuthenticated
+import base64
+import binascii
+import hashlib
+import json
+import os
 
-from .models import Book
-from .serializers import BookSerializer
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Page
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.translation import gettext as _
+from rest_framework import filters, generics, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination, replace_query_param
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny, IsAuthenticated
+
+from . import cache, changes, counts, jobs, search, stats, throttling
+from .conditional import ConditionalDetailMixin, ConditionalListMixin
+from .filters import BookFilterBackend
+from .models import Author, Book, Genre, Job
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .serializers import (
+    AuthorSerializer, BookChangesQuerySerializer, BookFastSerializer, BookIdsSerializer, BookListSerializer, BookSerializer, GenreSerializer,
+    JobCreateSerializer, JobSerializer, resolve_names,
+)
 
 
 class BooksPagination(PageNumberPagination):
+    """
+    Page number pagination whose `count` comes from api/counts.py instead of a COUNT(*) per page. The
+    ?count= query parameter (default BOOKS_PAGINATION_COUNT) picks it:
+
+    - exact (or true): the exact count, cached until the next Book write
+    - estimate: the database's row estimate where it has one, with count_is_estimate telling which
+    - false: no count; the page is fetched with one extra row to tell whether there is a next page
+
+    Pages past the end are found by coming back empty, not by comparing against the count, so an
+    estimate never hides or invents pages. ?page=last needs the exact count in every mode.
+    """
     page_size = 10  # Number of items per page
     page_size_query_param = 'page_size'
-    max_page_size = 1000 
+    max_page_size = 1000
+    count_query_param = 'count'
+    count_modes = {'exact': 'exact', 'true': 'exact', 'estimate': 'estimate', 'false': None}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.start(queryset, request):
+            return None
+        self.count, self.count_is_estimate = self.get_count(queryset)
+        return self.set_page(queryset, list(self.get_page_queryset(queryset)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Async twin of paginate_queryset() for async_views.py: the counts read the cache and run raw SQL,
+        # so they take a thread hop, and the page rows come through the async ORM
+        if not await sync_to_async(self.start)(queryset, request):
+            return None
+        self.count, self.count_is_estimate = await sync_to_async(self.get_count)(queryset)
+        return self.set_page(queryset, [book async for book in self.get_page_queryset(queryset)])
+
+    def start(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return False
+        mode = request.query_params.get(self.count_query_param, getattr(settings, 'BOOKS_PAGINATION_COUNT', 'exact'))
+        if mode not in self.count_modes:
+            raise ValidationError({self.count_query_param: 'Must be one of: %s.' % ', '.join(self.count_modes)})
+        self.count_mode = self.count_modes[mode]
+
+        page_number = request.query_params.get(self.page_query_param) or 1
+        self.exact_count = None
+        if page_number in self.last_page_strings:
+            self.exact_count = counts.exact(queryset)
+            self.number = max(1, -(-self.exact_count // self.page_size))
+            return True
+        try:
+            self.number = int(page_number)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=_('That page number is not an integer'),
+            ))
+        if self.number < 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=_('That page number is less than 1'),
+            ))
+        return True
+
+    def get_count(self, queryset):
+        # (count, is_estimate), or (None, False) when the count was turned off
+        if self.count_mode is None:
+            return None, False
+        if self.exact_count is not None:
+            return self.exact_count, False
+        if self.count_mode == 'estimate':
+            return counts.estimate(queryset)
+        return counts.exact(queryset), False
+
+    def get_page_queryset(self, queryset):
+        # One extra row tells whether there is a next page without counting
+        bottom = (self.number - 1) * self.page_size
+        return queryset[bottom:bottom + self.page_size + 1]
+
+    def set_page(self, queryset, rows):
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not rows and self.number > 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=self.number, message=_('That page contains no results'),
+            ))
+        # The Page drives the next/previous links and the browsable API's page controls. Its paginator
+        # gets the exact count when there is one, otherwise just enough rows to agree with has_next.
+        paginator = self.django_paginator_class(queryset, self.page_size)
+        exact = self.count if self.count is not None and not self.count_is_estimate else self.exact_count
+        seen = (self.number - 1) * self.page_size + len(rows)
+        paginator.count = exact if exact is not None else seen + has_next  # Pre-fills the cached property
+        self.page = Page(rows, self.number, paginator)
+        self.display_page_controls = self.template is not None and exact is not None and paginator.num_pages > 1
+        return rows
+
+    def get_paginated_response(self, data):
+        response = {}
+        if self.count is not None:
+            response.update(count=self.count, count_is_estimate=self.count_is_estimate)
+        response.update(next=self.get_next_link(), previous=self.get_previous_link(), results=data)
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_estimate'] = {'type': 'boolean', 'example': False}
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [{
+            'name': self.count_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'How to count the results: exact, estimate or false.',
+            'schema': {'type': 'string', 'enum': list(self.count_modes)},
+        }]
+
+
+# Keyset pagination over (title, author name, id). Seeks straight to the cursor position with a range on the
+# leading title column of book_title_author_id_idx instead of COUNT(*) + OFFSET, so every page costs the
+# same. Pages are rows of the BookCView fast path, which carry the author name as author__name.
+class BooksCursorPagination(BasePagination):
+    page_size = BooksPagination.page_size
+    page_size_query_param = BooksPagination.page_size_query_param
+    max_page_size = BooksPagination.max_page_size
+    cursor_query_param = 'cursor'
+    ordering = ('title', 'author__name', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([book async for book in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+        if filters.OrderingFilter.ordering_param in request.query_params:
+            raise ValidationError({'ordering': 'Cursor pagination always orders by title, author and id.'})
+
+        if self.reverse:
+            queryset = queryset.order_by(*('-' + field for field in self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self.seek_filter(self.position, self.reverse))
+
+        # Fetch one extra row to find out whether there is anything beyond this page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        # A page reached by going backwards always has a following page, and vice versa
+        self.has_next = has_more if not self.reverse else self.position is not None
+        self.has_previous = has_more if self.reverse else self.position is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def seek_filter(self, position, reverse):
+        # (title, author, id) > (t, a, i), written so the leading title bound can drive an index range scan
+        title, author, pk = position
+        op = 'lt' if reverse else 'gt'
+        return Q(**{'title__%se' % op: title}) & (
+            Q(**{'title__' + op: title}) |
+            Q(title=title, **{'author__name__' + op: author}) |
+            Q(title=title, author__name=author, **{'id__' + op: pk})
+        )
+
+    def encode_cursor(self, book, reverse):
+        payload = {'p': [getattr(book, field) for field in self.ordering]}
+        if reverse:
+            payload['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False  # An empty cursor starts at the first page
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            title, author, pk = payload['p']
+            if not isinstance(title, str) or not isinstance(author, str) or not isinstance(pk, int):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return (title, author, pk), bool(payload.get('r'))
+
+# Batch get: one WHERE id IN (...) query for a list of ids, through the same fast path as the book list.
+# Results come back in request order, and ids with no book are listed under "missing".
+def batch_ids(data):
+    serializer = BookIdsSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data['ids']
+
+
+def batch_queryset(ids):
+    return Book.objects.filter(pk__in=ids).order_by().values_list(*BookFastSerializer.columns, named=True)
+
+
+def batch_result(ids, rows):
+    found = {row.id: row for row in rows}
+    return {
+        'results': BookFastSerializer([found[pk] for pk in ids if pk in found], many=True).data,
+        'missing': [pk for pk in ids if pk not in found],
+    }
+
+
+def list_cost(request):
+    # Throttle tokens for a book list request (see throttling.py): larger pages cost more
+    if request.method not in BookCView.fast_path_methods:
+        return 1
+    if 'ids' in request.query_params:
+        return throttling.rows_cost(min(len(request.query_params['ids'].split(',')), BookIdsSerializer.max_ids))
+    return throttling.rows_cost(BooksPagination().get_page_size(request))
+
 
 # Book Create view (the C in CRUD)
-class BookCView(generics.ListCreateAPIView):
-    queryset = Book.objects.all()
+class BookCView(ConditionalListMixin, cache.CachedResponseMixin, generics.ListCreateAPIView):
+    queryset = Book.objects.select_related('author', 'genre')
     serializer_class = BookSerializer
     pagination_class = BooksPagination
-    authentication_classes = [JWTAuthentication]
+    cursor_pagination_class = BooksCursorPagination  # Opt in with ?cursor= (empty for the first page)
+    filter_backends = [BookFilterBackend, filters.OrderingFilter]
+    ordering_fields = ['id', 'title', 'author', 'publicationYear', 'genre']  # Whitelist for ?ordering=
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    fast_path_methods = ('GET', 'HEAD')  # Reads skip model instances and BookSerializer (see BookFastSerializer)
+    throttle_cost = staticmethod(list_cost)
+
+    def get_serializer_class(self):
+        if self.request.method in self.fast_path_methods:
+            return BookFastSerializer
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in self.fast_path_methods:
+            queryset = queryset.values_list(*BookFastSerializer.columns, named=True)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # ?ids=1,2,3 fetches those books instead of a page; other list parameters do not apply
+        if 'ids' in request.query_params:
+            ids = batch_ids({'ids': request.query_params['ids'].split(',')})
+            return Response(batch_result(ids, batch_queryset(ids)))
+        return super().list(request, *args, **kwargs)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.cursor_pagination_class.cursor_query_param in self.request.query_params:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
 # Book Read, Update, Delete view (RUD in CRUD)
-class BookRUDView(generics.RetrieveUpdateDestroyAPIView):
+class BookRUDView(ConditionalDetailMixin, cache.CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Book.objects.select_related('author', 'genre')
+    serializer_class = BookSerializer
+    permission_classes = [IsAuthenticated]
+
+# Ranked full-text search over title, author and genre, served from the search index (see search.py)
+class BookSearchView(generics.ListAPIView):
+    serializer_class = BookSerializer
+    pagination_class = BooksPagination
+    filter_backends = []
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '')
+        if not query.strip():
+            raise ValidationError({'q': 'This query parameter is required.'})
+        return search.search_books(query)
+
+# Batch get for lists of ids too long for ?ids= on the book list: POST {"ids": [...]}. Results are memoized
+# until the next Book write, like the response cache does for GET.
+class BookBatchView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    serializer_class = BookIdsSerializer
+
+    def post(self, request, *args, **kwargs):
+        ids = batch_ids(request.data)
+        key = 'batch:%s' % hashlib.sha1(','.join(map(str, ids)).encode()).hexdigest()
+        return Response(cache.memoize(key, lambda: batch_result(ids, batch_queryset(ids))))
+
+# Batch create/update (POST) and delete (DELETE) of up to BookListSerializer.max_items books per request.
+# All writes share one transaction and use bulk_create/bulk_update; results line up with the request items.
+class BookBulkView(generics.GenericAPIView):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
-    authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)  # Only raised for a malformed batch; item errors are collected
+        items = serializer.validated_data
+        results = [{'status': status.HTTP_400_BAD_REQUEST, 'errors': errors} if errors else None
+                   for errors in serializer.item_errors]
+
+        with transaction.atomic():
+            resolve_names(items)
+            update_ids = [item['id'] for item in items if item is not None and 'id' in item]
+            existing = self.get_queryset().select_for_update().in_bulk(update_ids)
+            to_create, to_update = [], {}
+            for index, item in enumerate(items):
+                if item is None:
+                    continue
+                fields = {name: value for name, value in item.items() if name != 'id'}
+                if 'id' not in item:
+                    to_create.append((index, Book(**fields)))
+                elif item['id'] not in existing:
+                    results[index] = {'status': status.HTTP_404_NOT_FOUND, 'errors': {'id': ['Book not found.']}}
+                else:
+                    book = existing[item['id']]
+                    for name, value in fields.items():
+                        setattr(book, name, value)
+                    to_update[index] = book
+
+            Book.objects.bulk_create([book for _, book in to_create])
+            Book.objects.bulk_update(list({book.pk: book for book in to_update.values()}.values()),
+                                     ['title', 'author', 'publicationYear', 'genre'])
+
+        for index, book in to_create:
+            results[index] = {'status': status.HTTP_201_CREATED, 'data': BookSerializer(book).data}
+        for index, book in to_update.items():
+            results[index] = {'status': status.HTTP_200_OK, 'data': BookSerializer(book).data}
+        return self.bulk_response(results, created=len(to_create), updated=len(to_update))
+
+    def delete(self, request, *args, **kwargs):
+        ids = request.data
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise ValidationError({'non_field_errors': ['Expected a non-empty list of book ids.']})
+        if len(ids) > BookListSerializer.max_items:
+            raise ValidationError(
+                {'non_field_errors': ['A batch cannot contain more than %d books.' % BookListSerializer.max_items]}
+            )
+
+        with transaction.atomic():
+            found = set(self.get_queryset().filter(pk__in=ids).values_list('pk', flat=True))
+            self.get_queryset().filter(pk__in=found).delete()
+
+        results = [{'id': pk, 'status': status.HTTP_204_NO_CONTENT} if pk in found else
+                   {'id': pk, 'status': status.HTTP_404_NOT_FOUND, 'errors': {'id': ['Book not found.']}}
+                   for pk in ids]
+        return self.bulk_response(results, deleted=len(found))
+
+    def bulk_response(self, results, **counts):
+        failed = sum(1 for result in results if 'errors' in result)
+        if not failed:
+            code = status.HTTP_200_OK
+        elif failed == len(results):
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_207_MULTI_STATUS  # Partial success
+        return Response({**counts, 'failed': failed, 'results': results}, status=code)
+
+async def aiterate(iterator):
+    # Under ASGI, Django reads a sync iterator into a list before sending any of it. Pulling one chunk at a time
+    # through sync_to_async streams it instead, in the request's sync thread, where the database cursor lives.
+    done = object()
+    pull = sync_to_async(next)
+    while True:
+        chunk = await pull(iterator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+# Streams the whole catalogue (or a filtered part of it) as NDJSON or CSV, chosen with ?format= or the
+# Accept header. Rows come straight from a chunked values_list() cursor, so no Book instances or serializers
+# are built and memory use stays flat regardless of table size, under WSGI and ASGI alike.
+class BookExportView(generics.GenericAPIView):
+    queryset = Book.objects.all()
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    filter_backends = [BookFilterBackend]
+    permission_classes = [IsAuthenticated]
+    fields = BookSerializer.Meta.fields
+    columns = BookFastSerializer.columns  # The author and genre names, joined in
+    chunk_size = 2000  # Rows fetched from the database cursor per round-trip
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        rows = self.filter_queryset(self.get_queryset()).order_by('id').values_list(*self.columns).iterator(
+            chunk_size=self.chunk_size
+        )
+        content = renderer.stream(self.fields, rows)
+        if isinstance(request._request, ASGIRequest):
+            content = aiterate(content)
+        response = StreamingHttpResponse(content, content_type=renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="books.%s"' % renderer.format
+        return response
+
+# Change feed for mirrors (see changes.py): the Book writes after ?since=<cursor>, oldest first, each with the
+# book's current state. Seeks on the change id, so every page costs the same however long the log grows.
+# Not response-cached; mirrors poll it with a new cursor each time.
+class BookChangesView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    serializer_class = BookChangesQuerySerializer
+
+    def get(self, request, *args, **kwargs):
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        entries, cursor, has_more = changes.read(**params.validated_data)
+        return Response({
+            'results': entries,
+            'cursor': cursor,
+            'has_more': has_more,
+            'next': replace_query_param(request.build_absolute_uri(), 'since', cursor) if has_more else None,
+        })
+
+# Books per genre, author and decade from the materialized BookStat table (see stats.py), memoized until the
+# next Book write. Costs one query over the groups and one per lookup table for the genre and author names,
+# however many books there are.
+class BookStatsView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache.memoize('stats', stats.summary))
+
+# Authors and genres that have at least one book, by name. Rows left without books by a rename or delete are
+# skipped with an EXISTS probe on the leading column of book_author_title_idx / book_genre_year_idx.
+# Cached like the book list, since only Book, Author and Genre writes change them.
+class AuthorListView(cache.CachedResponseMixin, generics.ListAPIView):
+    queryset = Author.objects.filter(Exists(Book.objects.filter(author=OuterRef('pk'))))
+    serializer_class = AuthorSerializer
+    pagination_class = BooksPagination
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+
+class GenreListView(cache.CachedResponseMixin, generics.ListAPIView):
+    queryset = Genre.objects.filter(Exists(Book.objects.filter(genre=OuterRef('pk'))))
+    serializer_class = GenreSerializer
+    pagination_class = BooksPagination
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+# Plain COUNT(*) per page: BooksPagination's counts are cached until the next Book write, which queueing or
+# finishing a job is not
+class JobsPagination(PageNumberPagination):
+    page_size = BooksPagination.page_size
+    page_size_query_param = BooksPagination.page_size_query_param
+    max_page_size = BooksPagination.max_page_size
+
+
+# Background jobs (see jobs.py). POST queues a job and answers 202 with its status URL; `manage.py run_worker`
+# runs it. An import uploads its file as multipart form data, with the params as a JSON string field. Users only
+# see their own jobs.
+class JobListView(generics.ListCreateAPIView):
+    serializer_class = JobSerializer
+    pagination_class = JobsPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(created_by_id=self.request.user.pk).order_by('-id')
+
+    def create(self, request, *args, **kwargs):
+        serializer = JobCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        job = jobs.enqueue(data['kind'], data['params'], request.user.pk, upload=data.get('file'))
+        data = self.get_serializer(job).data
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['url']})
+
+
+class JobDetailView(generics.RetrieveAPIView):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(created_by_id=self.request.user.pk)
+
+
+# The file written by a finished export job
+class JobDownloadView(JobDetailView):
+    def get(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.kind != Job.EXPORT_BOOKS or job.status != Job.SUCCEEDED:
+            raise NotFound('This job has no file to download.')
+        name = job.result['file']
+        try:
+            return FileResponse(open(jobs.job_path(name), 'rb'), as_attachment=True,
+                                filename='books' + os.path.splitext(name)[1])
+        except FileNotFoundError:
+            raise NotFound('The export file was removed.')
+
+# Response cache hit/miss counters, shared by every worker using the same cache backend
+class CacheStatsView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache.stats())
+
+# Liveness probe: the process is up and serving requests. Never touches the database.
+class HealthView(generics.GenericAPIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'status': 'ok'})
+
+# Readiness probe: every configured database and the cache answer, so the instance can take traffic
+class ReadinessView(generics.GenericAPIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        checks = {}
+        for alias in connections:
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                checks['database:' + alias] = 'ok'
+            except Exception as exc:
+                checks['database:' + alias] = 'error: %s' % exc
+        try:
+            cache.get_cache().get('books:readiness')
+            checks['cache'] = 'ok'
+        except Exception as exc:
+            checks['cache'] = 'error: %s' % exc
+
+        ready = all(result == 'ok' for result in checks.values())
+        return Response(
+            {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+            status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
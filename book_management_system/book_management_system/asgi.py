@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'book_management_system.settings')
+# ASGI profile in settings.py: async views, and no WhiteNoise middleware, which is sync-only
+os.environ.setdefault('SERVER_MODE', 'asgi')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.staticfiles import StaticFilesApplication  # noqa: E402  Needs the settings loaded
+
+# Static and admin assets are served by WhiteNoise in front of Django, in place of its middleware
+application = StaticFilesApplication(django_application)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -30,6 +31,8 @@ ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
 ]
+# Extra hostnames for deployments, comma separated (e.g. DJANGO_ALLOWED_HOSTS=books.example.com,10.0.0.5)
+ALLOWED_HOSTS += [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
 
 
 # Application definition
@@ -48,17 +51,56 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Skips the auth_user lookup on read requests (see api/authentication.py).
+        # Use 'rest_framework_simplejwt.authentication.JWTAuthentication' to load the user on every request.
+        'api.authentication.StatelessJWTAuthentication',
     ],
+    'DEFAULT_THROTTLE_CLASSES': ['api.throttling.TokenBucketThrottle'],
 }
 
+# Token buckets per user and route (see api/throttling.py): URL name -> 'N/period', 'default' for the other
+# routes, None for no limit. Book list pages take one token per BOOKS_THROTTLE_ROWS_PER_TOKEN rows.
+BOOKS_THROTTLE_RATES = {
+    'default': '600/min',
+    'book-c': '300/min',
+    'token_obtain_pair': '30/min',  # Each one hashes a password
+    'health': None,
+    'ready': None,
+}
+BOOKS_THROTTLE_ROWS_PER_TOKEN = 100
+BOOKS_THROTTLE_CACHE_ALIAS = 'default'  # Shared by every worker when REDIS_URL is set
+
+# Identical concurrent reads wait for one computation and share it (see api/coalescing.py)
+BOOKS_COALESCE_READS = True
+
+# Seconds the active status of a token's user is cached by StatelessJWTAuthentication.
+# 0 checks the database on every read, None trusts the token until it expires.
+BOOKS_AUTH_ACTIVE_TTL = 60
+
+# Serve /api/books/ and /api/books/<id>/ with the async views in api/async_views.py.
+# On by default when running under ASGI (SERVER_MODE=asgi, see gunicorn.conf.py).
+BOOKS_ASYNC_VIEWS = os.environ.get(
+    'BOOKS_ASYNC_VIEWS', '1' if os.environ.get('SERVER_MODE') == 'asgi' else '0'
+) == '1'
+
+# URL names MetricsMiddleware records metrics for, and the optional slow-request log threshold in
+# milliseconds (unset disables the log)
+BOOKS_METRICS_ROUTES = ['book-c', 'book-rud', 'token_obtain_pair', 'token_refresh']
+BOOKS_SLOW_REQUEST_MS = int(os.environ['BOOKS_SLOW_REQUEST_MS']) if os.environ.get('BOOKS_SLOW_REQUEST_MS') else None
+# Directory the worker processes write their metrics to, added up by /metrics (see api/metrics.py). Set by
+# gunicorn.conf.py; unset, /metrics shows the metrics of the process that answers it.
+BOOKS_METRICS_DIR = os.environ.get('BOOKS_METRICS_DIR') or None
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',                # Request metrics for /metrics, see api/metrics.py
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',  # Serves static/admin assets from the app server, see STORAGES
+    'api.routers.ReplicaRoutingMiddleware',        # Sends safe-method requests to a read replica, see DATABASES
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,6 +108,12 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+# Every other middleware is async capable. WhiteNoise's is not, and under ASGI it would make Django run each
+# request, async views included, in a thread held until the response is done. asgi.py serves static files
+# through WhiteNoise in front of Django instead, see api/staticfiles.py (it sets SERVER_MODE=asgi when the
+# server has not).
+if os.environ.get('SERVER_MODE') == 'asgi':
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
 
 ROOT_URLCONF = 'book_management_system.urls'
 
@@ -91,13 +139,129 @@ WSGI_APPLICATION = 'book_management_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Connections are kept open for DJANGO_CONN_MAX_AGE seconds and checked before reuse. Under ASGI the
+# default is 0: async requests hop between threads, so persistent connections would pile up.
+CONN_MAX_AGE = int(os.environ.get('DJANGO_CONN_MAX_AGE', 0 if os.environ.get('SERVER_MODE') == 'asgi' else 60))
+
+# SQLite tuned for several workers reading and writing at once (api/db_backends/sqlite3 adds
+# init_command and transaction_mode to Django 4.2's backend):
+# - WAL lets readers run alongside the writer; synchronous=NORMAL is durable across crashes in WAL mode
+# - busy_timeout makes a writer wait up to 5 s for the lock instead of failing with "database is locked"
+# - 64 MB page cache and 256 MB memory-mapped reads per connection
+# - IMMEDIATE transactions take the write lock up front, so waiting for it goes through busy_timeout
+SQLITE_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode = WAL; PRAGMA synchronous = NORMAL; PRAGMA busy_timeout = 5000; '
+        'PRAGMA cache_size = -65536; PRAGMA mmap_size = 268435456; PRAGMA temp_store = MEMORY'
+    ),
+    'transaction_mode': 'IMMEDIATE',
 }
 
+if os.environ.get('DJANGO_DB_ENGINE') == 'postgresql':
+    # Needs psycopg2 or psycopg. Set POSTGRES_POOLER=1 when connecting through PgBouncer in transaction
+    # pooling mode: server-side cursors do not survive it. With a pooler in front, each worker's persistent
+    # connection is cheap and the pooler caps the connections PostgreSQL actually sees.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'books'),
+            'USER': os.environ.get('POSTGRES_USER', 'books'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_POOLER') == '1',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'api.db_backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': SQLITE_OPTIONS,
+        }
+    }
+
+# Read replicas (see api/routers.py). DJANGO_DB_REPLICAS lists SQLite files that stand in for replicas
+# locally, comma separated; `manage.py sync_replicas` copies the primary into them. In production, add
+# the real replicas to DATABASES and list their aliases in BOOKS_READ_REPLICAS.
+for index, name in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICAS', '').split(',')), start=1):
+    DATABASES['replica_%d' % index] = {
+        'ENGINE': 'api.db_backends.sqlite3',
+        'NAME': name.strip(),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': SQLITE_OPTIONS,
+        'TEST': {'MIRROR': 'default'},  # Tests read the test database through the replica alias
+    }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+BOOKS_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+BOOKS_REPLICA_SELECTION = os.environ.get('BOOKS_REPLICA_SELECTION', 'round_robin')  # Or 'health'
+BOOKS_REPLICA_HEALTH_INTERVAL = 5  # Seconds between SELECT 1 checks of a replica with 'health' selection
+BOOKS_REPLICA_PIN_SECONDS = 5      # Read-your-writes: a client's reads stay on the primary this long after a write
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Per-process memory cache by default. To share one cache between processes (the web server's workers, the job
+# worker and management commands), which the book response cache needs to invalidate consistently, set REDIS_URL
+# (e.g. redis://localhost:6379/0), or DJANGO_CACHE_DIR to a directory for a file cache shared on one host.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Book list/detail response cache (see api/cache.py). A timeout of 0 disables it.
+BOOKS_CACHE_ALIAS = 'default'
+BOOKS_CACHE_TIMEOUT = int(os.environ.get('BOOKS_CACHE_TIMEOUT', 300))
+# Whether every process writing or serving books sees the same cache. The response cache, the list
+# ETag/Last-Modified and the memoized counts and stats hang off one invalidation counter kept in it, so they are
+# switched off when a write in another process (another worker, run_worker, import_books) could not reach it.
+# Defaults to true with REDIS_URL or DJANGO_CACHE_DIR. Setting it with the memory cache is only safe when one
+# process serves the API and nothing else writes books.
+BOOKS_CACHE_SHARED = os.environ.get(
+    'BOOKS_CACHE_SHARED', '0' if CACHES['default']['BACKEND'].endswith('LocMemCache') else '1',
+) == '1'
+
+# The book list's `count` field (see api/counts.py): 'exact' (cached until the next write), 'estimate'
+# (from database statistics) or 'false' (omitted). Clients can pick per request with ?count=.
+BOOKS_PAGINATION_COUNT = os.environ.get('BOOKS_PAGINATION_COUNT', 'exact')
+BOOKS_COUNT_CACHE_TIMEOUT = 300
+BOOKS_COUNT_ESTIMATE_THRESHOLD = 1000  # Smaller estimates are replaced by an exact count
+
+# The change feed (see api/changes.py) holds back entries this many seconds old or younger, so that ids committed
+# out of order by concurrent PostgreSQL transactions are not skipped. SQLite commits one writer at a time.
+BOOKS_CHANGES_SETTLE_SECONDS = 5 if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql' else 0
+
+# Background jobs (see api/jobs.py), run by `manage.py run_worker`. Import uploads and export files are kept
+# in BOOKS_JOB_DIR, which the web and worker processes must share.
+BOOKS_JOB_DIR = os.environ.get('BOOKS_JOB_DIR', BASE_DIR / 'jobs')
+BOOKS_WORKER_PROCESSES = int(os.environ.get('BOOKS_WORKER_PROCESSES', 2))  # Jobs run at the same time per worker
+BOOKS_WORKER_POLL_INTERVAL = 1  # Seconds between looks at an empty queue
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -134,6 +298,23 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = os.environ.get('DJANGO_STATIC_ROOT', BASE_DIR / 'staticfiles')  # Filled by `manage.py collectstatic`
+
+# Collected files get pre-compressed gzip/brotli copies, which WhiteNoise serves straight from the app server.
+# With DJANGO_STATIC_MANIFEST=1, set by the Docker image once it has run collectstatic, they also get
+# content-hashed names served with far-future cache headers. That storage cannot render a page linking a
+# static file (the admin, the browsable API) without the manifest collectstatic writes, so it is opt-in.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'whitenoise.storage.CompressedManifestStaticFilesStorage' if os.environ.get('DJANGO_STATIC_MANIFEST') == '1'
+            else 'whitenoise.storage.CompressedStaticFilesStorage'
+        ),
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -0,0 +1,55 @@
+"""
+Gunicorn settings for serving the API in production. Gunicorn picks this file up automatically when
+started from this folder (`gunicorn`), and every setting can be overridden through the environment:
+
+- SERVER_MODE: `wsgi` (default, sync workers on wsgi.py) or `asgi` (uvicorn workers on asgi.py)
+- BIND: address to listen on (default 0.0.0.0:8000)
+- WEB_CONCURRENCY: worker processes (default: one per CPU core)
+- GUNICORN_THREADS: threads per sync worker (default 1)
+- GUNICORN_KEEPALIVE: seconds an idle keep-alive connection is held open (default 5)
+- GUNICORN_TIMEOUT: seconds before a silent worker is killed and restarted (default 30)
+- GUNICORN_GRACEFUL_TIMEOUT: seconds workers get to finish in-flight requests on restart (default 30)
+- GUNICORN_MAX_REQUESTS: recycle a worker after this many requests, 0 to never (default 10000)
+- REDIS_URL or DJANGO_CACHE_DIR: cache shared by the workers; without either, the API is served uncached
+- BOOKS_METRICS_DIR: directory the workers write their metrics to for /metrics (default: a new temporary
+  directory per server start)
+"""
+import multiprocessing
+import os
+import tempfile
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'book_management_system.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'book_management_system.wsgi:application'
+    worker_class = 'gthread' if env_int('GUNICORN_THREADS', 1) > 1 else 'sync'
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count())
+threads = env_int('GUNICORN_THREADS', 1)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+
+# Recycling workers bounds slow memory growth; the jitter keeps them from all restarting at once
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 10000)
+max_requests_jitter = max_requests // 10
+
+# Import Django once in the master so workers fork with the app already loaded
+preload_app = True
+
+# Every worker keeps its own metrics; with a directory to write them to, /metrics adds up all of them whichever
+# worker answers the scrape (see api/metrics.py). Set before the app is loaded, so settings.py and the
+# workers see it.
+if not os.environ.get('BOOKS_METRICS_DIR'):
+    os.environ['BOOKS_METRICS_DIR'] = tempfile.mkdtemp(prefix='books-metrics-')
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
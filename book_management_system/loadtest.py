@@ -0,0 +1,117 @@
+"""
+Load-test profile for the book API. Standard library only, so it runs anywhere Python does.
+
+Opens --concurrency keep-alive connections (spread over --processes client processes), replays a fixed
+request mix against a running server for --duration seconds, and reports throughput, latency percentiles
+and requests per second per server core:
+
+    python loadtest.py --url http://127.0.0.1:8000 --username bench --password bench --server-cores 4
+
+Seed some books first (e.g. with `manage.py import_books`) so the list and detail requests return data.
+"""
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+# (weight, path) pairs. Reads dominate, like production traffic
+DEFAULT_MIX = [
+    (6, '/api/books/'),
+    (2, '/api/books/?page=2&page_size=50'),
+    (2, '/api/books/1/'),
+]
+
+
+def get_token(url, username, password):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    body = json.dumps({'username': username, 'password': password})
+    connection.request('POST', '/api/token/', body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    if response.status != 200:
+        raise SystemExit('Could not obtain a token: %s' % data)
+    return data['access']
+
+
+def client(url, token, paths, deadline, results):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    headers = {'Authorization': 'Bearer %s' % token}
+    latencies, errors, index = [], 0, 0
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.append((latencies, errors))
+
+
+def process(args):
+    url, token, paths, threads, deadline = args
+    results = []
+    workers = [threading.Thread(target=client, args=(url, token, paths, deadline, results)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    latencies = [latency for thread_latencies, _ in results for latency in thread_latencies]
+    return latencies, sum(errors for _, errors in results)
+
+
+def percentile(ordered, fraction):
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=32, help='Open connections in total.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Client processes generating load.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run.')
+    parser.add_argument('--server-cores', type=int, default=os.cpu_count(), help='Cores the server runs on.')
+    parser.add_argument('--path', action='append', help='Request path; repeat to build your own mix.')
+    args = parser.parse_args()
+
+    paths = args.path or [path for weight, path in DEFAULT_MIX for _ in range(weight)]
+    token = get_token(args.url, args.username, args.password)
+    processes = max(1, min(args.processes, args.concurrency))
+    deadline = time.monotonic() + args.duration
+    jobs = [
+        (args.url, token, paths, args.concurrency // processes + (i < args.concurrency % processes), deadline)
+        for i in range(processes)
+    ]
+    with multiprocessing.Pool(processes) as pool:
+        outcomes = pool.map(process, jobs)
+
+    latencies = sorted(latency for process_latencies, _ in outcomes for latency in process_latencies)
+    errors = sum(errors for _, errors in outcomes)
+    rps = len(latencies) / args.duration
+    print('requests        %d (%d errors)' % (len(latencies), errors))
+    print('throughput      %.0f req/s' % rps)
+    print('per server core %.0f req/s (%d cores)' % (rps / args.server_cores, args.server_cores))
+    print('latency p50     %.2f ms' % (percentile(latencies, 0.50) * 1000))
+    print('latency p99     %.2f ms' % (percentile(latencies, 0.99) * 1000))
+
+
+if __name__ == '__main__':
+    main()